@@ -0,0 +1,134 @@
+"""
+Headless JSON API over the service layer, for other services and for scaling
+the tools independently of the Streamlit UI.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+    python api.py                      # same, with API_WORKERS (default: CPU count)
+
+    GET  /health
+    GET  /tools                        tool names and their parameters
+    POST /tools/{tool}                 body: the tool's inputs, e.g. {"income": 50000, "expenses": {"Rent": 15000}}
+    POST /chat                         body: {"message", "user_id"?, "session_id"?}
+    GET  /metrics                      per-stage latency histograms, Prometheus text format
+
+Each worker process has its own LLM client loop, rate table, metrics and in-memory cache
+tiers; the SQLite-backed caches, rate history and sessions are shared on disk.
+"""
+import inspect
+import json
+import os
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from chat_context import build_context, schedule_summary
+from fx_rates import RateUnavailableError
+from llm_async import LLMUnavailableError
+from metrics import render_prometheus
+from services import TOOLS, ConfigurationError, arun, bind_tool_inputs, chat_reply, json_default, summarize_chat_async
+from session_store import get_session_store
+from structured_output import StructuredOutputError
+
+
+class APIResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return json.dumps(content, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def error(status: int, message: str, headers: dict = None) -> APIResponse:
+    return APIResponse({"error": message}, status_code=status, headers=headers)
+
+
+async def read_json(request) -> dict | None:
+    try:
+        payload = await request.json()
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+async def run_safely(coro):
+    """Awaits a service coroutine, mapping service failures to (None, error response)."""
+    try:
+        return await arun(coro), None
+    except LLMUnavailableError as e:
+        return None, error(503, str(e), {"Retry-After": "30"})
+    except RateUnavailableError as e:
+        return None, error(503, str(e), {"Retry-After": "60"})
+    except StructuredOutputError as e:
+        return None, error(502, str(e))
+    except ConfigurationError as e:
+        return None, error(500, str(e))
+    except ValueError as e:
+        return None, error(400, str(e))
+
+
+async def health(request):
+    return APIResponse({"status": "ok"})
+
+
+async def metrics(request):
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def list_tools(request):
+    return APIResponse({name: list(inspect.signature(tool).parameters) for name, tool in TOOLS.items()})
+
+
+async def run_tool(request):
+    name = request.path_params["tool"]
+    if name not in TOOLS:
+        return error(404, f"Unknown tool '{name}'. Available: {', '.join(TOOLS)}")
+    payload = await read_json(request)
+    if payload is None:
+        return error(400, "The request body must be a JSON object of tool inputs.")
+    try:
+        bound = bind_tool_inputs(name, payload)
+    except TypeError as e:
+        return error(400, f"Invalid inputs for '{name}': {e}")
+    result, failure = await run_safely(TOOLS[name](*bound.args, **bound.kwargs))
+    return failure or APIResponse({"tool": name, "result": result})
+
+
+async def chat(request):
+    """One chat turn. With user_id or session_id the turn is stored and the reply uses the conversation's context."""
+    payload = await read_json(request)
+    if payload is None or not isinstance(payload.get("message"), str) or not payload["message"].strip():
+        return error(400, "The request body must be a JSON object with a non-empty 'message'.")
+    store = get_session_store()
+    session = None
+    if payload.get("session_id"):
+        session = store.get_chat(payload["session_id"], refresh=True)  # Another worker may have added turns.
+        if session is None:
+            return error(404, "Unknown session_id.")
+    elif payload.get("user_id"):
+        session = store.create_chat(str(payload["user_id"]))
+
+    context = build_context(session) if session else None
+    reply, failure = await run_safely(chat_reply(payload["message"], context))
+    if failure:
+        return failure
+    if session:
+        store.append_message(session.id, "user", payload["message"])
+        store.append_message(session.id, "assistant", reply)
+        if session.title == "New Chat":
+            store.rename(session.id, payload["message"][:40])
+        schedule_summary(session, store, summarize_chat_async)
+    return APIResponse({"reply": reply, "session_id": session.id if session else None})
+
+
+app = Starlette(routes=[
+    Route("/health", health),
+    Route("/metrics", metrics),
+    Route("/tools", list_tools),
+    Route("/tools/{tool}", run_tool, methods=["POST"]),
+    Route("/chat", chat, methods=["POST"]),
+])
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("api:app", host=os.getenv("API_HOST", "127.0.0.1"), port=int(os.getenv("API_PORT", "8000")),
+                workers=int(os.getenv("API_WORKERS", str(os.cpu_count() or 1))))
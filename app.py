@@ -1,25 +1,34 @@
 import streamlit as st
 import os
 import sys
-import json
+import csv
+import functools
 import re
-import google.generativeai as genai
-from dotenv import load_dotenv
 import time
-import pandas as pd
 from datetime import date, timedelta
-import plotly.express as px
+from streamlit.errors import StreamlitAPIException
 from streamlit_option_menu import option_menu
-import requests # Added for making API calls
+from fx_rates import RateUnavailableError
+from llm_cache import get_llm_cache
+from llm_async import LLMStream, LLMUnavailableError
+import metrics
+from metrics import span
+import services
+from services import (API_KEY, CURRENCIES, EXCHANGE_RATE_API_KEY, MATRIX_CURRENCIES, analyze_budget, analyze_text,
+                      build_expense_extraction_prompt, build_chatbot_prompt, build_nlu_prompt, build_transaction_categorization_prompt,
+                      convert_currency, convert_to_many, get_model, plan_investment, spending_insights, summarize_chat_async)
+from statements import (DATE_ORDER_AUTO, DATE_ORDER_DAY_FIRST, DATE_ORDER_MONTH_FIRST, StatementFormatError, StatementSummary,
+                        summarize_statement)
+from categorizer import get_categorizer
+from chat_context import build_context, schedule_summary
+from session_store import KIND_CHAT, KIND_TOOL, ChatSession, get_session_store, new_user_id
+from history_index import get_history_index
+from structured_output import StructuredOutputError
+from intent_classifier import ROUTE_CHAT, get_intent_classifier, log_nlu_label, nlu_route
 
 # --- 1. CONFIGURATION & SETUP ---
 
-# Load environment variables
-load_dotenv()
-API_KEY = os.getenv("GOOGLE_API_KEY")
-# You will need to get an API key from a service like ExchangeRate-API.com
-EXCHANGE_RATE_API_KEY = os.getenv("EXCHANGE_RATE_API_KEY")
-
+# Environment variables are loaded by the service layer
 if not API_KEY:
     st.error("🚫 Configuration Error: GOOGLE_API_KEY not found.")
     st.info("Please create a file named `.env` in the same directory and add the line: GOOGLE_API_KEY='your_api_key_here'")
@@ -30,264 +39,83 @@ if not EXCHANGE_RATE_API_KEY:
     st.info("Please create a file named `.env` and add the line: EXCHANGE_RATE_API_KEY='your_api_key_here' from a service like ExchangeRate-API.com.")
     st.stop()
 
-
-# Configure the Gemini API
-try:
-    genai.configure(api_key=API_KEY)
-    llm = genai.GenerativeModel('gemini-1.5-flash-latest')
-except Exception as e:
-    st.error(f"Failed to configure Gemini API: {e}")
-    st.stop()
-
-# Currency Data (as provided, no changes needed)
-CURRENCIES = {
-    'USD': 'United States Dollar', 'EUR': 'Euro', 'JPY': 'Japanese Yen', 'GBP': 'British Pound Sterling',
-    'AUD': 'Australian Dollar', 'CAD': 'Canadian Dollar', 'CHF': 'Swiss Franc', 'CNY': 'Chinese Yuan',
-    'SEK': 'Swedish Krona', 'NZD': 'New Zealand Dollar', 'MXN': 'Mexican Peso', 'SGD': 'Singapore Dollar',
-    'HKD': 'Hong Kong Dollar', 'NOK': 'Norwegian Krone', 'KRW': 'South Korean Won', 'TRY': 'Turkish Lira',
-    'RUB': 'Russian Ruble', 'INR': 'Indian Rupee', 'BRL': 'Brazilian Real', 'ZAR': 'South African Rand',
-    'AED': 'United Arab Emirates Dirham', 'AFN': 'Afghan Afghani', 'ALL': 'Albanian Lek', 'AMD': 'Armenian Dram',
-    'ANG': 'Netherlands Antillean Guilder', 'AOA': 'Angolan Kwanza', 'ARS': 'Argentine Peso',
-    'AWG': 'Aruban Florin', 'AZN': 'Azerbaijani Manat', 'BAM': 'Bosnia-Herzegovina Convertible Mark',
-    'BBD': 'Barbadian Dollar', 'BDT': 'Bangladeshi Taka', 'BGN': 'Bulgarian Lev', 'BHD': 'Bahraini Dinar',
-    'BIF': 'Burundian Franc', 'BMD': 'Bermudan Dollar', 'BND': 'Brunei Dollar', 'BOB': 'Bolivian Boliviano',
-    'BSD': 'Bahamian Dollar', 'BTN': 'Bhutanese Ngultrum', 'BWP': 'Botswanan Pula', 'BYN': 'Belarusian Ruble',
-    'BZD': 'Belize Dollar', 'CDF': 'Congolese Franc', 'CLP': 'Chilean Peso', 'COP': 'Colombian Peso',
-    'CRC': 'Costa Rican Colón', 'CUP': 'Cuban Peso', 'CVE': 'Cape Verdean Escudo', 'CZK': 'Czech Koruna',
-    'DJF': 'Djiboutian Franc', 'DKK': 'Danish Krone', 'DOP': 'Dominican Peso', 'DZD': 'Algerian Dinar',
-    'EGP': 'Egyptian Pound', 'ERN': 'Eritrean Nakfa', 'ETB': 'Ethiopian Birr', 'FJD': 'Fijian Dollar',
-    'FKP': 'Falkland Islands Pound', 'FOK': 'Faroese Króna', 'GEL': 'Georgian Lari', 'GGP': 'Guernsey Pound',
-    'GHS': 'Ghanaian Cedi', 'GIP': 'Gibraltar Pound', 'GMD': 'Gambian Dalasi', 'GNF': 'Guinean Franc',
-    'GTQ': 'Guatemalan Quetzal', 'GYD': 'Guyanaese Dollar', 'HNL': 'Honduran Lempira', 'HRK': 'Croatian Kuna',
-    'HTG': 'Haitian Gourde', 'HUF': 'Hungarian Forint', 'IDR': 'Indonesian Rupiah', 'ILS': 'Israeli New Shekel',
-    'IMP': 'Isle of Man Pound', 'IQD': 'Iraqi Dinar', 'IRR': 'Iranian Rial', 'ISK': 'Icelandic Króna',
-    'JEP': 'Jersey Pound', 'JMD': 'Jamaican Dollar', 'JOD': 'Jordanian Dinar', 'KES': 'Kenyan Shilling',
-    'KGS': 'Kyrgystani Som', 'KHR': 'Cambodian Riel', 'KID': 'Kiribati Dollar', 'KMF': 'Comorian Franc',
-    'KWD': 'Kuwaiti Dinar', 'KYD': 'Cayman Islands Dollar', 'KZT': 'Kazakhstani Tenge', 'LAK': 'Laotian Kip',
-    'LBP': 'Lebanese Pound', 'LKR': 'Sri Lankan Rupee', 'LRD': 'Liberian Dollar', 'LSL': 'Lesotho Loti',
-    'LYD': 'Libyan Dinar', 'MAD': 'Moroccan Dirham', 'MDL': 'Moldovan Leu', 'MGA': 'Malagasy Ariary',
-    'MKD': 'Macedonian Denar', 'MMK': 'Myanma Kyat', 'MNT': 'Mongolian Tugrik', 'MOP': 'Macanese Pataca',
-    'MRU': 'Mauritanian Ouguiya', 'MUR': 'Mauritian Rupee', 'MVR': 'Maldivian Rufiyaa', 'MWK': 'Malawian Kwacha',
-    'MYR': 'Malaysian Ringgit', 'MZN': 'Mozambican Metical', 'NAD': 'Namibian Dollar', 'NGN': 'Nigerian Naira',
-    'NIO': 'Nicaraguan Córdoba', 'NPR': 'Nepalese Rupee', 'OMR': 'Omani Rial', 'PAB': 'Panamanian Balboa',
-    'PEN': 'Peruvian Sol', 'PGK': 'Papua New Guinean Kina', 'PHP': 'Philippine Peso', 'PKR': 'Pakistani Rupee',
-    'PLN': 'Polish Zloty', 'PYG': 'Paraguayan Guarani', 'QAR': 'Qatari Rial', 'RON': 'Romanian Leu',
-    'RSD': 'Serbian Dinar', 'RWF': 'Rwandan Franc', 'SAR': 'Saudi Riyal', 'SBD': 'Solomon Islands Dollar',
-    'SCR': 'Seychellois Rupee', 'SDG': 'Sudanese Pound', 'SHP': 'Saint Helena Pound', 'SLE': 'Sierra Leonean Leone',
-    'SOS': 'Somali Shilling', 'SRD': 'Surinamese Dollar', 'SSP': 'South Sudanese Pound',
-    'STN': 'São Tomé and Príncipe Dobra', 'SYP': 'Syrian Pound', 'SZL': 'Eswatini Lilangeni',
-    'THB': 'Thai Baht', 'TJS': 'Tajikistani Somoni', 'TMT': 'Turkmenistani Manat', 'TND': 'Tunisian Dinar',
-    'TOP': 'Tongan Paʻanga', 'TTD': 'Trinidad and Tobago Dollar', 'TVD': 'Tuvaluan Dollar',
-    'TWD': 'New Taiwan Dollar', 'TZS': 'Tanzanian Shilling', 'UAH': 'Ukrainian Hryvnia',
-    'UGX': 'Ugandan Shilling', 'UYU': 'Uruguayan Peso', 'UZS': 'Uzbekistan Som', 'VES': 'Venezuelan Bolívar',
-    'VND': 'Vietnamese Dong', 'VUV': 'Vanuatu Vatu', 'WST': 'Samoan Tala', 'XAF': 'Central African CFA Franc',
-    'XCD': 'East Caribbean Dollar', 'XDR': 'Special Drawing Rights', 'XOF': 'West African CFA Franc',
-    'XPF': 'CFP Franc', 'YER': 'Yemeni Rial', 'ZMW': 'Zambian Kwacha', 'ZWL': 'Zimbabwean Dollar'
-}
+# The Gemini SDK, pandas and Plotly are imported on first use, so opening the chat doesn't pay for the tools'
+# dependencies; the model and other clients are process-wide singletons created on their first call.
+
+# Chat messages drawn per rerun; older ones are drawn only on request.
+CHAT_RENDER_WINDOW = int(os.getenv("CHAT_RENDER_WINDOW", "20"))
+CHAT_RENDER_CACHE_SIZE = 4096
+# Per-stage timing panel in the sidebar for every session; a single session can also open it with ?debug=1.
+METRICS_PANEL = os.getenv("METRICS_PANEL", "0") == "1"
+# Port for a Prometheus /metrics endpoint in this process (the API workers serve their own); off when unset.
+METRICS_EXPORTER_PORT = int(os.getenv("METRICS_EXPORTER_PORT", "0"))
+METRICS_EXPORTER_HOST = os.getenv("METRICS_EXPORTER_HOST", "127.0.0.1")
+# Sidebar history entries per page.
+CHAT_HISTORY_PAGE_SIZE = 5
+TOOL_HISTORY_PAGE_SIZE = 10
+# User setting holding the categorization rules ({category: [keyword, ...]}).
+CATEGORY_RULES_SETTING = "category_rules"
+
+BOT_AVATAR = "https://image.similarpng.com/file/similarpng/very-thumbnail/2021/08/Business-and-financial-logo-design-template-isolated-on-transparent-background-PNG.png"
 
 # --- 2. HELPER FUNCTIONS ---
 
-def get_real_time_exchange_rate(from_currency: str, to_currency: str) -> float | None:
-    """Fetches a real-time exchange rate from an external API."""
-    base_url = f"https://v6.exchangerate-api.com/v6/{EXCHANGE_RATE_API_KEY}/pair/{from_currency}/{to_currency}"
-    try:
-        response = requests.get(base_url)
-        response.raise_for_status() # Raise an exception for bad status codes
-        data = response.json()
-        if data["result"] == "success":
-            return data["conversion_rate"]
-        else:
-            st.error(f"API Error: {data.get('error-type', 'Unknown error')}")
-            return None
-    except requests.exceptions.RequestException as e:
-        st.error(f"Network Error: Could not connect to the exchange rate API. Please check your internet connection. {e}")
-        return None
-    except KeyError:
-        st.error("API Response Error: The API response format was unexpected.")
-        return None
+def warn_retry(retries: int, delay: float):
+    """Tells the user a rate-limited call is being retried in the background."""
+    st.warning(f"We're experiencing high traffic. Retrying in {delay:.0f} seconds...")
 
-def safe_generate_content(model, prompt):
+def run_service(coro):
     """
-    Wraps the generate_content call with exponential backoff for quota errors.
+    Runs a service-layer coroutine and waits for it, showing retry progress and
+    LLM outages in the UI. Returns None if the LLM service stayed unavailable.
     """
-    retries = 0
-    max_retries = 5
-    while retries < max_retries:
-        try:
-            return model.generate_content(prompt)
-        except genai.types.BlockedPromptException as e:
+    try:
+        return services.run(coro, on_retry=warn_retry)
+    except LLMUnavailableError as e:
+        st.error(str(e))
+        return None
+    except Exception as e:
+        if services.is_blocked_prompt(e):
             st.error(f"Error: Prompt blocked by safety policy.")
-            raise e
-        except Exception as e:
-            if "quota" in str(e).lower() or "429" in str(e):
-                retry_delay = 2 ** retries
-                st.warning(f"We're experiencing high traffic. Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                retries += 1
-            else:
-                raise e
-    st.error("We're having trouble reaching the service right now. Please wait a moment and try again.")
-    return None
+        raise
 
-def build_advanced_currency_prompt(from_currency: str, to_currency: str, amount: float, real_time_rate: float, lookup_date: date = None) -> str:
-    """Builds an advanced prompt for currency conversion with historical data, with a stronger emphasis on a strict JSON format."""
-    
-    date_prompt_part = ""
-    if lookup_date:
-        date_prompt_part = f"""
-        Provide the exchange rate and converted amount for the specific historical date: {lookup_date.strftime('%Y-%m-%d')}. This should be in a JSON object with the key 'historical_rate'.
-        """
-    
-    return f"""
-    You are an expert currency and financial data analyst. Your primary task is to provide currency data in a specific, strict JSON format.
-
-    - **Task 1: Real-Time Conversion.** Given the current exchange rate from {from_currency} to {to_currency} is {real_time_rate}, calculate the total for {amount} {from_currency}.
-    - **Task 2: Historical Trend.** Provide a list of the daily exchange rates for {from_currency} to {to_currency} for the last 30 days (ending yesterday). Each item in the list must be an object with 'date' and 'rate' keys.
-    - **Task 3: Specific Date (if requested).** {date_prompt_part}
-
-    Your ENTIRE response MUST be a single, clean JSON object with NO additional text or markdown outside of the JSON block. Do not include any explanatory text before or after the JSON.
-
-    The JSON must contain the following keys, and their values must match the specified structure:
-    - "real_time": {{ "rate": <number>, "converted_amount": <number>, "explanation": "<string>" }}
-    - "historical_trend": [ {{ "date": "<YYYY-MM-DD>", "rate": <number> }}, ... ]
-    - "historical_rate": {{ "date": "<YYYY-MM-DD>", "rate": <number>, "converted_amount": <number>, "explanation": "<string>" }} (this key is only required if a specific historical date was requested).
-
-    Here is a detailed example of the expected format:
-    ```json
-    {{
-      "real_time": {{
-        "rate": 1.2345,
-        "converted_amount": 123.45,
-        "explanation": "The real-time conversion from USD to EUR."
-      }},
-      "historical_trend": [
-        {{ "date": "2023-01-01", "rate": 1.2500 }},
-        {{ "date": "2023-01-02", "rate": 1.2480 }}
-        // ... more data
-      ],
-      "historical_rate": {{
-        "date": "2023-01-01",
-        "rate": 1.2500,
-        "converted_amount": 125.00,
-        "explanation": "The historical conversion from USD to EUR on 2023-01-01."
-      }}
-    }}
-    ```
-    
-    Generate the JSON for this request: From {from_currency}, To {to_currency}, Amount {amount}.
-    JSON Output:
-    """
+def generate_structured(model, prompt, builder: str, tool: str = "default") -> dict | None:
+    """Generates in JSON mode and parses against the builder's schema; see services.generate_structured."""
+    return run_service(services.generate_structured(model, prompt, builder, tool))
 
-def build_budget_summary_prompt(income: float, expenses: dict, currency: str) -> str:
-    """Builds a prompt for a budget summary."""
-    expense_details = "\n".join([f"- {category.capitalize()}: {currency}{amount}" for category, amount in expenses.items()])
-    total_expenses = sum(expenses.values())
-    net_income = income - total_expenses
-    
-    return f"""
-    You are LefiBot, a professional financial assistant. Analyze the budget and provide a concise summary.
-    Budget:
-    - Monthly Income: {currency}{income:,.2f}
-    - Expenses:
-    {expense_details}
-    - Total Monthly Expenses: {currency}{total_expenses:,.2f}
-    - Net Income: {currency}{net_income:,.2f}
-
-    Respond in a clean JSON format with two keys: "summary_text" and "top_categories".
-    - "summary_text": A markdown-formatted string with a heading "### AI Summary & Tips" containing:
-        1. A sentence on overall financial health.
-        2. One practical tip for improvement.
-    - "top_categories": A list of the top 2-3 spending categories as strings.
-    
-    JSON Output:
-    """
+def stream_generate_content(model, prompt, tool: str = "chat") -> LLMStream:
+    """Starts a streamed generation whose retries are reported in the UI; see services.stream_generate_content."""
+    stream = services.stream_generate_content(model, prompt, tool)
+    stream.on_retry = warn_retry
+    return stream
 
-def build_chatbot_prompt(user_query: str) -> str:
-    """Builds a prompt for the general finance chatbot."""
-    return f"""
-    You are LefiBot, a helpful and professional financial assistant. Answer the user's personal finance question clearly, concisely, and in a friendly manner.
-    User's Question: "{user_query}"
-    """
-    
-def build_nlu_prompt(text: str) -> str:
-    """Builds an advanced prompt for NLU analysis."""
-    return f"""
-    Analyze the following text for advanced Natural Language Understanding insights.
-    Provide the output in a clean JSON format with the following keys:
-    - 'sentiment': A string ('positive', 'negative', or 'neutral').
-    - 'sentiment_score': A float between -1.0 (very negative) and 1.0 (very positive).
-    - 'emotion': A single dominant emotion detected in the text (e.g., 'stress', 'joy', 'concern', 'optimism').
-    - 'intent': The user's primary goal (e.g., 'seeking advice', 'expressing frustration', 'querying data', 'budget_analysis', 'investment_planning').
-    - 'summary': A concise, one-sentence summary of the text.
-    - 'keywords': A list of up to 5 most important keywords.
-    - 'entities': A list of named entities.
-
-    Text to analyze: "{text}"
-    JSON Output:
-    """
+def rerun_fragment():
+    """Reruns the calling fragment; Streamlit only allows that in a fragment rerun, so a full run reruns the app."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
 
-def build_expense_extraction_prompt(text: str) -> str:
-    """Builds a prompt to extract key-value pairs for expenses from a text."""
-    return f"""
-    Extract financial expense data from the following text and return it as a JSON object.
-    The keys should be the expense categories (e.g., "rent", "groceries", "transport") and the values should be the numerical amounts.
-    If multiple amounts are found for the same category, sum them up.
-    
-    Example:
-    Text: "My rent is 15000, and I spend 8000 on groceries."
-    Output: {{ "Rent": 15000, "Groceries": 8000 }}
+def current_user_id() -> str:
+    """Id that keys this browser's saved history; kept in the URL so reloads and restarts find it again."""
+    user_id = st.query_params.get("uid")
+    if not user_id:
+        user_id = new_user_id()
+        st.query_params["uid"] = user_id
+    return user_id
 
-    Text: "{text}"
-    JSON Output:
-    """
+def start_new_chat(greeting: str) -> ChatSession:
+    session = get_session_store().create_chat(current_user_id(), greeting=greeting)
+    st.session_state.current_chat_id = session.id
+    return session
 
-def build_spending_insight_prompt(income: float, expenses: dict, goals: list, currency: str) -> str:
-    """Builds a prompt for deep spending insights."""
-    expense_details = "\n".join([f"- {category.capitalize()}: {currency}{amount}" for category, amount in expenses.items()])
-    goal_details = "\n".join([f"- {goal['name']}: {currency}{goal['cost']} (Deadline: {goal['deadline_months']} months)" for goal in goals]) if goals else "No specific goals provided."
-    total_expenses = sum(expenses.values())
-    surplus = income - total_expenses
-    
-    return f"""
-    Perform a deep financial analysis based on the data below. Provide structured, actionable insights.
-
-    User Financial Profile:
-    - Monthly Income: {currency}{income}
-    - Monthly Expenses:
-    {expense_details}
-    - Future Goals:
-    {goal_details}
-    - Calculated Monthly Surplus (after expenses): {currency}{surplus}
-
-    Generate a detailed report in a clean JSON format with the following keys:
-    - "executive_summary": A concise markdown paragraph summarizing their financial health.
-    - "spending_breakdown": A markdown string categorizing expenses into Fixed vs. Variable.
-    - "needs_vs_wants": A markdown string classifying expenses into Needs vs. Wants.
-    - "red_flags": A markdown string identifying potential budgetary risks.
-    - "goal_feasibility": A markdown string analyzing if goals are on track.
-    - "recommendations": A markdown string with the top 3 actionable recommendations.
-    
-    JSON Output:
-    """
+def user_categorizer():
+    """The categorizer for this user's own categorization rules."""
+    return get_categorizer(get_session_store().get_setting(current_user_id(), CATEGORY_RULES_SETTING, {}))
 
-def build_investment_prompt(current_savings: float, monthly_investment: float, years_to_goal: int, risk_tolerance: str, currency: str) -> str:
-    """Builds a detailed prompt for an investment plan."""
-    return f"""
-    You are a Certified Financial Planner (CFP) AI. Based on the user's data, generate a comprehensive investment plan.
-    User's Financial Profile:
-    - Current Savings: {currency}{current_savings:,.2f}
-    - Monthly Investment: {currency}{monthly_investment:,.2f}
-    - Years to Investment Goal: {years_to_goal} years
-    - Risk Tolerance: {risk_tolerance}
-
-    Provide the response in a single, structured JSON format with the following keys:
-    - "summary": A markdown-formatted paragraph providing a high-level overview of the plan.
-    - "portfolio_breakdown": A list of JSON objects, each with 'asset' (e.g., "Stocks", "Bonds", "Crypto") and 'percentage'.
-    - "projected_growth": A list of JSON objects representing a hypothetical growth path, each with 'year' and 'value'. The projection should be conservative, assuming a realistic average annual return for the given risk tolerance. Include a comment in your JSON about the assumed annual return rate.
-    - "action_plan": A markdown-formatted list of 3-5 actionable steps the user should take.
-    
-    JSON Output:
-    """
+def save_tool_session(title: str, tool_type: str, inputs: dict, outputs: dict) -> str:
+    """Persists a tool result to the user's history and returns its id."""
+    return get_session_store().save_tool(current_user_id(), title, tool_type, inputs, outputs)
 
 # --- 3. UI RENDERING FUNCTIONS ---
 
@@ -495,6 +323,8 @@ def render_footer():
 
 def display_currency_results(data, from_currency, to_currency, amount, is_historical, lookup_date):
     """Renders the results of a currency conversion."""
+    import pandas as pd
+
     if not isinstance(data, dict) or "real_time" not in data:
         st.warning("The AI response did not contain the expected structure. Please try again.")
         return
@@ -523,6 +353,8 @@ def display_currency_results(data, from_currency, to_currency, amount, is_histor
             st.markdown(f"<div style='background-color: var(--bubble-bot); padding: 20px; border-radius: 10px; border: 1px solid var(--border-color);'><h3 style='text-align: center; color: var(--text-color);'>{hist_explanation}</h3><h2 style='text-align: center; color: var(--text-color);'>{amount:,.2f} {from_currency.upper()} = <span style='color: var(--secondary-color);'>{hist_converted_amount:,.2f} {to_currency.upper()}</span></h2></div>", unsafe_allow_html=True)
         else:
             st.warning("Historical conversion data was incomplete in the AI response.")
+    elif is_historical and lookup_date:
+        st.info(f"No stored exchange rate is available for {from_currency.upper()}→{to_currency.upper()} around {lookup_date.strftime('%B %d, %Y')}.")
 
     # Display 30-day trend chart safely
     trend_data = data.get("historical_trend")
@@ -542,26 +374,112 @@ def display_currency_results(data, from_currency, to_currency, amount, is_histor
                 st.warning("Trend data is not in the expected list format.")
         except Exception as chart_error:
             st.warning(f"Could not display trend chart: {chart_error}")
+    else:
+        st.info("No historical rates are stored for this pair yet. Load snapshots with `python fx_history.py backfill rates.csv`.")
+
+def format_currency(code):
+    return f"{code} - {CURRENCIES.get(code, 'Unknown Currency')}"
+
+def display_currency_matrix(data: dict, amount: float):
+    """Renders a multi-currency conversion: the converted amounts, then the cross-rate heatmap and table."""
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+
+    codes = data["currencies"]
+    matrix = np.array(data["matrix"])
+    st.success("Data retrieved successfully! ✅")
+
+    st.subheader(f"{amount:,.2f} {codes[0]} in {len(codes) - 1} Currencies 🌍")
+    converted_df = pd.DataFrame({
+        "Currency": codes[1:],
+        "Name": [CURRENCIES.get(code, code) for code in codes[1:]],
+        "Amount": [data["converted"][code] for code in codes[1:]],
+        "Rate": matrix[0, 1:],
+    })
+    st.dataframe(converted_df, hide_index=True, use_container_width=True,
+                 column_config={"Amount": st.column_config.NumberColumn(format="%.2f"), "Rate": st.column_config.NumberColumn(format="%.6g")})
+
+    st.subheader("Cross-Rate Matrix 🔢")
+    st.caption("Each cell is how many units of the column currency one unit of the row currency buys.")
+    # Rates span several orders of magnitude, so the colour follows their logarithm
+    fig = px.imshow(np.log10(matrix), x=codes, y=codes, color_continuous_scale="Tealgrn", aspect="auto")
+    fig.update_traces(customdata=matrix, hovertemplate="1 %{y} = %{customdata:.6g} %{x}<extra></extra>")
+    fig.update_coloraxes(showscale=False)
+    fig.update_layout(paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)", font_color="#FFFFFF")
+    st.plotly_chart(fig, use_container_width=True)
+    with st.expander("Cross rates as a table"):
+        st.dataframe(pd.DataFrame(matrix, index=codes, columns=codes), use_container_width=True)
+    if data.get("rates_as_of"):
+        st.caption(f"Rates as of {data['rates_as_of']:%B %d, %Y %H:%M}.")
+
+def render_currency_matrix(session_inputs: dict, session_outputs: dict | None):
+    """One amount into many currencies from a single rate snapshot, with no AI call."""
+    currency_list = list(CURRENCIES.keys())
+    col1, col2 = st.columns([0.6, 0.4])
+    with col1:
+        from_currency = st.selectbox("From Currency", options=currency_list,
+                                     index=currency_list.index(session_inputs.get('from_currency', 'USD')),
+                                     format_func=format_currency)
+    with col2:
+        amount = st.number_input("Amount", min_value=0.01, value=float(session_inputs.get('amount', 100.0)), step=1.0)
+    targets = st.multiselect("To Currencies", options=currency_list, default=session_inputs.get('currencies', MATRIX_CURRENCIES),
+                             format_func=format_currency)
+
+    if st.button("➤ Convert to All", use_container_width=True):
+        if not targets:
+            st.warning("Please choose at least one currency to convert into.")
+            return
+        with st.spinner("Fetching exchange rates..."):
+            try:
+                data = run_service(convert_to_many(from_currency, amount, targets))
+            except RateUnavailableError as e:
+                st.error(str(e))
+                st.error("Could not retrieve real-time exchange rates. Please check your internet connection and try again.")
+                return
+            except Exception as e:
+                st.error(f"An unexpected error occurred: {e}")
+                return
+        if data is None:
+            return
+        if data["stale"]:
+            st.info("Showing the last known exchange rates because the rate service could not be reached.")
+
+        title = f"Conv: {amount} {from_currency}→{len(data['currencies']) - 1} currencies"
+        st.session_state.current_tool_id = save_tool_session(title, "💸 Currency Converter", {'mode': 'matrix', 'from_currency': from_currency, 'amount': amount, 'currencies': targets}, data)
+        with span("render", "currency_matrix"):
+            display_currency_matrix(data, amount)
+
+    elif session_outputs:
+        display_currency_matrix(session_outputs, session_inputs['amount'])
 
 def render_currency_converter():
     st.header("💸 Advanced Currency Converter")
     with st.container(border=True):
         
-        session_inputs = {
+        default_inputs = {
             'from_currency': 'USD', 'to_currency': 'INR', 'amount': 100.0,
             'is_historical': False, 'lookup_date': date.today() - timedelta(days=1)
         }
+        session_inputs = default_inputs
         active_session_outputs = None
         current_id = st.session_state.get('current_tool_id')
-        if current_id and current_id in st.session_state.tool_sessions:
-            session = st.session_state.tool_sessions[current_id]
+        session = get_session_store().get_tool(current_id) if current_id else None
+        if session:
             if session.get('tool_type') == '💸 Currency Converter':
                 session_inputs = session['inputs']
                 active_session_outputs = session['outputs']
+
+        matrix_session = session_inputs.get('mode') == 'matrix'
+        mode = st.radio("Conversion mode", ["Single pair", "Many currencies"], index=1 if matrix_session else 0,
+                        horizontal=True, label_visibility="collapsed")
+        if mode == "Many currencies":
+            render_currency_matrix(session_inputs if matrix_session else {}, active_session_outputs if matrix_session else None)
+            return
+        if matrix_session:
+            session_inputs, active_session_outputs = default_inputs, None
         
         currency_list = list(CURRENCIES.keys())
-        def format_currency(code):
-            return f"{code} - {CURRENCIES.get(code, 'Unknown Currency')}"
 
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -585,54 +503,117 @@ def render_currency_converter():
             if not from_currency or not to_currency or not amount:
                 st.warning("Please fill in all currency fields.")
             else:
-                # Use the new function to get the real-time rate
-                real_time_rate = get_real_time_exchange_rate(from_currency, to_currency)
-                if real_time_rate is None:
-                    # If real-time rate couldn't be fetched, display an error and stop
-                    st.error("Could not retrieve real-time exchange rate. Please check your internet connection and try again.")
-                    return
-
                 with st.spinner("Fetching financial data... This may take a moment."):
                     try:
-                        # Pass the real-time rate to the AI for analysis
-                        prompt = build_advanced_currency_prompt(from_currency, to_currency, amount, real_time_rate, lookup_date if is_historical else None)
-                        response = safe_generate_content(llm, prompt)
-                        if response:
-                            raw_text = response.text
-                            json_match = re.search(r'```json\s*(\{.*?\})\s*```', raw_text, re.DOTALL)
-                            if not json_match:
-                                raise json.JSONDecodeError("No valid JSON found in the AI response.", raw_text, 0)
-                            
-                            json_str = json_match.group(1)
-                            data = json.loads(json_str)
-
-                            tool_id = f"tool_{time.time()}"
-                            title = f"Conv: {amount} {from_currency}→{to_currency}"
-                            st.session_state.tool_sessions[tool_id] = {
-                                "title": title,
-                                "tool_type": "💸 Currency Converter", # Fixed inconsistency
-                                "inputs": {'from_currency': from_currency, 'to_currency': to_currency, 'amount': amount,
-                                           'is_historical': is_historical, 'lookup_date': lookup_date},
-                                "outputs": data
-                            }
-                            st.session_state.current_tool_id = tool_id
-                            
-                            display_currency_results(data, from_currency, to_currency, amount, is_historical, lookup_date)
-                        
-                    except json.JSONDecodeError:
-                        st.error("Error: The AI response was not in a valid JSON format. Please try again.")
-                        st.code(raw_text, language="text")
+                        data = run_service(convert_currency(from_currency, to_currency, amount, is_historical, lookup_date))
+                    except RateUnavailableError as e:
+                        # If the real-time rate couldn't be fetched, display an error and stop
+                        import requests
+
+                        if isinstance(e.__cause__, requests.exceptions.RequestException):
+                            st.error(f"Network Error: Could not connect to the exchange rate API. Please check your internet connection. {e.__cause__}")
+                        else:
+                            st.error(str(e))
+                        st.error("Could not retrieve real-time exchange rate. Please check your internet connection and try again.")
+                        return
                     except Exception as e:
                         st.error(f"An unexpected error occurred: {e}")
+                        return
+                    if data is None:
+                        return
+                    if data["stale"]:
+                        st.info("Showing the last known exchange rates because the rate service could not be reached.")
+                    if not data["ai_explained"]:
+                        st.info("The AI explanation could not be generated, but the conversion figures below are accurate.")
+
+                    title = f"Conv: {amount} {from_currency}→{to_currency}"
+                    st.session_state.current_tool_id = save_tool_session(title, "💸 Currency Converter", {'from_currency': from_currency, 'to_currency': to_currency, 'amount': amount, 'is_historical': is_historical, 'lookup_date': lookup_date}, data)
+
+                    with span("render", "currency"):
+                        display_currency_results(data, from_currency, to_currency, amount, is_historical, lookup_date)
         
         elif active_session_outputs:
             display_currency_results(active_session_outputs, **session_inputs)
 
+def llm_categorize_descriptions(descriptions: list) -> dict | None:
+    """Asks the LLM to categorize descriptions the local categorizer couldn't; None if the call failed."""
+    prompt = build_transaction_categorization_prompt(descriptions, user_categorizer().categories)
+    try:
+        answers = generate_structured(get_model(), prompt, "build_transaction_categorization_prompt", tool="categorization")
+    except StructuredOutputError:
+        return None
+    if answers is None:
+        return None
+    return {descriptions[int(key) - 1]: category for key, category in answers.items() if key.isdigit() and 0 < int(key) <= len(descriptions)}
+
+def categorize_transactions(descriptions: list) -> list:
+    """Categorizes a chunk of statement rows locally, batching only the leftovers to the LLM."""
+    return user_categorizer().categorize(descriptions, resolve=llm_categorize_descriptions)
+
+def render_categorization_rules():
+    """Lets the user add 'Category: keyword, keyword' rules that take priority over the built-in ones."""
+    categorizer = user_categorizer()
+    with st.expander("Categorization rules"):
+        current = "\n".join([f"{category}: {', '.join(words)}" for category, words in categorizer.user_rules.items()])
+        rules_input = st.text_area("One category per line, e.g. Pets: petsmart, vet", current, height=100)
+        if st.button("Save rules"):
+            rules = {}
+            for line in rules_input.splitlines():
+                if ':' in line:
+                    category, words = line.split(':', 1)
+                    keywords = [word.strip() for word in words.split(',') if word.strip()]
+                    if category.strip() and keywords:
+                        rules[category.strip()] = keywords
+            get_session_store().set_setting(current_user_id(), CATEGORY_RULES_SETTING, rules)
+            st.session_state.pop("statement_import", None)  # Re-categorize the current statement.
+            rerun_fragment()
+
+STATEMENT_DATE_ORDERS = {"Detect automatically": DATE_ORDER_AUTO, "DD/MM/YYYY": DATE_ORDER_DAY_FIRST, "MM/DD/YYYY": DATE_ORDER_MONTH_FIRST}
+
+def import_statement(uploaded_file, date_order: str = DATE_ORDER_AUTO) -> StatementSummary | None:
+    """Streams an uploaded bank statement into monthly totals, once per upload and date order."""
+    file_id = (getattr(uploaded_file, "file_id", uploaded_file.name), date_order)
+    cached = st.session_state.get("statement_import")
+    if cached and cached["file_id"] == file_id:
+        summary, elapsed = cached["summary"], cached["elapsed"]
+    else:
+        try:
+            with st.spinner("Importing statement..."):
+                started = time.perf_counter()
+                uploaded_file.seek(0)
+                summary = summarize_statement(uploaded_file, uploaded_file.name, categorize_batch=categorize_transactions,
+                                              date_order=date_order)
+                elapsed = time.perf_counter() - started
+        except (StatementFormatError, ValueError, csv.Error) as e:
+            st.error(f"Could not read the statement: {e}")
+            return None
+        st.session_state.statement_import = {"file_id": file_id, "summary": summary, "elapsed": elapsed}
+    st.caption(f"Imported {summary.rows:,} transactions over {summary.month_count} month(s) in {elapsed:.2f}s ({summary.rows / max(elapsed, 1e-9):,.0f} rows/s). Amounts below are monthly averages.")
+    if summary.undated:
+        st.warning(f"{summary.undated:,} transaction(s) had a date in another format than the rest of the file. They are included in the totals but not in the month count, so the monthly averages may be too high.")
+    return summary
+
 def render_budget_summarizer():
+    import plotly.express as px
+
     st.header("📈 Budget Analyzer")
     with st.container(border=True):
-        income = st.number_input("Your Monthly Income (e.g., 50000)", min_value=0.0, value=st.session_state.get('prefill_income', 50000.0), step=1000.0)
-        expenses_input = st.text_area("Your Monthly Expenses (e.g., Rent: 15000, Groceries: 8000)", st.session_state.get('prefill_expenses', "Rent: 15000, Groceries: 8000, Transport: 3000, Entertainment: 4000"), height=150)
+        default_income = st.session_state.get('prefill_income', 50000.0)
+        default_expenses = st.session_state.get('prefill_expenses', "Rent: 15000, Groceries: 8000, Transport: 3000, Entertainment: 4000")
+
+        statement = st.file_uploader("Import a bank statement (CSV or OFX)", type=["csv", "ofx", "qfx"])
+        if statement is not None:
+            render_categorization_rules()
+            date_order = st.selectbox("Statement date format", list(STATEMENT_DATE_ORDERS),
+                                      help="Only matters when no date in the file has a day above 12.")
+            summary = import_statement(statement, STATEMENT_DATE_ORDERS[date_order])
+            if summary and summary.rows:
+                default_income = summary.monthly_income() or default_income
+                # Commas and colons would break the "Category: amount" list below.
+                default_expenses = ", ".join([f"{re.sub(r'[,:]', ' ', category)}: {amount}" for category, amount in summary.monthly_expenses().items()])
+
+        income = st.number_input("Your Monthly Income (e.g., 50000)", min_value=0.0, value=float(default_income), step=1000.0)
+        expenses_input = st.text_area("Your Monthly Expenses (e.g., Rent: 15000, Groceries: 8000)", default_expenses, height=150)
         currency_symbol = st.text_input("Currency Symbol", "₹")
 
         # Clear pre-fill data after it's used
@@ -648,23 +629,10 @@ def render_budget_summarizer():
                 with st.spinner("Analyzing your budget..."):
                     try:
                         expenses = {key.strip(): float(value.strip()) for item in expenses_input.split(',') if ':' in item for key, value in [item.split(':', 1)]}
-                        prompt = build_budget_summary_prompt(income, expenses, currency_symbol)
-                        response = safe_generate_content(llm, prompt)
-                        if response:
-                            raw_text = response.text
-                            json_match = re.search(r'```json\s*(\{.*?\})\s*```', raw_text, re.DOTALL)
-                            json_str = json_match.group(1) if json_match else raw_text
-                            data = json.loads(json_str)
-
-                            tool_id = f"tool_{time.time()}"
+                        data = run_service(analyze_budget(income, expenses, currency_symbol))
+                        if data is not None:
                             title = "Budget Analysis"
-                            st.session_state.tool_sessions[tool_id] = {
-                                "title": title,
-                                "tool_type": "📈 Budget Analyzer", # Fixed inconsistency
-                                "inputs": {'income': income, 'expenses': expenses, 'currency': currency_symbol},
-                                "outputs": data
-                            }
-                            st.session_state.current_tool_id = tool_id
+                            st.session_state.current_tool_id = save_tool_session(title, "📈 Budget Analyzer", {'income': income, 'expenses': expenses, 'currency': currency_symbol}, data)
 
                             st.success("Budget Analysis Complete! 🎉")
                             
@@ -678,16 +646,17 @@ def render_budget_summarizer():
 
                             st.markdown("---")
 
-                            col1, col2 = st.columns([2,1])
-                            with col1:
-                                if expenses:
-                                    fig = px.pie(values=expenses.values(), names=expenses.keys(), title="Expense Breakdown", hole=0.3)
-                                    fig.update_layout(showlegend=False, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font_color='var(--text-color)', font_family='Poppins')
-                                    fig.update_traces(textposition='inside', textinfo='percent+label', marker=dict(colors=px.colors.sequential.Tealgrn))
-                                    st.plotly_chart(fig, use_container_width=True)
+                            with span("render", "budget"):
+                                col1, col2 = st.columns([2,1])
+                                with col1:
+                                    if expenses:
+                                        fig = px.pie(values=expenses.values(), names=expenses.keys(), title="Expense Breakdown", hole=0.3)
+                                        fig.update_layout(showlegend=False, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font_color='var(--text-color)', font_family='Poppins')
+                                        fig.update_traces(textposition='inside', textinfo='percent+label', marker=dict(colors=px.colors.sequential.Tealgrn))
+                                        st.plotly_chart(fig, use_container_width=True)
                             
-                            with col2:
-                                    st.markdown(data.get("summary_text", "AI summary could not be generated."))
+                                with col2:
+                                        st.markdown(data.get("summary_text", "AI summary could not be generated."))
                                 
                     except Exception as e:
                         st.error(f"An error occurred while analyzing the budget: {e}")
@@ -699,23 +668,10 @@ def render_nlu_analysis():
         if st.button("➤ Analyze Text", use_container_width=True):
             with st.spinner("Analyzing..."):
                 try:
-                    prompt = build_nlu_prompt(text_input)
-                    response = safe_generate_content(llm, prompt)
-                    if response:
-                        raw_text = response.text
-                        json_match = re.search(r'```json\s*(\{.*?\})\s*```', raw_text, re.DOTALL)
-                        json_str = json_match.group(1) if json_match else raw_text
-                        data = json.loads(json_str)
-
-                        tool_id = f"tool_{time.time()}"
+                    data = run_service(analyze_text(text_input))
+                    if data is not None:
                         title = "NLU Analysis"
-                        st.session_state.tool_sessions[tool_id] = {
-                            "title": title,
-                            "tool_type": "🧠 NLU Analysis", # Added session tracking for NLU
-                            "inputs": {'text_input': text_input},
-                            "outputs": data
-                        }
-                        st.session_state.current_tool_id = tool_id
+                        st.session_state.current_tool_id = save_tool_session(title, "🧠 NLU Analysis", {'text_input': text_input}, data)
                         
                         st.success("Analysis Complete! 🔬")
 
@@ -792,23 +748,10 @@ def render_spending_insights():
                         st.warning(f"The following goals were ignored due to incorrect formatting: `{', '.join(malformed_goals)}`")
                         st.info("Please use the format: `Goal Name: Cost (Deadline months)`")
 
-                    prompt = build_spending_insight_prompt(income, expenses, goals, currency)
-                    response = safe_generate_content(llm, prompt)
-                    if response:
-                        raw_text = response.text
-                        json_match = re.search(r'```json\s*(\{.*?\})\s*```', raw_text, re.DOTALL)
-                        json_str = json_match.group(1) if json_match else raw_text
-                        data = json.loads(json_str)
-
-                        tool_id = f"tool_{time.time()}"
+                    data = run_service(spending_insights(income, expenses, goals, currency))
+                    if data is not None:
                         title = "Spending Insights"
-                        st.session_state.tool_sessions[tool_id] = {
-                            "title": title,
-                            "tool_type": "🔮 Spending Insights", # Fixed inconsistency
-                            "inputs": {'income': income, 'expenses': expenses, 'goals': goals, 'currency': currency},
-                            "outputs": data
-                        }
-                        st.session_state.current_tool_id = tool_id
+                        st.session_state.current_tool_id = save_tool_session(title, "🔮 Spending Insights", {'income': income, 'expenses': expenses, 'goals': goals, 'currency': currency}, data)
                         
                         st.success("Insights Generated! 🚀")
 
@@ -849,7 +792,24 @@ def render_spending_insights():
                 except Exception as e:
                     st.error(f"An error occurred while generating insights: {e}")
 
+def display_simulation_results(simulation: dict, currency: str):
+    """Renders Monte Carlo percentile bands and the probability of reaching the goal."""
+    import pandas as pd
+    import plotly.express as px
+
+    st.markdown("---")
+    st.subheader(f"Range of Outcomes ({simulation['paths']:,} simulations) 🎲")
+    if "success_probability" in simulation:
+        st.metric(f"Chance of reaching {currency}{simulation['goal_amount']:,.0f}", f"{simulation['success_probability']:.0%}")
+    bands_df = pd.DataFrame(simulation["bands"]).rename(columns={"p10": "Pessimistic (P10)", "p50": "Median (P50)", "p90": "Optimistic (P90)"})
+    fig = px.line(bands_df, x='year', y=["Pessimistic (P10)", "Median (P50)", "Optimistic (P90)"], title="Simulated Account Value", markers=True)
+    fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font_color='var(--text-color)', font_family='Poppins', legend_title_text='')
+    st.plotly_chart(fig, use_container_width=True)
+
 def render_investment_planner():
+    import pandas as pd
+    import plotly.express as px
+
     st.header("✨ AI Investment Planner")
     with st.container(border=True):
         col1, col2 = st.columns(2)
@@ -862,6 +822,11 @@ def render_investment_planner():
         
         currency = st.text_input("Currency Symbol", "₹")
 
+        run_simulation = st.toggle("Run Monte Carlo simulation", value=False)
+        goal_amount = None
+        if run_simulation:
+            goal_amount = st.number_input("Goal Amount (optional)", min_value=0.0, value=0.0, step=10000.0) or None
+
         if st.button("➤ Generate Plan", use_container_width=True):
             if not current_savings and not monthly_investment:
                 st.warning("Please enter your current savings or a monthly investment amount.")
@@ -869,175 +834,411 @@ def render_investment_planner():
 
             with st.spinner("Generating personalized investment plan..."):
                 try:
-                    prompt = build_investment_prompt(current_savings, monthly_investment, years_to_goal, risk_tolerance, currency)
-                    response = safe_generate_content(llm, prompt)
-                    if response:
-                        raw_text = response.text
-                        json_match = re.search(r'```json\s*(\{.*?\})\s*```', raw_text, re.DOTALL)
-                        json_str = json_match.group(1) if json_match else raw_text
-                        data = json.loads(json_str)
-
-                        tool_id = f"tool_{time.time()}"
+                    data = run_service(plan_investment(current_savings, monthly_investment, years_to_goal, risk_tolerance, currency, run_simulation, goal_amount))
+                    if data is not None:
                         title = "Investment Plan"
-                        st.session_state.tool_sessions[tool_id] = {
-                            "title": title,
-                            "tool_type": "✨ Investment Planner", # Fixed inconsistency
-                            "inputs": {'current_savings': current_savings, 'monthly_investment': monthly_investment, 'years_to_goal': years_to_goal, 'risk_tolerance': risk_tolerance, 'currency': currency},
-                            "outputs": data
-                        }
-                        st.session_state.current_tool_id = tool_id
+                        st.session_state.current_tool_id = save_tool_session(title, "✨ Investment Planner", {'current_savings': current_savings, 'monthly_investment': monthly_investment, 'years_to_goal': years_to_goal, 'risk_tolerance': risk_tolerance, 'currency': currency, 'run_simulation': run_simulation, 'goal_amount': goal_amount}, data)
                         
                         st.success("Plan Generated! 💰")
                         
                         st.subheader("Executive Summary")
                         st.markdown(data.get("summary", "N/A"))
 
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.subheader("Recommended Portfolio Breakdown")
-                            portfolio_data = data.get("portfolio_breakdown")
-                            if portfolio_data:
-                                portfolio_df = pd.DataFrame(portfolio_data)
-                                fig = px.pie(portfolio_df, values='percentage', names='asset', title="Asset Allocation", hole=0.4)
-                                fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font_color='var(--text-color)', font_family='Poppins')
-                                fig.update_traces(textposition='inside', textinfo='percent+label', marker=dict(colors=px.colors.sequential.Tealgrn))
-                                st.plotly_chart(fig, use_container_width=True)
-                            else:
-                                st.warning("Portfolio breakdown data is missing.")
+                        with span("render", "investment"):
+                            col1, col2 = st.columns(2)
+                            with col1:
+                                st.subheader("Recommended Portfolio Breakdown")
+                                portfolio_data = data.get("portfolio_breakdown")
+                                if portfolio_data:
+                                    portfolio_df = pd.DataFrame(portfolio_data)
+                                    fig = px.pie(portfolio_df, values='percentage', names='asset', title="Asset Allocation", hole=0.4)
+                                    fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font_color='var(--text-color)', font_family='Poppins')
+                                    fig.update_traces(textposition='inside', textinfo='percent+label', marker=dict(colors=px.colors.sequential.Tealgrn))
+                                    st.plotly_chart(fig, use_container_width=True)
+                                else:
+                                    st.warning("Portfolio breakdown data is missing.")
 
-                        with col2:
-                            st.subheader("Projected Growth Over Time")
-                            growth_data = data.get("projected_growth")
-                            if growth_data:
-                                growth_df = pd.DataFrame(growth_data)
-                                fig = px.line(growth_df, x='year', y='value', title="Hypothetical Account Value", markers=True)
-                                fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font_color='var(--text-color)', font_family='Poppins')
-                                # Fixed the color reference to a hardcoded value that matches the app's theme.
-                                fig.update_traces(line=dict(color='#80CBC4'), marker=dict(color='#80CBC4'))
-                                st.plotly_chart(fig, use_container_width=True)
-                            else:
-                                st.warning("Projected growth data is missing.")
+                            with col2:
+                                st.subheader("Projected Growth Over Time")
+                                growth_data = data.get("projected_growth")
+                                if growth_data:
+                                    growth_df = pd.DataFrame(growth_data)
+                                    fig = px.line(growth_df, x='year', y='value', title=f"Hypothetical Account Value ({data.get('annual_return', 0):.1%} a year)", markers=True)
+                                    fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font_color='var(--text-color)', font_family='Poppins')
+                                    # Fixed the color reference to a hardcoded value that matches the app's theme.
+                                    fig.update_traces(line=dict(color='#80CBC4'), marker=dict(color='#80CBC4'))
+                                    st.plotly_chart(fig, use_container_width=True)
+                                else:
+                                    st.warning("Projected growth data is missing.")
                         
+                            if data.get("monte_carlo"):
+                                display_simulation_results(data["monte_carlo"], currency)
+
                         st.markdown("---")
                         st.subheader("Action Plan")
                         st.markdown(data.get("action_plan", "N/A"))
                         
+                except StructuredOutputError as e:
+                    st.error(f"An error occurred while generating the investment plan: {e}")
+                    st.code(e.text, language="text")
                 except Exception as e:
                     st.error(f"An error occurred while generating the investment plan: {e}")
-                    st.code(raw_text, language="text")
 
 
+def render_metrics_panel():
+    """Debug panel with per-stage latency percentiles, retries and LLM payload sizes for this process."""
+    import pandas as pd
+
+    with st.expander("⏱️ Performance"):
+        stages = metrics.summary(metrics.STAGE_SECONDS)
+        if not stages:
+            st.caption("No timings recorded yet.")
+            return
+        errors = {(row["tool"], row["stage"]): row["count"] for row in metrics.summary(metrics.STAGE_ERRORS)}
+        table = pd.DataFrame([{
+            "tool": row["tool"], "stage": row["stage"], "count": row["count"],
+            "p50 ms": row["p50"] * 1000, "p95 ms": row["p95"] * 1000, "mean ms": row["mean"] * 1000,
+            "errors": errors.get((row["tool"], row["stage"]), 0),
+        } for row in stages])
+        st.dataframe(table, hide_index=True, use_container_width=True)
+        retries = sum(row["count"] for row in metrics.summary(metrics.LLM_RETRIES))
+        prompts = metrics.summary(metrics.LLM_PROMPT_CHARS)
+        responses = metrics.summary(metrics.LLM_RESPONSE_CHARS)
+        mean_prompt = sum(row["sum"] for row in prompts) / max(sum(row["count"] for row in prompts), 1)
+        mean_response = sum(row["sum"] for row in responses) / max(sum(row["count"] for row in responses), 1)
+        st.caption(f"LLM retries: {retries:g} · mean prompt {mean_prompt:,.0f} chars · mean response {mean_response:,.0f} chars")
+        flights = {}
+        for row in metrics.summary(metrics.SINGLEFLIGHT_CALLS):
+            flights.setdefault(row["group"], {})[row["role"]] = row["count"]
+        for group, roles in sorted(flights.items()):
+            followers, total = roles.get("follower", 0), roles.get("follower", 0) + roles.get("leader", 0)
+            st.caption(f"Coalesced {group} calls: {followers:g} of {total:g} ({followers / total:.0%})")
+        parses = {}
+        for row in metrics.summary(metrics.STRUCTURED_PARSES):
+            parses.setdefault(row["builder"], {})[row["outcome"]] = row["count"]
+        for builder, outcomes in sorted(parses.items()):
+            st.caption(f"{builder} JSON: {outcomes.get('parsed', 0):g} parsed · {outcomes.get('repaired', 0):g} repaired · {outcomes.get('failed', 0):g} failed")
+        # The registry is process-wide, so only an operator-enabled panel may wipe it, never a ?debug=1 visitor.
+        if METRICS_PANEL and st.button("Reset timings", use_container_width=True):
+            metrics.get_registry().reset()
+            rerun_fragment()
+
+def format_latency(latency: dict) -> str:
+    """Formats streaming latency stats for display under a chat reply."""
+    parts = []
+    if "time_to_first_token" in latency:
+        parts.append(f"first token in {latency['time_to_first_token']:.2f}s")
+    if "total_latency" in latency:
+        parts.append(f"complete in {latency['total_latency']:.2f}s")
+    return "⚡ " + " · ".join(parts) if parts else ""
+
+@functools.lru_cache(maxsize=CHAT_RENDER_CACHE_SIZE)
+def message_markdown(content: str, latency_caption: str = "") -> str:
+    """Final markdown for one chat bubble, with its latency caption folded into the same element."""
+    return f"{content}\n\n:gray[{latency_caption}]" if latency_caption else content
+
+def render_chat_history(chat: ChatSession, store):
+    """
+    Draws only the latest CHAT_RENDER_WINDOW messages; "Load earlier messages"
+    widens the window, paging from the store past what it keeps in memory.
+    """
+    shown_key = f"shown_{chat.id}"
+    shown = st.session_state.get(shown_key, CHAT_RENDER_WINDOW)
+    messages = list(chat.messages)[-shown:]
+    if len(messages) < shown and messages and messages[0]["seq"] > 0:
+        messages = store.load_earlier(chat.id, messages[0]["seq"], shown - len(messages)) + messages
+    if messages and messages[0]["seq"] > 0:
+        if st.button(f"Load earlier messages ({messages[0]['seq']} more)"):
+            st.session_state[shown_key] = shown + CHAT_RENDER_WINDOW
+            rerun_fragment()
+
+    for message in messages:
+        if message["role"] == "assistant":
+            with st.chat_message(message["role"], avatar=BOT_AVATAR):
+                st.markdown(message_markdown(message["content"], format_latency(message.get("latency") or {})))
+        else:
+            with st.chat_message(message["role"]):
+                st.markdown(message_markdown(message["content"]))
+
+@st.fragment
 def render_chatbot():
+    """The chat pane. Sending a message reruns only this fragment, not the sidebar or page chrome."""
     st.header("🗨️ Chat with LefiBot")
     chat_container = st.container()
     with chat_container:
         # Check if the current chat session exists, if not, re-initialize it
-        if "current_chat_id" not in st.session_state or st.session_state.current_chat_id not in st.session_state.chat_sessions:
-            new_chat_id = f"chat_{time.time()}"
-            st.session_state.current_chat_id = new_chat_id
-            st.session_state.chat_sessions[new_chat_id] = {
-                "title": "New Chat",
-                "messages": [{"role": "assistant", "content": "Hello! I'm LefiBot. How can I help with your finances today?"}]
-            }
-        
-        current_chat = st.session_state.chat_sessions[st.session_state.current_chat_id]
-        
-        for message in current_chat["messages"]:
-            if message["role"] == "assistant":
-                with st.chat_message(message["role"], avatar="https://image.similarpng.com/file/similarpng/very-thumbnail/2021/08/Business-and-financial-logo-design-template-isolated-on-transparent-background-PNG.png"):
-                    st.markdown(message["content"])
-            else:
-                with st.chat_message(message["role"]):
-                    st.markdown(message["content"])
+        store = get_session_store()
+        current_chat = store.get_chat(st.session_state.get("current_chat_id", ""))
+        if current_chat is None:
+            current_chat = start_new_chat("Hello! I'm LefiBot. How can I help with your finances today?")
+
+        render_chat_history(current_chat, store)
     
     prompt = st.chat_input("Ask a finance question...")
     
     if prompt:
-        current_chat["messages"].append({"role": "user", "content": prompt})
+        # Context is taken before the new message is stored, so the question isn't repeated in the history
+        chat_prompt = build_chatbot_prompt(prompt, build_context(current_chat))
+        store.append_message(current_chat.id, "user", prompt)
+        with st.chat_message("user"):
+            st.markdown(prompt)
         
-        if current_chat["title"] == "New Chat":
-            current_chat["title"] = prompt[:40] + "..." if len(prompt) > 40 else prompt
+        renamed = current_chat.title == "New Chat"
+        if renamed:
+            store.rename(current_chat.id, prompt[:40] + "..." if len(prompt) > 40 else prompt)
+
+        # Confidently-classified messages skip the Gemini NLU round trip entirely
+        nlu_data = get_intent_classifier().classify(prompt)
+
+        # Start the answer speculatively so it runs while NLU decides whether to redirect
+        answer_stream = None
+        if nlu_data is None or nlu_route(nlu_data) == ROUTE_CHAT:
+            answer_stream = stream_generate_content(get_model(), chat_prompt)
 
         # Perform NLU to check for redirection
         with st.spinner("Analyzing your request..."):
             try:
-                nlu_response = safe_generate_content(llm, build_nlu_prompt(prompt))
-                if nlu_response:
-                    json_match = re.search(r'```json\s*(\{.*?\})\s*```', nlu_response.text, re.DOTALL)
-                    nlu_data = json.loads(json_match.group(1)) if json_match else {}
-                    
-                    intent = nlu_data.get('intent')
-                    emotion = nlu_data.get('emotion')
-                    
-                    if intent == 'budget_analysis' and emotion in ['stress', 'concern']:
-                        with st.chat_message("assistant", avatar="https://image.similarpng.com/file/similarpng/very-thumbnail/2021/08/Business-and-financial-logo-design-template-isolated-on-transparent-background-PNG.png"):
-                            st.markdown("It sounds like you're concerned about your finances. I can help with that!")
-                            
-                            # Extract expenses to pre-fill the tool
-                            try:
-                                expense_response = safe_generate_content(llm, build_expense_extraction_prompt(prompt))
-                                if expense_response:
-                                    json_match = re.search(r'```json\s*(\{.*?\})\s*```', expense_response.text, re.DOTALL)
-                                    expenses = json.loads(json_match.group(1)) if json_match else {}
-                                    prefilled_expenses_str = ", ".join([f"{key}: {value}" for key, value in expenses.items()])
-                                    st.session_state.prefill_expenses = prefilled_expenses_str
-                            except (json.JSONDecodeError, AttributeError):
-                                st.warning("Could not extract specific numbers, but I can still redirect you.")
-                                st.session_state.prefill_expenses = "Rent: 0, Groceries: 0" # Fallback
-
-                            st.markdown("Would you like to analyze your spending with our **Budget Analyzer** tool? We can get started right away.")
-                            if st.button("Go to Budget Analyzer"):
-                                st.session_state.active_tool_selection = "📈 Budget Analyzer"
-                                st.session_state.current_tool_id = None
-                                st.session_state.selected = "Financial Tools"
-                                st.rerun()
-                            
-                            # Return to stop further chat processing
-                            return
-
-                    elif intent == 'investment_planning':
-                        with st.chat_message("assistant", avatar="https://image.similarpng.com/file/similarpng/very-thumbnail/2021/08/Business-and-financial-logo-design-template-isolated-on-transparent-background-PNG.png"):
-                            st.markdown("That's a great question! I can help you with investment planning.")
-                            st.markdown("Would you like to use our **AI Investment Planner** tool?")
-                            if st.button("Go to Investment Planner"):
-                                st.session_state.active_tool_selection = "✨ Investment Planner"
-                                st.session_state.current_tool_id = None
-                                st.session_state.selected = "Financial Tools"
-                                st.rerun()
-                            return
+                if nlu_data is None:
+                    nlu_started = time.perf_counter()
+                    nlu_data = generate_structured(get_model(), build_nlu_prompt(prompt), "build_nlu_prompt", tool="nlu")
+                    if nlu_data:
+                        log_nlu_label(prompt, nlu_data, time.perf_counter() - nlu_started)
+                nlu_data = nlu_data or {}
+
+                intent = nlu_data.get('intent')
+                emotion = nlu_data.get('emotion')
+
+                if intent == 'budget_analysis' and emotion in ['stress', 'concern']:
+                    if answer_stream:
+                        answer_stream.cancel()
+                    with st.chat_message("assistant", avatar=BOT_AVATAR):
+                        st.markdown("It sounds like you're concerned about your finances. I can help with that!")
+                        
+                        # Extract expenses to pre-fill the tool, asking the LLM only if the local extractor finds none
+                        try:
+                            expenses = user_categorizer().extract_expenses(prompt)
+                            if not expenses:
+                                expenses = generate_structured(get_model(), build_expense_extraction_prompt(prompt), "build_expense_extraction_prompt", tool="expense_extraction")
+                            if expenses is not None:
+                                prefilled_expenses_str = ", ".join([f"{key}: {value}" for key, value in expenses.items()])
+                                st.session_state.prefill_expenses = prefilled_expenses_str
+                        except StructuredOutputError:
+                            st.warning("Could not extract specific numbers, but I can still redirect you.")
+                            st.session_state.prefill_expenses = "Rent: 0, Groceries: 0" # Fallback
+
+                        st.markdown("Would you like to analyze your spending with our **Budget Analyzer** tool? We can get started right away.")
+                        if st.button("Go to Budget Analyzer"):
+                            st.session_state.active_tool_selection = "📈 Budget Analyzer"
+                            st.session_state.current_tool_id = None
+                            st.session_state.selected = "Financial Tools"
+                            st.rerun()
+                        
+                        # Return to stop further chat processing
+                        return
+
+                elif intent == 'investment_planning':
+                    if answer_stream:
+                        answer_stream.cancel()
+                    with st.chat_message("assistant", avatar=BOT_AVATAR):
+                        st.markdown("That's a great question! I can help you with investment planning.")
+                        st.markdown("Would you like to use our **AI Investment Planner** tool?")
+                        if st.button("Go to Investment Planner"):
+                            st.session_state.active_tool_selection = "✨ Investment Planner"
+                            st.session_state.current_tool_id = None
+                            st.session_state.selected = "Financial Tools"
+                            st.rerun()
+                        return
             
-            except (json.JSONDecodeError, AttributeError):
+            except StructuredOutputError:
                 pass # Continue to regular chat if NLU fails
+
+        # A fast-path redirect that fell through to the regular chat has no answer started yet
+        if answer_stream is None:
+            answer_stream = stream_generate_content(get_model(), chat_prompt)
         
-        # If no redirection, proceed with normal chatbot response
-        with st.spinner("LefiBot is thinking..."):
+        # If no redirection, stream the speculative chatbot response into the assistant bubble
+        with st.chat_message("assistant", avatar=BOT_AVATAR):
             try:
-                response = safe_generate_content(llm, build_chatbot_prompt(prompt))
-                if response:
-                    assistant_response = response.text
-                    current_chat["messages"].append({"role": "assistant", "content": assistant_response})
+                assistant_response = st.write_stream(answer_stream)
+                latency = answer_stream.latency
             except Exception as e:
-                error_message = f"Sorry, I encountered an error: {e}"
-                current_chat["messages"].append({"role": "assistant", "content": error_message})
-        st.rerun()
+                assistant_response = f"Sorry, I encountered an error: {e}"
+                latency = {}
+        if assistant_response:
+            store.append_message(current_chat.id, "assistant", assistant_response, latency=latency)
+            schedule_summary(current_chat, store, summarize_chat_async)
+        # A chat's first message renames it, so the sidebar's Recent Chats must be redrawn too
+        if renamed:
+            st.rerun()
+        rerun_fragment()
 
 # --- 4. MAIN APPLICATION LOGIC ---
 
+def history_page(kind: str, page_size: int, empty_message: str) -> list:
+    """
+    Search box for one kind of history, returning the newest-first sessions on the
+    current page. Only one page is ever fetched and drawn, however long the history.
+    """
+    query = st.text_input("Search history", key=f"history_query_{kind}", placeholder="Search titles and content",
+                          label_visibility="collapsed")
+    page_key = f"history_page_{kind}"
+    if st.session_state.get(f"{page_key}_query", "") != query:
+        st.session_state[page_key] = 0  # A new search starts from the first page
+        st.session_state[f"{page_key}_query"] = query
+    page = st.session_state.get(page_key, 0)
+    index = get_history_index()
+    sessions, total = index.page(current_user_id(), kind, query, page * page_size, page_size)
+    if not sessions and page:
+        page = st.session_state[page_key] = max(0, (total - 1) // page_size)  # The last page emptied out
+        sessions, total = index.page(current_user_id(), kind, query, page * page_size, page_size)
+    st.session_state[f"{page_key}_total"] = total
+    if not sessions:
+        st.caption(empty_message if query else "No recent history.")
+    return sessions
+
+def render_history_pager(kind: str, page_size: int):
+    """Previous/next buttons under a history list that spans more than one page."""
+    page_key = f"history_page_{kind}"
+    page = st.session_state.get(page_key, 0)
+    pages = -(-st.session_state.get(f"{page_key}_total", 0) // page_size)
+    if pages <= 1:
+        return
+    col1, col2, col3 = st.columns([0.25, 0.5, 0.25])
+    with col1:
+        if st.button("‹", key=f"{page_key}_prev", disabled=page == 0, use_container_width=True):
+            st.session_state[page_key] = page - 1
+            rerun_fragment()
+    with col2:
+        st.caption(f"Page {page + 1} of {pages}")
+    with col3:
+        if st.button("›", key=f"{page_key}_next", disabled=page >= pages - 1, use_container_width=True):
+            st.session_state[page_key] = page + 1
+            rerun_fragment()
+
+@st.fragment
+def render_sidebar():
+    """
+    Navigation, history and cache stats. Runs as a fragment so browsing history
+    doesn't rerun the page; choices that change the main pane rerun the app.
+    """
+    store = get_session_store()
+    user_id = current_user_id()
+    with st.container():
+        selected = option_menu(
+            menu_title=None,
+            options=["Chat with LefiBot", "Financial Tools"],
+            icons=['chat-dots-fill', 'tools'],
+            menu_icon="cast",
+            default_index=["Chat with LefiBot", "Financial Tools"].index(st.session_state.selected),
+            styles={
+                "container": {"padding": "0!important", "background-color": "#1E1E1E"},
+                "icon": {"color": "#E0E0E0", "font-size": "20px"},
+                "nav-link": {"font-size": "16px", "text-align": "left", "margin": "0px", "--hover-color": "#2C3E50"},
+                "nav-link-selected": {"background-color": "#00796B"},
+            }
+        )
+    if selected != st.session_state.selected:
+        st.session_state.selected = selected
+        st.rerun()
+
+    st.markdown("---")
+
+    if selected == "Chat with LefiBot":
+        # Clear Chat History button
+        if st.button("🗑️ Clear Chat History", use_container_width=True):
+            store.clear(user_id, KIND_CHAT)
+            start_new_chat("Hello! I'm LefiBot. How can I assist you with your finances?")
+            st.rerun()
+
+        st.markdown("##### Recent Chats")
+        for chat in history_page(KIND_CHAT, CHAT_HISTORY_PAGE_SIZE, "No chats match your search."):
+            chat_id, chat_title = chat["id"], chat["title"]
+            col1, col2 = st.columns([0.8, 0.2])
+            with col1:
+                if st.button(chat_title, key=f"select_{chat_id}", use_container_width=True):
+                    st.session_state.current_chat_id = chat_id
+                    st.session_state.selected = "Chat with LefiBot"
+                    st.rerun()
+            with col2:
+                if st.button("🗑️", key=f"delete_{chat_id}", use_container_width=True):
+                    store.delete_session(chat_id)
+                    # If the deleted chat was the current one, switch to the latest remaining (or a new) chat
+                    if st.session_state.current_chat_id == chat_id:
+                        del st.session_state.current_chat_id
+                        st.rerun()
+                    rerun_fragment()
+        render_history_pager(KIND_CHAT, CHAT_HISTORY_PAGE_SIZE)
+
+    if selected == "Financial Tools":
+        with st.expander("Financial Toolkit", expanded=True):
+            tool_selection = st.radio(
+                "Select a Tool",
+                ["💸 Currency Converter", "📈 Budget Analyzer", "🧠 NLU Analysis", "🔮 Spending Insights", "✨ Investment Planner"],
+                key="tool_selector",
+                index=["💸 Currency Converter", "📈 Budget Analyzer", "🧠 NLU Analysis", "🔮 Spending Insights", "✨ Investment Planner"].index(st.session_state.active_tool_selection),
+                label_visibility="collapsed"
+            )
+        if tool_selection != st.session_state.active_tool_selection:
+            st.session_state.active_tool_selection = tool_selection
+            st.rerun()
+        st.markdown("---")
+        # Clear Tool History button
+        if st.button("🗑️ Clear Tool History", use_container_width=True):
+            store.clear(user_id, KIND_TOOL)
+            st.session_state.current_tool_id = None
+            st.rerun()
+
+        st.markdown("##### Recent Searches")
+        for session in history_page(KIND_TOOL, TOOL_HISTORY_PAGE_SIZE, "No recent tool usage."):
+            tool_id = session['id']
+            if st.button(session['title'], key=f"history_{tool_id}", use_container_width=True):
+                st.session_state.current_tool_id = tool_id
+                st.session_state.selected = "Financial Tools"
+                st.session_state.active_tool_selection = session['tool_type']
+                st.session_state.pop("tool_selector", None)  # Let the radio follow the restored tool.
+                st.rerun()
+        render_history_pager(KIND_TOOL, TOOL_HISTORY_PAGE_SIZE)
+
+    st.info("This app uses AI for financial insights.")
+    cache_stats = get_llm_cache().stats()
+    st.caption(f"LLM cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · ~{cache_stats['seconds_saved']:.0f}s saved")
+    if METRICS_PANEL or st.query_params.get("debug") == "1":
+        render_metrics_panel()
+
+@st.fragment
+def render_tool_panel(tool_selection: str):
+    """The active tool. Its widgets rerun only this panel; switching tools reruns the app."""
+    if "Converter" in tool_selection:
+        render_currency_converter()
+    elif "Analyzer" in tool_selection:
+        render_budget_summarizer()
+    elif "NLU" in tool_selection:
+        render_nlu_analysis()
+    elif "Insights" in tool_selection:
+        render_spending_insights()
+    elif "Planner" in tool_selection:
+        render_investment_planner()
+
 def main():
     st.set_page_config(page_title="LefiBot Finance Tools", layout="wide")
+    if METRICS_EXPORTER_PORT:
+        try:
+            metrics.start_http_exporter(METRICS_EXPORTER_PORT, METRICS_EXPORTER_HOST)
+        except OSError as e:
+            print(f"Metrics exporter not started on port {METRICS_EXPORTER_PORT}: {e}", file=sys.stderr)
+    # Static CSS and the header script are sent on full runs only; the sidebar, tool panel and chat are
+    # fragments, so interacting with any of them reruns just that fragment and leaves these in place.
     apply_styles()
     
-    # Initialize session state for all history
-    if "chat_sessions" not in st.session_state:
-        st.session_state.chat_sessions = {}
-        new_chat_id = f"chat_{time.time()}"
-        st.session_state.current_chat_id = new_chat_id
-        st.session_state.chat_sessions[new_chat_id] = {
-            "title": "New Chat",
-            "messages": [{"role": "assistant", "content": "Hello! I'm LefiBot. How can I help with your finances today? I can help you with anything from budgeting to investment planning."}]
-        }
-    if "tool_sessions" not in st.session_state:
-        st.session_state.tool_sessions = {}
+    # Chat and tool history live in the session store; resume the user's latest chat
+    store = get_session_store()
+    user_id = current_user_id()
+    if "current_chat_id" not in st.session_state:
+        recent_chats = store.list_sessions(user_id, KIND_CHAT, limit=1)
+        if recent_chats:
+            st.session_state.current_chat_id = recent_chats[0]["id"]
+        else:
+            start_new_chat("Hello! I'm LefiBot. How can I help with your finances today? I can help you with anything from budgeting to investment planning.")
     if "current_tool_id" not in st.session_state:
         st.session_state.current_tool_id = None
     
@@ -1050,105 +1251,15 @@ def main():
     with st.sidebar:
         st.image("https://marketplace.canva.com/EAGQZhT83lg/1/0/1600w/canva-dark-green-modern-illustrative-finance-service-logo-GTKa2Yxea4Y.jpg", width=80) 
         st.markdown("<h1 style='font-size: 1.8rem; text-align: center;'>LefiBot</h1>", unsafe_allow_html=True)
-        
-        with st.container():
-            selected = option_menu(
-                menu_title=None,
-                options=["Chat with LefiBot", "Financial Tools"],
-                icons=['chat-dots-fill', 'tools'],
-                menu_icon="cast",
-                default_index=["Chat with LefiBot", "Financial Tools"].index(st.session_state.selected),
-                styles={
-                    "container": {"padding": "0!important", "background-color": "#1E1E1E"},
-                    "icon": {"color": "#E0E0E0", "font-size": "20px"},
-                    "nav-link": {"font-size": "16px", "text-align": "left", "margin": "0px", "--hover-color": "#2C3E50"},
-                    "nav-link-selected": {"background-color": "#00796B"},
-                }
-            )
-        
-        st.markdown("---")
-
-        if selected == "Chat with LefiBot":
-            # Clear Chat History button
-            if st.button("🗑️ Clear Chat History", use_container_width=True):
-                st.session_state.chat_sessions = {}
-                new_chat_id = f"chat_{time.time()}"
-                st.session_state.current_chat_id = new_chat_id
-                st.session_state.chat_sessions[new_chat_id] = {
-                    "title": "New Chat",
-                    "messages": [{"role": "assistant", "content": "Hello! I'm LefiBot. How can I assist you with your finances?"}]
-                }
-                st.rerun()
-
-            st.markdown("##### Recent Chats")
-            chat_ids = list(st.session_state.chat_sessions.keys())
-            # Show only the last 5 chats
-            for chat_id in chat_ids[-5:]:
-                chat_title = st.session_state.chat_sessions[chat_id]["title"]
-                col1, col2 = st.columns([0.8, 0.2])
-                with col1:
-                    if st.button(chat_title, key=f"select_{chat_id}", use_container_width=True):
-                        st.session_state.current_chat_id = chat_id
-                        st.session_state.selected = "Chat with LefiBot"
-                        st.rerun()
-                with col2:
-                    if st.button("🗑️", key=f"delete_{chat_id}", use_container_width=True):
-                        del st.session_state.chat_sessions[chat_id]
-                        # If the deleted chat was the current one, switch to a new chat
-                        if st.session_state.current_chat_id == chat_id:
-                            st.session_state.current_chat_id = list(st.session_state.chat_sessions.keys())[-1] if st.session_state.chat_sessions else f"chat_{time.time()}"
-                        st.rerun()
-        
-        tool_selection = None
-        if selected == "Financial Tools":
-            with st.expander("Financial Toolkit", expanded=True):
-                tool_selection = st.radio(
-                    "Select a Tool",
-                    ["💸 Currency Converter", "📈 Budget Analyzer", "🧠 NLU Analysis", "🔮 Spending Insights", "✨ Investment Planner"],
-                    key="tool_selector",
-                    index=["💸 Currency Converter", "📈 Budget Analyzer", "🧠 NLU Analysis", "🔮 Spending Insights", "✨ Investment Planner"].index(st.session_state.active_tool_selection),
-                    label_visibility="collapsed"
-                )
-            st.markdown("---")
-            # Clear Tool History button
-            if st.button("🗑️ Clear Tool History", use_container_width=True):
-                st.session_state.tool_sessions = {}
-                st.session_state.current_tool_id = None
-                st.rerun()
-
-            st.markdown("##### Recent Searches")
-            if not st.session_state.tool_sessions:
-                st.caption("No recent tool usage.")
-            for tool_id in reversed(list(st.session_state.tool_sessions.keys())):
-                session = st.session_state.tool_sessions[tool_id]
-                if st.button(session['title'], key=f"history_{tool_id}", use_container_width=True):
-                    st.session_state.current_tool_id = tool_id
-                    st.session_state.selected = "Financial Tools"
-                    st.session_state.active_tool_selection = session['tool_type']
-                    st.rerun()
-
-        st.info("This app uses AI for financial insights.")
+        render_sidebar()
         st.markdown("<p style='font-size: 0.8rem; text-align: center;'>LefiBot v9.0</p>", unsafe_allow_html=True)
 
     # Main content rendering
     render_header()
 
-    if selected == "Financial Tools":
-        if tool_selection:
-            st.session_state.active_tool_selection = tool_selection
-            st.session_state.selected = "Financial Tools"
-
-            if "Converter" in tool_selection:
-                render_currency_converter()
-            elif "Analyzer" in tool_selection:
-                render_budget_summarizer()
-            elif "NLU" in tool_selection:
-                render_nlu_analysis()
-            elif "Insights" in tool_selection:
-                render_spending_insights()
-            elif "Planner" in tool_selection:
-                render_investment_planner()
-            render_footer()
+    if st.session_state.selected == "Financial Tools":
+        render_tool_panel(st.session_state.active_tool_selection)
+        render_footer()
     else: # Default to chatbot
         render_chatbot()
 
@@ -0,0 +1,206 @@
+"""
+Offline batch runs of the LefiBot tools, e.g. for nightly reports.
+
+    python batch.py requests.jsonl -o results.jsonl --concurrency 8 --rate 2
+
+Each input line is one tool invocation with the inputs the app records in its
+history, for example:
+
+    {"id": "acct-17", "tool": "budget", "inputs": {"income": 50000, "expenses": {"Rent": 15000}}}
+
+`tool` is a name from services.TOOLS or a history label such as "📈 Budget
+Analyzer"; `id` defaults to the line number. Requests run concurrently under a
+global rate limit, and each result is appended to the output as soon as it
+finishes. The output doubles as the checkpoint: rerunning the same command skips
+every id already recorded as "ok" (or "invalid"), so an interrupted run resumes
+without repeating finished work. Failed requests are retried on the next run;
+the latest line for an id wins.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+from llm_async import get_llm_client
+from services import TOOL_TYPES, TOOLS, bind_tool_inputs, json_default
+
+DEFAULT_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+DEFAULT_RATE = float(os.getenv("BATCH_RATE_PER_SECOND", "2"))
+# How long Ctrl-C waits for the batch to cancel its requests and sync the results file.
+INTERRUPT_GRACE_SECONDS = 5
+# Results are fsynced at least this often, so a crash loses little finished work.
+SYNC_INTERVAL = 5.0
+FINISHED_STATUSES = ("ok", "invalid")
+
+
+class RateLimiter:
+    """Async token bucket: at most `rate` acquisitions per second, with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def finished_ids(path: str) -> set:
+    """Ids whose latest recorded status in an existing output file counts as done."""
+    latest = {}
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash.
+            latest[str(record.get("id"))] = record.get("status")
+    return {request_id for request_id, status in latest.items() if status in FINISHED_STATUSES}
+
+
+def read_requests(path: str):
+    """Yields (id, tool name, inputs, parse problem) for each non-blank input line."""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                yield str(number), None, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(request, dict):
+                yield str(number), None, None, f"Expected a JSON object, got {type(request).__name__}"
+                continue
+            request_id = str(request.get("id", number))
+            tool = request.get("tool") or request.get("tool_type")
+            tool = TOOL_TYPES.get(tool, tool) if isinstance(tool, str) else tool
+            if not isinstance(tool, str) or tool not in TOOLS:
+                yield request_id, tool, None, f"Unknown tool '{tool}'"
+                continue
+            inputs = request.get("inputs") or {}
+            if not isinstance(inputs, dict):
+                yield request_id, tool, None, "'inputs' must be a JSON object"
+                continue
+            yield request_id, tool, inputs, None
+
+
+async def run_one(request_id: str, tool: str, inputs: dict, limiter: RateLimiter) -> dict:
+    try:
+        bound = bind_tool_inputs(tool, inputs)
+    except TypeError as e:
+        return {"id": request_id, "tool": tool, "status": "invalid", "error": str(e)}
+    await limiter.acquire()
+    started = time.perf_counter()
+    try:
+        result = await TOOLS[tool](*bound.args, **bound.kwargs)
+    except Exception as e:
+        return {"id": request_id, "tool": tool, "status": "error", "error": f"{type(e).__name__}: {e}",
+                "seconds": round(time.perf_counter() - started, 3)}
+    return {"id": request_id, "tool": tool, "status": "ok", "result": result, "seconds": round(time.perf_counter() - started, 3)}
+
+
+async def run_batch(input_path: str, output_path: str, concurrency: int, rate: float, progress=None) -> dict:
+    """Runs every unfinished request in input_path, appending results to output_path. Returns counts per status."""
+    done = finished_ids(output_path)
+    limiter = RateLimiter(rate, burst=max(1, min(concurrency, int(rate) or 1)))
+    slots = asyncio.Semaphore(concurrency)
+    counts = {"skipped": 0}
+    pending = set()
+    last_sync = time.monotonic()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        def record(result: dict):
+            nonlocal last_sync
+            out.write(json.dumps(result, default=json_default, ensure_ascii=False) + "\n")
+            out.flush()
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            if time.monotonic() - last_sync >= SYNC_INTERVAL:
+                os.fsync(out.fileno())
+                last_sync = time.monotonic()
+            if progress:
+                progress(counts)
+
+        async def worker(request_id, tool, inputs):
+            try:
+                record(await run_one(request_id, tool, inputs, limiter))
+            finally:
+                slots.release()
+
+        try:
+            for request_id, tool, inputs, problem in read_requests(input_path):
+                if request_id in done:
+                    counts["skipped"] += 1
+                    continue
+                if problem:
+                    record({"id": request_id, "tool": tool, "status": "invalid", "error": problem})
+                    continue
+                await slots.acquire()  # Bounds in-flight work, so the input is streamed rather than loaded.
+                task = asyncio.create_task(worker(request_id, tool, inputs))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            for task in pending:
+                task.cancel()
+            out.flush()
+            os.fsync(out.fileno())
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file of tool requests.")
+    parser.add_argument("-o", "--output", help="JSONL results file, also the resume checkpoint (default: <input>.results.jsonl).")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Requests in flight at once.")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Global limit on requests started per second.")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency (or BATCH_CONCURRENCY) must be at least 1.")
+    if not args.rate > 0:
+        parser.error("--rate (or BATCH_RATE_PER_SECOND) must be greater than 0.")
+    output = args.output or os.path.splitext(args.input)[0] + ".results.jsonl"
+
+    def progress(counts):
+        print("\r" + "  ".join(f"{status}: {count}" for status, count in counts.items()), end="", file=sys.stderr, flush=True)
+
+    started, finished = threading.Event(), threading.Event()
+
+    async def batch():
+        started.set()
+        try:
+            return await run_batch(args.input, output, args.concurrency, args.rate, progress)
+        finally:
+            finished.set()
+
+    future = get_llm_client().submit(batch())
+    try:
+        counts = future.result()
+    except KeyboardInterrupt:
+        future.cancel()
+        if started.is_set():
+            finished.wait(INTERRUPT_GRACE_SECONDS)  # The cancelled future doesn't wait for run_batch's cleanup.
+        print(f"\nInterrupted. Finished results are in {output}; rerun the same command to resume.", file=sys.stderr)
+        return 130
+    print(f"\nDone. Results in {output}.", file=sys.stderr)
+    return 0 if not counts.get("error") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
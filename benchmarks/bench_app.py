@@ -0,0 +1,345 @@
+"""
+Latency of every app flow and its helpers, offline, against stub backends.
+
+    python -m benchmarks.bench_app
+    python -m benchmarks.bench_app --llm-latency 0.5 --rate-limit-rate 0.1 --save benchmarks/results/slow.json
+    python -m benchmarks.bench_app --baseline benchmarks/results/main.json
+
+No keys or network are needed: Gemini is replaced by benchmarks.stubs.StubModel
+and ExchangeRate-API by a StubRateServer on localhost, each with the latency and
+error / 429 injection given on the command line. Flows are the render_* pages
+driven headlessly with Streamlit's AppTest (one button click or chat message,
+timed server-side); helpers are prompt building, response parsing and the
+DataFrame / plot construction done on each page. The LLM response cache is
+disabled unless --warm-cache, so every flow pays the stub's latency.
+
+Startup is measured in fresh interpreters: the first render of the chat page
+(startup.first_render) and the import time spent during it (startup.imports),
+with the heaviest top-level imports listed from `python -X importtime`.
+
+Results are saved as JSON (default benchmarks/results/latest.json). With
+--baseline, each case is compared with a previous results file and any case
+whose median is more than --threshold slower is flagged; the exit status is
+then 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RESULTS = os.path.join(ROOT, "benchmarks", "results", "latest.json")
+USER_ID = "bench"
+EXPENSES = {"Rent": 15000.0, "Groceries": 8000.0, "Transport": 3000.0, "Entertainment": 4000.0}
+GOALS = [{"name": "Vacation", "cost": 50000.0, "deadline_months": 6}]
+STARTUP_MARKER = "-- app run --"
+# Case names measure_startup reports, for --only.
+STARTUP_CASES = ("startup.first_render", "startup.imports")
+# Runs in a fresh interpreter; everything imported after the marker is imported by the app's first run.
+STARTUP_SCRIPT = """
+import sys, time
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({app!r}, default_timeout=120)
+app.query_params["uid"] = "bench"
+sys.stderr.write({marker!r} + "\\n")
+started = time.perf_counter()
+app.run()
+print(time.perf_counter() - started)
+"""
+CHAT_MESSAGE = "How much of my 50000 salary should I put into an emergency fund?"
+
+# (case name, tool menu label, button label); None for the chat page.
+FLOWS = [
+    ("flow.currency", "💸 Currency Converter", "➤ Convert"),
+    ("flow.budget", "📈 Budget Analyzer", "➤ Analyze Budget"),
+    ("flow.nlu", "🧠 NLU Analysis", "➤ Analyze Text"),
+    ("flow.insights", "🔮 Spending Insights", "➤ Get Insights"),
+    ("flow.investment", "✨ Investment Planner", "➤ Generate Plan"),
+    ("flow.chat", None, None),
+]
+
+
+def configure(args, directory: str):
+    """Points every backend at the stubs and every data file at a temporary directory. Returns the stubs."""
+    from benchmarks.stubs import StubModel, StubRateServer
+
+    os.environ.update({
+        "GOOGLE_API_KEY": "benchmark",
+        "EXCHANGE_RATE_API_KEY": "benchmark",
+        "SESSION_DB": os.path.join(directory, "sessions.db"),
+        "LLM_CACHE_DB": os.path.join(directory, "llm_cache.db"),
+        "FX_HISTORY_DB": os.path.join(directory, "fx_history.db"),
+        "EXCHANGE_RATE_SNAPSHOT_PATH": os.path.join(directory, "fx_snapshot.json"),
+        "NLU_LOG_PATH": os.path.join(directory, "nlu_log.jsonl"),
+    })
+    sys.path.insert(0, ROOT)
+    import fx_rates
+    import llm_cache
+    import services
+    from services import CURRENCIES
+
+    if not args.warm_cache:
+        for tool in llm_cache.DEFAULT_TTLS:
+            os.environ[f"LLM_CACHE_TTL_{tool.upper()}"] = "0"
+    server = StubRateServer(CURRENCIES, args.rate_latency, error_rate=args.error_rate,
+                            rate_limit_rate=args.rate_limit_rate, seed=args.seed).start()
+    fx_rates.EXCHANGE_RATE_API_URL = os.environ["EXCHANGE_RATE_API_URL"] = server.url
+    model = StubModel(args.llm_latency, jitter=args.llm_latency / 5, error_rate=args.error_rate,
+                      rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    services._model = model
+    return model, server
+
+
+def summarize(timings: list, failures: int = 0) -> dict:
+    ordered = sorted(timings)
+    return {
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "runs": len(ordered),
+        "failures": failures,
+    }
+
+
+# --- Helpers ---
+
+def helper_cases() -> dict:
+    """Zero-argument callables for the per-page helper work, keyed by case name."""
+    import pandas as pd
+    import plotly.express as px
+
+    from benchmarks.stubs import canned_response, stub_rates
+    from categorizer import get_categorizer
+    from fx_rates import RateSnapshot, fetch_latest_rates
+    from projections import project_growth
+    from services import (CURRENCIES, MATRIX_CURRENCIES, build_advanced_currency_prompt, build_budget_summary_prompt,
+                          build_chatbot_prompt, build_currency_matrix, build_expense_extraction_prompt, build_investment_prompt,
+                          build_nlu_prompt, build_spending_insight_prompt, build_transaction_categorization_prompt)
+    from structured_output import SCHEMAS, parse_structured
+
+    projection = project_growth(25000, 5000, 10, "Medium")
+    snapshot = RateSnapshot("USD", stub_rates("USD", CURRENCIES), time.time())
+    today = date.today()
+    currency_data = {"real_time": {"rate": 83.2, "converted_amount": 8320.0},
+                     "historical_trend": [{"date": today - timedelta(days=day), "rate": 83 + day / 100} for day in range(30)]}
+    context = {"summary": "The user earns 50000 a month and rents for 15000.",
+               "history": [{"role": "user", "content": "How do I start investing?"}, {"role": "assistant", "content": canned_response("")}] * 3}
+    prompts = {
+        "build_advanced_currency_prompt": build_advanced_currency_prompt("USD", "INR", 100.0, currency_data, today - timedelta(days=7)),
+        "build_budget_summary_prompt": build_budget_summary_prompt(50000, EXPENSES, "₹"),
+        "build_nlu_prompt": build_nlu_prompt("I'm stressed about my grocery spending and want to save for a vacation."),
+        "build_expense_extraction_prompt": build_expense_extraction_prompt("Rent is 15000 and groceries about 8000."),
+        "build_transaction_categorization_prompt": build_transaction_categorization_prompt(["UBER TRIP", "NETFLIX.COM"], ["Transport", "Entertainment"]),
+        "build_spending_insight_prompt": build_spending_insight_prompt(60000, EXPENSES, GOALS, "₹"),
+        "build_investment_prompt": build_investment_prompt(25000, 5000, 10, "Medium", "₹", projection),
+    }
+    responses = {builder: canned_response(prompts[builder]) for builder in SCHEMAS}
+
+    def currency_trend_frame():
+        frame = pd.DataFrame(currency_data["historical_trend"])
+        frame["date"] = pd.to_datetime(frame["date"], errors="coerce")
+        frame.dropna(subset=["date"], inplace=True)
+        return frame.set_index("date")["rate"]
+
+    def budget_pie():
+        fig = px.pie(values=EXPENSES.values(), names=EXPENSES.keys(), title="Expense Breakdown", hole=0.3)
+        fig.update_layout(showlegend=False, paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)")
+        fig.update_traces(textposition="inside", textinfo="percent+label", marker=dict(colors=px.colors.sequential.Tealgrn))
+        return fig
+
+    def growth_line():
+        fig = px.line(pd.DataFrame(projection["projected_growth"]), x="year", y="value", markers=True)
+        fig.update_traces(line=dict(color="#80CBC4"), marker=dict(color="#80CBC4"))
+        return fig
+
+    def portfolio_pie():
+        return px.pie(pd.DataFrame(projection["portfolio_breakdown"]), values="percentage", names="asset", hole=0.4)
+
+    cases = {
+        "prompt.currency": lambda: build_advanced_currency_prompt("USD", "INR", 100.0, currency_data, today - timedelta(days=7)),
+        "prompt.budget": lambda: build_budget_summary_prompt(50000, EXPENSES, "₹"),
+        "prompt.nlu": lambda: build_nlu_prompt("I'm stressed about my grocery spending."),
+        "prompt.insights": lambda: build_spending_insight_prompt(60000, EXPENSES, GOALS, "₹"),
+        "prompt.investment": lambda: build_investment_prompt(25000, 5000, 10, "Medium", "₹", projection),
+        "prompt.chat": lambda: build_chatbot_prompt(CHAT_MESSAGE, context),
+        "parse.fenced_with_repairs": lambda: parse_structured(
+            "```json\n{'summary_text': 'Fine', 'top_categories': ['Rent',],}\n```", "build_budget_summary_prompt"),
+        "parse.extract_expenses": lambda: get_categorizer().extract_expenses("I spent 15000 on rent, 8000 on groceries and 3000 on uber."),
+        "frame.currency_trend": currency_trend_frame,
+        "plot.budget_pie": budget_pie,
+        "plot.investment_growth": growth_line,
+        "plot.portfolio_pie": portfolio_pie,
+        "fx.fetch_latest_rates": lambda: fetch_latest_rates("benchmark", "USD"),
+        "fx.currency_matrix": lambda: build_currency_matrix(snapshot, "USD", 100.0, MATRIX_CURRENCIES),
+        "fx.currency_matrix_all": lambda: build_currency_matrix(snapshot, "USD", 100.0, list(CURRENCIES)),
+    }
+    for builder, text in responses.items():
+        cases[f"parse.{builder.removeprefix('build_').removesuffix('_prompt')}"] = lambda text=text, builder=builder: parse_structured(text, builder)
+    return cases
+
+
+def measure_helper(function, repeats: int) -> dict:
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()  # Calls per sample so a sample takes at least 0.2s.
+    failures = 0
+    timings = []
+    for _ in range(repeats):
+        try:
+            timings.append(timer.timeit(number) / number)
+        except Exception:
+            failures += 1
+    return summarize(timings or [0.0], failures)
+
+
+# --- Flows ---
+
+def measure_flow(tool: str | None, button: str | None, repeats: int) -> dict:
+    """Times the rerun triggered by a tool's button (or by sending a chat message), repeats times."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    app.query_params["uid"] = USER_ID
+    if tool:
+        app.session_state["selected"] = "Financial Tools"
+        app.session_state["active_tool_selection"] = tool
+    app.run()  # Warm-up: imports, singletons and the page's widgets.
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+
+    timings = []
+    failures = 0
+    for _ in range(repeats):
+        if tool:
+            action = next(widget for widget in app.button if widget.label == button).click()
+        else:
+            action = app.chat_input[0].set_value(CHAT_MESSAGE)
+        started = time.perf_counter()
+        action.run()
+        timings.append(time.perf_counter() - started)
+        failures += bool(app.exception or app.error)
+    return summarize(timings, failures)
+
+
+# --- Startup ---
+
+def parse_importtime(stderr: str) -> list:
+    """(module, self µs, cumulative µs, depth) for each import after the startup marker."""
+    imports = []
+    for line in stderr.split(STARTUP_MARKER, 1)[-1].splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # The header line.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def measure_startup(repeats: int) -> tuple:
+    """({case: result}, heaviest top-level imports of the last run) for cold first renders of the app."""
+    script = STARTUP_SCRIPT.format(root=ROOT, app=os.path.join(ROOT, "app.py"), marker=STARTUP_MARKER)
+    renders, import_totals, failures = [], [], 0
+    heaviest = []
+    for _ in range(repeats):
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", script], capture_output=True, text=True, cwd=ROOT)
+        if completed.returncode:
+            failures += 1
+            continue
+        imports = parse_importtime(completed.stderr)
+        renders.append(float(completed.stdout.strip().splitlines()[-1]))
+        import_totals.append(sum(self_us for _, self_us, _, _ in imports) / 1e6)
+        heaviest = sorted([(name, cumulative) for name, _, cumulative, depth in imports if depth == 0], key=lambda item: -item[1])[:10]
+    cases = {
+        "startup.first_render": summarize(renders or [0.0], failures),
+        "startup.imports": summarize(import_totals or [0.0], failures),
+    }
+    return cases, heaviest
+
+
+# --- Reporting ---
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Names of cases whose median regressed by more than threshold relative to the baseline."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before and before["median_ms"] > 0 and result["median_ms"] > before["median_ms"] * (1 + threshold):
+            regressions.append(name)
+    return regressions
+
+
+def report(results: dict, baseline: dict, regressions: list):
+    print(f"{'case':<34} {'median ms':>10} {'p95 ms':>9} {'runs':>5} {'fail':>5}" + (f" {'baseline':>9} {'change':>8}" if baseline else ""))
+    for name, result in results.items():
+        line = f"{name:<34} {result['median_ms']:>10.3f} {result['p95_ms']:>9.3f} {result['runs']:>5} {result['failures']:>5}"
+        before = baseline.get(name) if baseline else None
+        if before:
+            change = result["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0.0
+            line += f" {before['median_ms']:>9.3f} {change:>+8.1%}" + ("  REGRESSION" if name in regressions else "")
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Stub Gemini latency in seconds.")
+    parser.add_argument("--rate-latency", type=float, default=0.05, help="Stub exchange-rate API latency in seconds.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub calls failing with a server error.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of stub calls answered with 429.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--only", help="Run only cases whose name contains this text, e.g. 'flow.' or 'parse.'.")
+    parser.add_argument("--warm-cache", action="store_true", help="Keep the LLM response cache on (measures cache hits).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", default=DEFAULT_RESULTS, help="Where to write the results JSON.")
+    parser.add_argument("--baseline", help="Results JSON from an earlier run to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown that counts as a regression (0.2 = 20%%).")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    model, server = configure(args, directory)
+    results = {}
+    heaviest_imports = []
+    try:
+        if not args.only or any(args.only in name for name in STARTUP_CASES):
+            startup, heaviest_imports = measure_startup(args.repeats)
+            results.update({name: result for name, result in startup.items() if not args.only or args.only in name})
+        for name, function in helper_cases().items():
+            if not args.only or args.only in name:
+                results[name] = measure_helper(function, args.repeats)
+        for name, tool, button in FLOWS:
+            if not args.only or args.only in name:
+                results[name] = measure_flow(tool, button, args.repeats)
+    finally:
+        server.stop()
+
+    baseline = None
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["cases"]
+        regressions = compare(results, baseline, args.threshold)
+    report(results, baseline, regressions)
+    if heaviest_imports:
+        print("\nHeaviest imports during the first render (cumulative ms):")
+        for name, cumulative_us in heaviest_imports:
+            print(f"  {name:<40} {cumulative_us / 1000:>9.1f}")
+    print(f"\nStub Gemini: {model.faults.stats()}  ·  stub rates API: {server.faults.stats()}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+    with open(args.save, "w", encoding="utf-8") as f:
+        json.dump({"meta": {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                            "args": vars(args)}, "cases": results,
+                   "imports": [{"module": name, "cumulative_ms": cumulative_us / 1000} for name, cumulative_us in heaviest_imports]}, f, indent=2)
+    print(f"Results saved to {args.save}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
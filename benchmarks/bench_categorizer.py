@@ -0,0 +1,93 @@
+"""
+Throughput of the local transaction categorizer.
+
+    python -m benchmarks.bench_categorizer
+    python -m benchmarks.bench_categorizer --rows 1000000 --merchants 5000
+
+Descriptions are drawn from a pool of merchants with varying reference numbers,
+like a real statement. "cold" starts from an empty memo; "warm" re-runs the same
+rows, which is the steady state once a user's merchants have been seen.
+
+Every synthetic merchant is labelled with the category of the keyword it was
+built from, and "accuracy" is the share of rows given that label. Before timing,
+a set of real-looking descriptions (payment-rail prefixes included) is checked
+and the run exits non-zero on any miss.
+"""
+import argparse
+import random
+import time
+
+from categorizer import DEFAULT_KEYWORDS, Categorizer
+from statements import UNCATEGORIZED
+
+LABELLED_EXAMPLES = {
+    "UPI/DR/412233098/SWIGGY/YESB/swiggy@ybl": "Dining",
+    "UPI-ZOMATO LTD-zomato@hdfc-REF 8812": "Dining",
+    "UPI/BLINKIT/commerce": "Groceries",
+    "IMPS/P2A/RENT MAY/LANDLORD": "Rent",
+    "PAYPAL *NETFLIX.COM": "Entertainment",
+    "NEFT DR-HDFC0001-NETFLIX": "Entertainment",
+    "POS 4411 UBER TRIP HELP.UBER.COM": "Transport",
+    "ATM CASH WDL 0091": "Cash",
+    "NEFT TRANSFER TO A SHARMA": "Transfers",
+    "ZELLE PAYMENT TO JOHN": "Transfers",
+    "UPI/9912/p2p": "Transfers",
+}
+
+
+def synthetic_descriptions(rows: int, merchants: int, seed: int = 0) -> tuple:
+    """(descriptions, expected categories); merchants without a keyword are expected to stay uncategorized."""
+    rng = random.Random(seed)
+    keywords = [(word, category) for category, words in DEFAULT_KEYWORDS.items() for word in words]
+    pool = []
+    for _ in range(merchants):
+        if rng.random() < 0.8:
+            word, category = rng.choice(keywords)
+            pool.append((f"{rng.choice(['POS', 'UPI', 'ACH', 'CARD'])} {word.upper()} {rng.choice(['LTD', 'INC', 'LLC', ''])}", category))
+        else:
+            pool.append((f"{''.join(rng.choices('BCDFGKLMNPRSTVZ', k=7))} PVT", UNCATEGORIZED))
+    picks = [rng.choice(pool) for _ in range(rows)]
+    return [f"{merchant} REF{rng.randrange(1000)}" for merchant, _ in picks], [category for _, category in picks]
+
+
+def check_labelled_examples():
+    categories = Categorizer().categorize(list(LABELLED_EXAMPLES))
+    misses = [f"{description!r}: {got} (expected {expected})"
+              for (description, expected), got in zip(LABELLED_EXAMPLES.items(), categories) if got != expected]
+    if misses:
+        raise SystemExit("Miscategorized:\n  " + "\n  ".join(misses))
+
+
+def measure(descriptions: list, labels: list, chunk_rows: int) -> dict:
+    categorizer = Categorizer()
+    llm_batches = []
+    results = {}
+    for phase in ("cold", "warm"):
+        categories = []
+        started = time.perf_counter()
+        for start in range(0, len(descriptions), chunk_rows):
+            categories += categorizer.categorize(descriptions[start:start + chunk_rows], resolve=lambda batch: llm_batches.append(len(batch)) or {})
+        results[phase] = len(descriptions) / (time.perf_counter() - started)
+    results["accuracy"] = sum(got == expected for got, expected in zip(categories, labels)) / len(labels)
+    results["llm_batches"] = len(llm_batches)
+    results["llm_descriptions"] = sum(llm_batches)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--merchants", type=int, default=2000)
+    parser.add_argument("--chunk-rows", type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    check_labelled_examples()
+    print(f"{'rows':>9} {'cold rows/s':>13} {'warm rows/s':>13} {'accuracy':>9} {'LLM batches':>12} {'LLM rows':>9}")
+    for rows in args.rows:
+        result = measure(*synthetic_descriptions(rows, args.merchants), args.chunk_rows)
+        print(f"{rows:>9} {result['cold']:>13,.0f} {result['warm']:>13,.0f} {result['accuracy']:>9.1%} "
+              f"{result['llm_batches']:>12} {result['llm_descriptions']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Rerun time of the chat page as the conversation grows.
+
+    python -m benchmarks.bench_chat_render
+    python -m benchmarks.bench_chat_render --messages 10 100 1000 --reruns 10
+
+Each conversation is written to a temporary session store and the app is rerun
+headlessly with Streamlit's AppTest, once drawing the default window and once
+with the window widened to the whole history (the old behaviour). Timings are
+server-side script time only; the browser's own markdown rendering comes on top
+and grows the same way.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER_ID = "bench"
+REPLY = ("Here is a **short** breakdown:\n\n- Keep an emergency fund of 3-6 months of expenses.\n"
+         "- Automate a monthly SIP into a low-cost index fund.\n- Review subscriptions each quarter.")
+
+
+def populate(store, messages: int) -> str:
+    chat = store.create_chat(USER_ID, title="Benchmark chat")
+    for index in range(messages):
+        if index % 2:
+            store.append_message(chat.id, "assistant", REPLY, latency={"time_to_first_token": 0.4, "total_latency": 1.8})
+        else:
+            store.append_message(chat.id, "user", f"Question number {index} about budgeting?")
+    return chat.id
+
+
+def measure(chat_id: str, shown: int | None, reruns: int) -> float:
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    app.query_params["uid"] = USER_ID
+    app.session_state["current_chat_id"] = chat_id
+    if shown is not None:
+        app.session_state[f"shown_{chat_id}"] = shown
+    app.run()  # Warm-up: imports, cache_resource singletons, first store load.
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    timings = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--reruns", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    os.environ["SESSION_DB"] = os.path.join(directory, "sessions.db")
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ.setdefault("EXCHANGE_RATE_API_KEY", "benchmark")
+    sys.path.insert(0, ROOT)
+    from session_store import get_session_store
+
+    store = get_session_store()
+    print(f"{'messages':>9} {'windowed ms':>12} {'full ms':>9}")
+    for messages in args.messages:
+        chat_id = populate(store, messages)
+        windowed = measure(chat_id, None, args.reruns)
+        full = measure(chat_id, messages + 1, args.reruns)
+        print(f"{messages:>9} {windowed * 1000:>12.1f} {full * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
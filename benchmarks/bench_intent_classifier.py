@@ -0,0 +1,109 @@
+"""
+Measures how often the local intent classifier agrees with logged Gemini NLU
+labels, how many messages it answers without the LLM, and the latency saved.
+The "untrained_" rows score the same test messages with no training, i.e. the
+keyword rules alone, which is what a fresh deployment answers with.
+
+    python -m benchmarks.bench_intent_classifier --log nlu_log.jsonl
+    python -m benchmarks.bench_intent_classifier --synthetic 2000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from intent_classifier import NLU_LOG_PATH, IntentClassifier, nlu_route, read_nlu_log
+
+_SYNTHETIC_TEMPLATES = [
+    ("I'm so stressed about my {thing} spending this month", "budget_analysis", "stress"),
+    ("I'm worried I can't afford {thing} and rent anymore", "budget_analysis", "concern"),
+    ("Help me budget, my {thing} bills keep going up", "budget_analysis", "concern"),
+    ("Should I invest in {asset} or keep cash?", "investment_planning", "curiosity"),
+    ("How should I build a portfolio of {asset} for retirement?", "investment_planning", "optimism"),
+    ("What is the difference between {asset} and a savings account?", "querying data", "curiosity"),
+    ("What is the difference between stocks and bonds?", "querying data", "curiosity"),
+    ("Explain what an {account} is", "querying data", "curiosity"),
+    ("What is a SIP?", "querying data", "curiosity"),
+    ("Can you explain how {topic} works?", "seeking advice", "curiosity"),
+    ("Thanks, that explanation of {topic} was really helpful!", "expressing gratitude", "joy"),
+    ("What does {topic} mean on my credit report?", "querying data", "neutral"),
+]
+_FILLERS = {
+    "thing": ["grocery", "dining out", "electricity", "phone", "streaming", "fuel"],
+    "asset": ["index funds", "bonds", "stocks", "ETFs", "mutual funds", "gold"],
+    "account": ["IRA", "ETF", "index fund", "SIP", "401k"],
+    "topic": ["compound interest", "an emergency fund", "APR", "a credit score", "inflation", "a home loan"],
+}
+
+
+def synthetic_records(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        template, intent, emotion = rng.choice(_SYNTHETIC_TEMPLATES)
+        text = template.format(**{key: rng.choice(values) for key, values in _FILLERS.items()})
+        records.append({'text': text, 'intent': intent, 'emotion': emotion, 'latency': rng.uniform(0.8, 2.5)})
+    return records
+
+
+def run(records: list, threshold: float, train_fraction: float = 0.8, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    records = list(records)
+    rng.shuffle(records)
+    split = int(len(records) * train_fraction)
+    train, test = records[:split], records[split:]
+
+    classifier = IntentClassifier(threshold)
+    for record in train:
+        classifier.learn(record['text'], record)
+
+    results = {'train': len(train), 'test': len(test)}
+    results.update(evaluate(classifier, test))
+    untrained = evaluate(IntentClassifier(threshold), test)
+    results.update({f"untrained_{name}": untrained[name] for name in ('fast_path_coverage', 'route_agreement', 'intent_agreement')})
+    return results
+
+
+def evaluate(classifier: IntentClassifier, test: list) -> dict:
+    answered = agree_route = agree_intent = 0
+    timings = []
+    saved = 0.0
+    for record in test:
+        started = time.perf_counter()
+        labels = classifier.classify(record['text'])
+        timings.append(time.perf_counter() - started)
+        if labels is None:
+            continue
+        answered += 1
+        agree_intent += labels['intent'] == record['intent']
+        agree_route += nlu_route(labels) == nlu_route(record)
+        saved += record.get('latency') or 0.0
+
+    return {
+        'fast_path_coverage': answered / len(test) if test else 0.0,
+        'route_agreement': agree_route / answered if answered else 0.0,
+        'intent_agreement': agree_intent / answered if answered else 0.0,
+        'mean_classify_us': statistics.mean(timings) * 1e6 if timings else 0.0,
+        'p99_classify_us': sorted(timings)[int(len(timings) * 0.99) - 1] * 1e6 if timings else 0.0,
+        'llm_seconds_saved': saved,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default=NLU_LOG_PATH, help="JSONL log of Gemini NLU labels.")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N generated messages instead of the log.")
+    parser.add_argument("--threshold", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    records = synthetic_records(args.synthetic) if args.synthetic else list(read_nlu_log(args.log))
+    if len(records) < 10:
+        parser.error(f"Need at least 10 labelled messages; found {len(records)}. Try --synthetic 2000.")
+
+    classifier_threshold = args.threshold if args.threshold is not None else IntentClassifier().threshold
+    for name, value in run(records, classifier_threshold).items():
+        print(f"{name:>29}: {value:.4f}" if isinstance(value, float) else f"{name:>29}: {value}")
+
+
+if __name__ == "__main__":
+    main()
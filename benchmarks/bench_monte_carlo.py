@@ -0,0 +1,53 @@
+"""
+Throughput and peak memory of the Monte Carlo investment simulation.
+
+    python -m benchmarks.bench_monte_carlo
+    python -m benchmarks.bench_monte_carlo --paths 100000 --years 40 --workers 4
+
+Peak memory is measured with tracemalloc in this process, so with --workers it
+covers only the parent's result array, not the chunks simulated in workers.
+"""
+import argparse
+import time
+import tracemalloc
+
+from projections import simulate_outcomes
+
+
+def measure(paths: int, years: int, chunk_paths: int, workers: int, repeats: int) -> dict:
+    # Warm-up also starts the process pool, which shouldn't count towards throughput.
+    simulate_outcomes(25000, 5000, years, "Medium", goal_amount=1_000_000, paths=min(paths, chunk_paths),
+                      chunk_paths=chunk_paths, workers=workers, seed=0)
+    timings = []
+    peak = 0
+    for repeat in range(repeats):
+        tracemalloc.start()
+        started = time.perf_counter()
+        simulate_outcomes(25000, 5000, years, "Medium", goal_amount=1_000_000, paths=paths,
+                          chunk_paths=chunk_paths, workers=workers, seed=repeat)
+        timings.append(time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    best = min(timings)
+    return {"seconds": best, "paths_per_second": paths / best, "peak_mib": peak / 2 ** 20}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paths", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--years", type=int, default=30)
+    parser.add_argument("--chunk-paths", type=int, nargs="+", default=[1024, 4096, 16384])
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'paths':>8} {'chunk':>7} {'workers':>7} {'seconds':>9} {'paths/s':>12} {'peak MiB':>9}")
+    for paths in args.paths:
+        for chunk_paths in args.chunk_paths:
+            result = measure(paths, args.years, chunk_paths, args.workers, args.repeats)
+            print(f"{paths:>8} {chunk_paths:>7} {args.workers:>7} {result['seconds']:>9.3f} "
+                  f"{result['paths_per_second']:>12,.0f} {result['peak_mib']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
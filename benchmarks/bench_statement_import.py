@@ -0,0 +1,96 @@
+"""
+Throughput and peak memory of the streaming bank-statement import.
+
+    python -m benchmarks.bench_statement_import
+    python -m benchmarks.bench_statement_import --rows 2000000 --format ofx
+
+A synthetic statement is written to a temporary directory and then imported
+from disk, so the numbers include decoding and parsing but not the upload.
+Before timing, a one-month statement is imported with DD/MM, MM/DD, two-digit-year
+and ISO datetime dates to check that each is read as one month.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from statements import summarize_statement
+
+_MERCHANTS = ["Grocery Mart", "City Rent", "Metro Card", "Coffee House", "Electric Co", "Cinema Plex", "Salary"]
+
+
+def write_statement(path: str, rows: int, file_format: str, seed: int = 0):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as out:
+        if file_format == "csv":
+            out.write("Date,Description,Amount\n")
+        else:
+            out.write("OFXHEADER:100\n<OFX><BANKMSGSRSV1><STMTTRS><BANKTRANLIST>\n")
+        for row in range(rows):
+            merchant = rng.choice(_MERCHANTS)
+            amount = rng.uniform(5000, 90000) if merchant == "Salary" else -rng.uniform(10, 5000)
+            day = f"2025-{row % 12 + 1:02d}-{row % 28 + 1:02d}"
+            if file_format == "csv":
+                out.write(f"{day},{merchant} #{row % 97},{amount:.2f}\n")
+            else:
+                out.write(f"<STMTTRN><TRNTYPE>OTHER<DTPOSTED>{day.replace('-', '')}<TRNAMT>{amount:.2f}"
+                          f"<NAME>{merchant} #{row % 97}</STMTTRN>\n")
+        if file_format != "csv":
+            out.write("</BANKTRANLIST></STMTTRS></BANKMSGSRSV1></OFX>\n")
+
+
+def check_date_orders(directory: str):
+    """Imports 31 January rows written day-first and month-first; each must land in one month."""
+    for label, date_format in (("DD/MM/YYYY", "{day:02d}/01/2025"), ("MM/DD/YYYY", "01/{day:02d}/2025"),
+                               ("DD/MM/YY", "{day:02d}/01/25"), ("ISO datetime", "2025-01-{day:02d}T10:00:00")):
+        path = os.path.join(directory, "january.csv")
+        with open(path, "w", encoding="utf-8", newline="") as out:
+            out.write("Date,Description,Amount\n")
+            for day in range(1, 32):
+                out.write(f"{date_format.format(day=day)},Coffee House,-10.00\n")
+        summary = summarize_statement(path, path)
+        expenses = summary.monthly_expenses()
+        if summary.month_count != 1 or expenses != {"Uncategorized": 310.0}:
+            raise SystemExit(f"{label} statement read as {summary.month_count} months with monthly expenses {expenses}")
+
+
+def measure(path: str, chunk_rows: int, repeats: int) -> dict:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        summary = summarize_statement(path, path, chunk_rows=chunk_rows)
+        timings.append(time.perf_counter() - started)
+    # tracemalloc slows parsing several-fold, so memory gets its own untimed pass.
+    tracemalloc.start()
+    summarize_statement(path, path, chunk_rows=chunk_rows)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    best = min(timings)
+    return {"rows": summary.rows, "seconds": best, "rows_per_second": summary.rows / best, "peak_mib": peak / 2 ** 20}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 500_000])
+    parser.add_argument("--format", choices=["csv", "ofx"], nargs="+", default=["csv", "ofx"])
+    parser.add_argument("--chunk-rows", type=int, default=10_000)
+    parser.add_argument("--repeats", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    print(f"{'format':>6} {'rows':>9} {'file MiB':>9} {'seconds':>9} {'rows/s':>12} {'peak MiB':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        check_date_orders(directory)
+        for file_format in args.format:
+            for rows in args.rows:
+                path = os.path.join(directory, f"statement-{rows}.{file_format}")
+                write_statement(path, rows, file_format)
+                result = measure(path, args.chunk_rows, args.repeats)
+                size = os.path.getsize(path) / 2 ** 20
+                print(f"{file_format:>6} {result['rows']:>9} {size:>9.1f} {result['seconds']:>9.3f} "
+                      f"{result['rows_per_second']:>12,.0f} {result['peak_mib']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Local stand-ins for the app's network backends, for offline benchmarks.
+
+StubModel replaces `genai.GenerativeModel`: it answers every prompt builder with
+a canned response that matches its schema. StubRateServer serves the
+ExchangeRate-API `latest` endpoint over HTTP on localhost. Both take a latency
+and the fraction of calls that fail with a server error or are rate limited
+(429), drawn from a seeded generator so runs are repeatable.
+
+    python -m benchmarks.stubs --port 8765 --latency 0.1 --rate-limit-rate 0.05
+
+serves the rate stub on its own; point the app at it with
+EXCHANGE_RATE_API_URL=http://127.0.0.1:8765/v6, or keep the real API first and
+fall back to it with EXCHANGE_RATE_PROVIDERS=exchangerate-api,local,snapshot.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.api_core.exceptions import InternalServerError, ResourceExhausted
+
+CHAT_REPLY = ("A good rule of thumb is the **50/30/20** split: half of your take-home pay for needs, "
+              "30% for wants and 20% for savings. Start with an emergency fund of three to six months "
+              "of expenses, then automate a monthly investment into a low-cost index fund.")
+
+# (marker in the prompt, canned JSON answer); the first marker found wins.
+_JSON_RESPONSES = [
+    ("expert currency analyst", {"real_time_explanation": "The live rate reflects recent market moves.",
+                                 "historical_explanation": "The rate on that day was slightly different."}),
+    ("Analyze the budget", {"summary_text": "Rent is your largest expense; you save about a fifth of your income.",
+                            "top_categories": ["Rent", "Groceries", "Entertainment"]}),
+    ("Natural Language Understanding", {"sentiment": "negative", "sentiment_score": -0.4, "emotion": "stress",
+                                        "intent": "seeking advice", "summary": "The user wants to spend less on groceries.",
+                                        "keywords": ["stressed", "groceries", "save"], "entities": ["groceries"]}),
+    ("Extract financial expense data", {"Rent": 15000, "Groceries": 8000}),
+    ("detailed report", {"executive_summary": "Your spending is healthy overall.", "spending_breakdown": "Rent dominates.",
+                         "needs_vs_wants": "Needs are about 70%.", "red_flags": "None.",
+                         "goal_feasibility": "Both goals are reachable.", "recommendations": "Automate savings."}),
+    ("Certified Financial Planner", {"summary": "Stay the course with a diversified portfolio.",
+                                     "action_plan": "1. Automate the monthly SIP.\n2. Rebalance yearly."}),
+]
+_NUMBERED_LINE_RE = re.compile(r"^\s*(\d+)\. ", re.MULTILINE)
+
+
+def canned_response(prompt: str) -> str:
+    """The stub's answer text for a prompt: schema-valid JSON for the tool builders, prose for chat."""
+    for marker, answer in _JSON_RESPONSES:
+        if marker in prompt:
+            return json.dumps(answer)
+    if "Categorize each bank transaction" in prompt:
+        return json.dumps({number: "Other" for number in _NUMBERED_LINE_RE.findall(prompt)})
+    if "Update the running summary" in prompt:
+        return "The user earns 50000 a month, pays 15000 rent and wants to save for a vacation."
+    return CHAT_REPLY
+
+
+class FaultInjector:
+    """Seeded latency plus server-error / 429 injection shared by both stubs."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> tuple:
+        """(delay in seconds, fault) for the next call; fault is None, 'error' or 'rate_limit'."""
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            roll = self._random.random()
+            if roll < self.rate_limit_rate:
+                self.rate_limited += 1
+                return delay, "rate_limit"
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.errors += 1
+                return delay, "error"
+            return delay, None
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "errors": self.errors, "rate_limited": self.rate_limited}
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubStream:
+    """Async iterator of response chunks, paced like a streaming generation."""
+
+    def __init__(self, text: str, chunk_words: int, chunk_delay: float):
+        words = text.split(" ")
+        self._chunks = [" ".join(words[i:i + chunk_words]) + " " for i in range(0, len(words), chunk_words)]
+        self._chunk_delay = chunk_delay
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for index, chunk in enumerate(self._chunks):
+            if index:
+                await asyncio.sleep(self._chunk_delay)
+            yield StubResponse(chunk)
+
+
+def _fault_exception(fault: str) -> Exception:
+    if fault == "rate_limit":
+        return ResourceExhausted("429 Resource has been exhausted (e.g. check quota). Please retry in 0.1s.")
+    return InternalServerError("500 An internal error has occurred (stub).")
+
+
+class StubModel:
+    """
+    Drop-in for `genai.GenerativeModel` in benchmarks. `latency` is the time to
+    the whole answer (or to the first chunk when streaming); later chunks follow
+    every `chunk_delay` seconds. Rate-limit faults raise the same quota error as
+    the real API, so the client's retry path is exercised too.
+    """
+
+    def __init__(self, latency: float = 0.3, jitter: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 chunk_words: int = 8, chunk_delay: float = 0.02, seed: int = 0, model_name: str = "stub-gemini"):
+        self.model_name = model_name
+        self.faults = FaultInjector(latency, jitter, error_rate, rate_limit_rate, seed)
+        self.chunk_words = chunk_words
+        self.chunk_delay = chunk_delay
+
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        delay, fault = self.faults.draw()
+        time.sleep(delay)
+        if fault:
+            raise _fault_exception(fault)
+        return StubResponse(canned_response(prompt))
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        delay, fault = self.faults.draw()
+        await asyncio.sleep(delay)
+        if fault:
+            raise _fault_exception(fault)
+        text = canned_response(prompt)
+        return StubStream(text, self.chunk_words, self.chunk_delay) if stream else StubResponse(text)
+
+
+def stub_rates(base: str, currencies) -> dict:
+    """Deterministic conversion rates per one unit of base, the same for every run."""
+    per_usd = {code: 1.0 if code == "USD" else round(random.Random(code).uniform(0.1, 150.0), 6) for code in currencies}
+    per_usd.setdefault(base, 1.0)
+    return {code: rate / per_usd[base] for code, rate in per_usd.items()}
+
+
+class StubRateServer:
+    """
+    Serves GET /v6/<key>/latest/<base> on localhost in a background thread. Use as
+    a context manager; `url` is the value for fx_rates.EXCHANGE_RATE_API_URL.
+    """
+
+    def __init__(self, currencies, latency: float = 0.05, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, port: int = 0, seed: int = 0):
+        self.currencies = list(currencies)
+        self.faults = FaultInjector(latency, jitter, error_rate, rate_limit_rate, seed)
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v6"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if len(parts) != 4 or parts[0] != "v6" or parts[2] != "latest":
+                    return self._reply(404, {"result": "error", "error-type": "unsupported-code"})
+                delay, fault = stub.faults.draw()
+                time.sleep(delay)
+                if fault == "rate_limit":
+                    return self._reply(429, {"result": "error", "error-type": "quota-reached"}, {"Retry-After": "1"})
+                if fault == "error":
+                    return self._reply(500, {"result": "error", "error-type": "internal-error"})
+                base = parts[3].upper()
+                self._reply(200, {"result": "success", "base_code": base, "conversion_rates": stub_rates(base, stub.currencies)})
+
+            def _reply(self, status: int, payload: dict, headers: dict = None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StubRateServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-rate-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serves on the calling thread until interrupted."""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    from services import CURRENCIES
+
+    server = StubRateServer(CURRENCIES, args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, port=args.port)
+    print(f"Serving stub exchange rates at {server.url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
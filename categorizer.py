@@ -0,0 +1,220 @@
+"""
+Local spending categorizer for imported transactions and chat messages.
+
+Descriptions are normalised (case, punctuation, reference numbers) and matched
+against keyword tables compiled into trie-shaped regular expressions, user rules
+first and the built-in table second. Results are memoised per raw and normalised
+description, so a statement with a few hundred distinct merchants costs a few
+hundred regex searches however many rows it has. Whatever stays unresolved can
+be handed to an LLM callback in batches, never one row at a time.
+
+Each user keeps their own rules (the app stores them with the rest of their
+history); get_categorizer hands out one shared categorizer per distinct rule
+set, so users without rules share the built-in one and its memo.
+"""
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from statements import UNCATEGORIZED
+
+LLM_BATCH_SIZE = int(os.getenv("CATEGORIZER_LLM_BATCH_SIZE", "100"))
+# Raw descriptions often embed reference numbers, so their memo is bounded and
+# cleared when full; the normalised-merchant memo is what keeps lookups cheap.
+MEMO_SIZE = 200_000
+# Distinct user rule sets kept compiled before the least recently used is dropped.
+CATEGORIZER_CACHE_SIZE = int(os.getenv("CATEGORIZER_CACHE_SIZE", "64"))
+
+# Built-in keyword table. Keywords are matched as whole words on normalised text.
+DEFAULT_KEYWORDS = {
+    "Rent": ["rent", "landlord", "lease", "house rent", "pg rent", "hostel"],
+    "Groceries": ["grocery", "groceries", "supermarket", "bigbasket", "blinkit", "zepto", "dmart", "walmart", "costco",
+                  "aldi", "lidl", "tesco", "kroger", "safeway", "whole foods", "trader joe", "reliance fresh", "more retail"],
+    "Dining": ["restaurant", "cafe", "coffee", "starbucks", "mcdonald", "mcdonalds", "kfc", "domino", "dominos", "pizza",
+               "burger", "subway", "swiggy", "zomato", "uber eats", "doordash", "grubhub", "deliveroo", "bakery", "dining"],
+    "Transport": ["uber", "ola", "lyft", "taxi", "cab", "metro", "bus", "train", "railway", "irctc", "transit", "parking",
+                  "toll", "fastag", "fuel", "petrol", "diesel", "gas station", "shell", "bp", "chevron", "indian oil", "hpcl"],
+    "Utilities": ["electricity", "electric", "power", "water", "gas bill", "utility", "utilities", "broadband", "internet",
+                  "wifi", "airtel", "jio", "vodafone", "verizon", "comcast", "mobile recharge", "recharge", "phone bill"],
+    "Entertainment": ["netflix", "spotify", "prime video", "hotstar", "disney", "hulu", "youtube premium", "cinema",
+                      "movie", "movies", "pvr", "inox", "bookmyshow", "concert", "steam", "playstation", "xbox", "games"],
+    "Shopping": ["amazon", "flipkart", "myntra", "ajio", "meesho", "ebay", "target", "ikea", "mall", "store", "shopping",
+                 "clothing", "apparel", "electronics", "decathlon"],
+    "Health": ["pharmacy", "chemist", "medical", "hospital", "clinic", "doctor", "dental", "apollo", "medplus",
+               "pharmeasy", "cvs", "walgreens", "gym", "fitness", "cult fit"],
+    "Insurance": ["insurance", "lic", "premium", "policybazaar", "geico", "allstate"],
+    "Education": ["school", "college", "university", "tuition", "course", "udemy", "coursera", "books"],
+    "Travel": ["airline", "airlines", "flight", "indigo", "air india", "vistara", "makemytrip", "goibibo", "booking com",
+               "airbnb", "hotel", "expedia", "oyo"],
+    "Loans & EMI": ["emi", "loan", "mortgage", "credit card payment", "card payment", "home loan", "car loan"],
+    "Fees & Charges": ["fee", "fees", "charge", "charges", "penalty", "interest charged", "annual fee", "late fee", "gst"],
+    "Cash": ["atm", "cash withdrawal", "cash wdl", "atw"],
+    "Transfers": ["transfer", "neft", "imps", "rtgs", "upi", "zelle", "venmo", "paypal"],
+}
+# Payment rails rather than merchants: 'UPI/DR/4411/SWIGGY' is Dining, so these
+# categories only apply when nothing else in the description matches.
+RAIL_CATEGORIES = frozenset({"Transfers"})
+
+_NOISE_RE = re.compile(r"[^a-z&]+")
+_AMOUNT_RE = re.compile(r"(?:rs\.?|inr|usd|eur|gbp|[₹$€£])?\s*(\d[\d,]*(?:\.\d+)?)\s*(k|lakhs?|lacs?)?\b", re.IGNORECASE)
+_CLAUSE_SPLIT_RE = re.compile(r"[.;!?\n]|,(?!\d)|\band\b|\bplus\b|\balso\b", re.IGNORECASE)
+_MULTIPLIERS = {"k": 1_000, "lakh": 100_000, "lakhs": 100_000, "lac": 100_000, "lacs": 100_000}
+
+
+def normalize(description: str) -> str:
+    """Lower-cases and strips digits, punctuation and extra spaces: 'UBER *TRIP 8812' -> 'uber trip'."""
+    return " ".join(_NOISE_RE.sub(" ", description.lower()).split())
+
+
+def _trie_pattern(node: dict) -> str:
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    return f"(?:{body})?" if "" in node else body
+
+
+def compile_keywords(keywords: dict) -> tuple:
+    """
+    Compiles {category: [keyword, ...]} into one whole-word regex shaped like a
+    trie (shared prefixes are matched once) plus a keyword -> category lookup.
+    """
+    lookup = {}
+    trie = {}
+    for category, words in keywords.items():
+        for word in words:
+            word = normalize(word)
+            if not word or word in lookup:
+                continue
+            lookup[word] = category
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[""] = {}
+    if not lookup:
+        return None, lookup
+    return re.compile(r"\b(" + _trie_pattern(trie) + r")\b"), lookup
+
+
+def _remember(memo: dict, key: str, category: str):
+    if len(memo) >= MEMO_SIZE:
+        memo.clear()
+    memo[key] = category
+
+
+class Categorizer:
+    """
+    Keyword/rule categorizer with memoisation and batched LLM fallback. user_rules
+    ({category: [keyword, ...]}) win over the built-in table and are fixed for the
+    categorizer's lifetime, so one instance can be shared by every user with them.
+    """
+
+    def __init__(self, user_rules: dict = None, keywords: dict = None):
+        self.user_rules = {category: list(words) for category, words in (user_rules or {}).items() if words}
+        self._user_index = compile_keywords(self.user_rules)
+        self._default_index = compile_keywords(keywords or DEFAULT_KEYWORDS)
+        self._memo = {}
+        self._keys = {}
+
+    def match(self, text: str) -> str | None:
+        """
+        Category of the first keyword found in already-normalised text, or None.
+        RAIL_CATEGORIES keywords are skipped while any other keyword matches
+        anywhere in the text; the first of them counts only when none does.
+        """
+        rail = None
+        for pattern, lookup in (self._user_index, self._default_index):
+            if pattern is not None:
+                for found in pattern.finditer(text):
+                    category = lookup[found.group(1)]
+                    if category not in RAIL_CATEGORIES:
+                        return category
+                    rail = rail or category
+        return rail
+
+    @property
+    def categories(self) -> list:
+        """Every category a description can be given, user categories included."""
+        return list(dict.fromkeys(list(DEFAULT_KEYWORDS) + list(self.user_rules) + [UNCATEGORIZED]))
+
+    def categorize(self, descriptions: list, resolve=None) -> list:
+        """
+        Categories for a batch of transaction descriptions. resolve, if given, is
+        called with lists of up to LLM_BATCH_SIZE unresolved descriptions and
+        returns {description: category}, or None if it failed.
+        """
+        memo, keys = self._memo, self._keys
+        resolved = {}
+        pending = {}
+        for description in dict.fromkeys(descriptions):
+            category = memo.get(description)
+            if category is None:
+                key = normalize(description)
+                category = keys.get(key) or self.match(key)
+                if category is None:
+                    pending.setdefault(key, []).append(description)
+                    continue
+                _remember(keys, key, category)
+                _remember(memo, description, category)
+            resolved[description] = category
+
+        if pending and resolve is not None:
+            allowed = set(self.categories)
+            unresolved = list(pending)
+            for start in range(0, len(unresolved), LLM_BATCH_SIZE):
+                batch = unresolved[start:start + LLM_BATCH_SIZE]
+                samples = [pending[key][0] for key in batch]
+                answers = resolve(samples)
+                if answers is None:
+                    continue  # Left unmemoised so a later import can retry.
+                for key, sample in zip(batch, samples):
+                    category = answers.get(sample)
+                    category = category if category in allowed else UNCATEGORIZED
+                    _remember(keys, key, category)
+                    for description in pending[key]:
+                        resolved[description] = category
+                        _remember(memo, description, category)
+        return [resolved.get(description, UNCATEGORIZED) for description in descriptions]
+
+    def extract_expenses(self, text: str) -> dict:
+        """
+        Pulls 'category: amount' pairs out of a chat message such as "My rent is
+        15k and I spend 8,000 on groceries". Each clause contributes when it has
+        exactly one recognisable category and an amount.
+        """
+        expenses = {}
+        for clause in _CLAUSE_SPLIT_RE.split(text):
+            amount = _AMOUNT_RE.search(clause)
+            if not amount:
+                continue
+            category = self.match(normalize(clause))
+            if category is None:
+                continue
+            value = float(amount.group(1).replace(",", "")) * _MULTIPLIERS.get((amount.group(2) or "").lower(), 1)
+            expenses[category] = expenses.get(category, 0.0) + value
+        return expenses
+
+
+def _rules_key(user_rules: dict) -> str:
+    """Canonical form of a rule set, so equal rules share one categorizer."""
+    return json.dumps({category: words for category, words in (user_rules or {}).items() if words})
+
+
+_categorizers = OrderedDict()
+_categorizers_lock = threading.Lock()
+
+
+def get_categorizer(user_rules: dict = None) -> Categorizer:
+    """Returns the shared categorizer for a user's rules (the built-in table alone if there are none)."""
+    key = _rules_key(user_rules)
+    with _categorizers_lock:
+        categorizer = _categorizers.get(key)
+        if categorizer is None:
+            categorizer = Categorizer(user_rules)
+        _categorizers[key] = categorizer
+        _categorizers.move_to_end(key)
+        while len(_categorizers) > CATEGORIZER_CACHE_SIZE:
+            _categorizers.popitem(last=False)
+        return categorizer
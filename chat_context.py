@@ -0,0 +1,99 @@
+"""
+Bounded conversation context for the chatbot prompt.
+
+Each turn gets at most CHAT_CONTEXT_TOKENS of context: a rolling summary of the
+older conversation plus as many of the latest messages, verbatim, as fit. Older
+messages are folded into the summary in the background after a reply, a batch
+at a time, and the summary is stored with the chat session. Prompt size, and
+with it latency, therefore stops growing with the length of the conversation.
+"""
+import os
+import threading
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))
+# Latest messages always kept verbatim (never summarised away).
+VERBATIM_MESSAGES = int(os.getenv("CHAT_VERBATIM_MESSAGES", "6"))
+# Older messages are folded into the summary once at least this many are waiting...
+SUMMARY_BATCH_MESSAGES = 8
+# ...and at most this many per summarisation call.
+MAX_FOLD_MESSAGES = 40
+# Rough characters per token for English text; close enough for budgeting.
+CHARS_PER_TOKEN = 4
+
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    limit = max(tokens, 0) * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + " …"
+
+
+def build_context(chat, budget: int = CONTEXT_TOKEN_BUDGET) -> dict:
+    """
+    Context for the next prompt: {'summary', 'history', 'tokens'}, where history
+    is the newest not-yet-summarised messages, oldest first, within the budget.
+    The summary may use at most half the budget.
+    """
+    summary = truncate_to_tokens(chat.data.get("summary", ""), budget // 2)
+    summarized_through = chat.data.get("summarized_through", 0)
+    remaining = budget - (estimate_tokens(summary) if summary else 0)
+    history = []
+    for message in reversed(list(chat.messages)):
+        if message["seq"] < summarized_through:
+            break
+        cost = estimate_tokens(message["content"])
+        if cost > remaining:
+            if not history and remaining > 0:
+                history.append({"role": message["role"], "content": truncate_to_tokens(message["content"], remaining)})
+                remaining = 0
+            break
+        history.append({"role": message["role"], "content": message["content"]})
+        remaining -= cost
+    history.reverse()
+    return {"summary": summary, "history": history, "tokens": budget - remaining}
+
+
+def format_history(history: list) -> str:
+    return "\n".join(f"{'User' if message['role'] == 'user' else 'LefiBot'}: {message['content']}" for message in history)
+
+
+def schedule_summary(chat, store, summarize) -> bool:
+    """
+    Folds messages older than the verbatim tail into the chat's rolling summary
+    once enough are waiting. summarize(previous_summary, messages) must return a
+    concurrent.futures.Future of the new summary text; the result is stored when
+    it completes. Returns True if a summarisation was started.
+    """
+    start = chat.data.get("summarized_through", 0)
+    end = min(chat.total - VERBATIM_MESSAGES, start + MAX_FOLD_MESSAGES)
+    if end - start < SUMMARY_BATCH_MESSAGES:
+        return False
+    with _in_flight_lock:
+        if chat.id in _in_flight:
+            return False
+        _in_flight.add(chat.id)
+
+    def store_summary(future):
+        try:
+            summary = future.result()
+            if summary and summary.strip():
+                store.update_data(chat.id, summary=summary.strip(), summarized_through=end)
+        except Exception:
+            pass  # Keep the previous summary; the next reply retries with a larger batch.
+        finally:
+            with _in_flight_lock:
+                _in_flight.discard(chat.id)
+
+    try:
+        messages = store.load_range(chat.id, start, end)
+        summarize(chat.data.get("summary", ""), messages).add_done_callback(store_summary)
+    except Exception:
+        with _in_flight_lock:
+            _in_flight.discard(chat.id)
+        raise
+    return True
@@ -0,0 +1,193 @@
+"""
+On-disk store of daily historical exchange rates, keyed by (base, quote, date).
+
+Rates are kept per base currency; any other pair is derived from a shared base
+series, so one backfilled USD table is enough to serve every pair in
+`CURRENCIES`. Run `python fx_history.py backfill rates.csv` to load snapshots.
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+from fx_rates import DEFAULT_BASE_CURRENCY
+
+DEFAULT_DB_PATH = os.getenv("FX_HISTORY_DB", "fx_history.db")
+BACKFILL_BATCH_SIZE = 5000
+# How far back rate_on() looks for the closest earlier quote (weekends, holidays).
+MAX_LOOKBACK_DAYS = 7
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rates (
+    base TEXT NOT NULL,
+    quote TEXT NOT NULL,
+    day TEXT NOT NULL,
+    rate REAL NOT NULL,
+    PRIMARY KEY (base, quote, day)
+) WITHOUT ROWID;
+"""
+
+
+def _as_day(value) -> str:
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    return datetime.strptime(str(value).strip()[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
+
+
+class HistoricalRateStore:
+    """SQLite-backed time series of daily rates, safe to share across sessions."""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._last_recorded = None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Writes ---
+
+    def upsert_rates(self, base: str, day, rates: dict):
+        """Stores one day's table of `base`→quote rates."""
+        day = _as_day(day)
+        rows = [(base, quote, day, float(rate)) for quote, rate in rates.items()]
+        rows.append((base, base, day, 1.0))
+        self._write(rows)
+
+    def record_snapshot(self, snapshot):
+        """Stores a live `RateSnapshot` as that day's rates, once per snapshot."""
+        key = (snapshot.base, snapshot.fetched_at)
+        if key == self._last_recorded:
+            return
+        day = datetime.fromtimestamp(snapshot.fetched_at, tz=timezone.utc).date()
+        self.upsert_rates(snapshot.base, day, snapshot.rates)
+        self._last_recorded = key
+
+    def backfill_csv(self, file, base: str = None) -> int:
+        """
+        Bulk-loads rates from a CSV file path or text stream. Accepts either long
+        format (`date,base,quote,rate`) or wide format (`date,[base,]EUR,INR,...`,
+        with `base` given per row or as an argument). Returns rows written.
+        """
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, newline='', encoding='utf-8') as handle:
+                return self.backfill_csv(handle, base=base)
+
+        reader = csv.DictReader(file)
+        fields = [name.strip().lower() for name in reader.fieldnames or []]
+        long_format = {'date', 'base', 'quote', 'rate'} <= set(fields)
+        if 'date' not in fields:
+            raise ValueError("Historical rate CSV needs a 'date' column.")
+
+        written, batch, seen_days = 0, [], set()
+        for row in reader:
+            row = {key.strip(): value for key, value in row.items() if key}
+            lowered = {key.lower(): value for key, value in row.items()}
+            day = _as_day(lowered['date'])
+            if long_format:
+                row_base = lowered['base'].strip().upper()
+                batch.append((row_base, lowered['quote'].strip().upper(), day, float(lowered['rate'])))
+            else:
+                row_base = (lowered.get('base') or base or DEFAULT_BASE_CURRENCY).strip().upper()
+                for column, value in row.items():
+                    if column.lower() in ('date', 'base') or value in (None, ''):
+                        continue
+                    batch.append((row_base, column.strip().upper(), day, float(value)))
+            if (row_base, day) not in seen_days:
+                seen_days.add((row_base, day))
+                batch.append((row_base, row_base, day, 1.0))
+            if len(batch) >= BACKFILL_BATCH_SIZE:
+                written += self._write(batch)
+                batch = []
+        if batch:
+            written += self._write(batch)
+        return written
+
+    def _write(self, rows: list) -> int:
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO rates (base, quote, day, rate) VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    # --- Reads ---
+
+    def _bases(self) -> list:
+        with self._lock:
+            bases = [row[0] for row in self._conn.execute("SELECT DISTINCT base FROM rates")]
+        # Prefer the configured base so derived series are consistent with live rates.
+        return sorted(bases, key=lambda b: b != DEFAULT_BASE_CURRENCY)
+
+    def series(self, from_currency: str, to_currency: str, start, end) -> list:
+        """
+        Daily from_currency→to_currency rates between start and end (inclusive),
+        as the `[{"date": ..., "rate": ...}]` list `display_currency_results` plots.
+        """
+        start, end = _as_day(start), _as_day(end)
+        for base in self._bases():
+            with self._lock:
+                rows = self._conn.execute(
+                    """
+                    SELECT a.day, b.rate / a.rate FROM rates a
+                    JOIN rates b ON b.base = a.base AND b.day = a.day AND b.quote = ?
+                    WHERE a.base = ? AND a.quote = ? AND a.day BETWEEN ? AND ?
+                    ORDER BY a.day
+                    """,
+                    (to_currency, base, from_currency, start, end),
+                ).fetchall()
+            if rows:
+                return [{"date": day, "rate": rate} for day, rate in rows]
+        return []
+
+    def rate_on(self, from_currency: str, to_currency: str, day) -> dict | None:
+        """The rate on `day`, or on the closest earlier stored day within the lookback window."""
+        day = datetime.strptime(_as_day(day), '%Y-%m-%d').date()
+        points = self.series(from_currency, to_currency, day - timedelta(days=MAX_LOOKBACK_DAYS), day)
+        return points[-1] if points else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoricalRateStore:
+    """Returns the process-wide historical rate store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoricalRateStore()
+        return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local historical exchange-rate store.")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to the SQLite database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser("backfill", help="Load one or more CSV snapshots.")
+    backfill.add_argument("files", nargs="+")
+    backfill.add_argument("--base", help="Base currency for wide-format files without a base column.")
+
+    query = commands.add_parser("series", help="Print a derived daily series.")
+    query.add_argument("from_currency")
+    query.add_argument("to_currency")
+    query.add_argument("--days", type=int, default=30)
+
+    args = parser.parse_args(argv)
+    store = HistoricalRateStore(args.db)
+    if args.command == "backfill":
+        for path in args.files:
+            print(f"{path}: {store.backfill_csv(path, base=args.base)} rows")
+    else:
+        end = date.today() - timedelta(days=1)
+        for point in store.series(args.from_currency.upper(), args.to_currency.upper(), end - timedelta(days=args.days - 1), end):
+            print(f"{point['date']}  {point['rate']:.6f}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Process-wide exchange-rate table shared by every Streamlit session.
+
+One base-currency snapshot is fetched per TTL window and every pair in
+`CURRENCIES` is derived from it locally by triangulation through the base.
+
+Snapshots come from a chain of providers tried in order (EXCHANGE_RATE_PROVIDERS):
+ExchangeRate-API, a local HTTP stand-in with the same API (such as
+`python -m benchmarks.stubs`) and a snapshot file that every successful fetch
+refreshes. Each call has a timeout and each provider sits behind a circuit
+breaker, so during an outage a refresh costs at most one timeout per provider
+and then skips the failing ones until their breaker's cool-down has passed.
+"""
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from metrics import FX_PROVIDER_CALLS, increment
+from singleflight import SingleFlight
+
+EXCHANGE_RATE_API_URL = os.getenv("EXCHANGE_RATE_API_URL", "https://v6.exchangerate-api.com/v6")
+DEFAULT_BASE_CURRENCY = os.getenv("EXCHANGE_RATE_BASE_CURRENCY", "USD")
+# How long a snapshot is considered fresh before a refresh is attempted.
+DEFAULT_TTL_SECONDS = float(os.getenv("EXCHANGE_RATE_TTL_SECONDS", "3600"))
+# How long the last good snapshot may still be served while refreshes fail.
+DEFAULT_MAX_STALENESS_SECONDS = float(os.getenv("EXCHANGE_RATE_MAX_STALENESS_SECONDS", "86400"))
+# Minimum gap between refresh attempts once a refresh has failed.
+DEFAULT_RETRY_INTERVAL_SECONDS = float(os.getenv("EXCHANGE_RATE_RETRY_INTERVAL_SECONDS", "60"))
+# Providers tried in order; any of "exchangerate-api", "local" and "snapshot".
+DEFAULT_PROVIDERS = os.getenv("EXCHANGE_RATE_PROVIDERS", "exchangerate-api,snapshot")
+EXCHANGE_RATE_LOCAL_URL = os.getenv("EXCHANGE_RATE_LOCAL_URL", "http://127.0.0.1:8765/v6")
+EXCHANGE_RATE_SNAPSHOT_PATH = os.getenv("EXCHANGE_RATE_SNAPSHOT_PATH", "fx_snapshot.json")
+# Seconds to connect and, separately, between bytes of the response.
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("EXCHANGE_RATE_TIMEOUT_SECONDS", "5"))
+# Consecutive failures that open a provider's circuit, and how long it stays open.
+DEFAULT_BREAKER_FAILURES = int(os.getenv("EXCHANGE_RATE_BREAKER_FAILURES", "3"))
+DEFAULT_BREAKER_RESET_SECONDS = float(os.getenv("EXCHANGE_RATE_BREAKER_RESET_SECONDS", "60"))
+
+
+class RateUnavailableError(Exception):
+    """Raised when no usable exchange-rate snapshot is available."""
+
+
+@dataclass(frozen=True)
+class RateSnapshot:
+    """Rates quoted as units of each currency per one unit of `base`."""
+    base: str
+    rates: dict
+    fetched_at: float
+
+    def age(self, now: float = None) -> float:
+        return (now if now is not None else time.time()) - self.fetched_at
+
+    def cross_rate(self, from_currency: str, to_currency: str) -> float:
+        """Triangulates from_currency→to_currency through the snapshot's base currency."""
+        try:
+            from_rate = self.rates[from_currency]
+            to_rate = self.rates[to_currency]
+        except KeyError as e:
+            raise RateUnavailableError(f"No rate for {e.args[0]} in the {self.base} snapshot.") from None
+        return to_rate / from_rate
+
+    def cross_rate_matrix(self, currencies: list):
+        """
+        N×N NumPy array whose [i, j] entry is units of currencies[j] per one unit of
+        currencies[i], triangulated through the base in one vectorized division.
+        """
+        import numpy as np  # Only the multi-currency view needs NumPy.
+
+        missing = [code for code in currencies if code not in self.rates]
+        if missing:
+            raise RateUnavailableError(f"No rate for {', '.join(missing)} in the {self.base} snapshot.")
+        per_base = np.array([self.rates[code] for code in currencies], dtype=float)
+        return per_base[np.newaxis, :] / per_base[:, np.newaxis]
+
+
+def _parse_latest(data: dict, base: str, fetched_at: float) -> RateSnapshot:
+    """A RateSnapshot from an ExchangeRate-API `latest` payload (also the snapshot file's format)."""
+    if data.get("result") != "success":
+        raise RateUnavailableError(f"API Error: {data.get('error-type', 'Unknown error')}")
+    try:
+        return RateSnapshot(base=data.get("base_code", base), rates=data["conversion_rates"], fetched_at=fetched_at)
+    except KeyError:
+        raise RateUnavailableError("API Response Error: The API response format was unexpected.") from None
+
+
+def fetch_latest_rates(api_key: str, base: str, timeout: float = DEFAULT_TIMEOUT_SECONDS, url: str = None) -> RateSnapshot:
+    """Fetches the full table of latest rates for `base` from ExchangeRate-API (or a server with the same API at `url`)."""
+    import requests  # Deferred to the first refresh to keep startup light.
+
+    response = requests.get(f"{url or EXCHANGE_RATE_API_URL}/{api_key}/latest/{base}", timeout=timeout)
+    response.raise_for_status()
+    return _parse_latest(response.json(), base, time.time())
+
+
+def rebase(snapshot: RateSnapshot, base: str) -> RateSnapshot:
+    """The same rates quoted per one unit of `base`."""
+    if snapshot.base == base:
+        return snapshot
+    pivot = snapshot.cross_rate(snapshot.base, base)
+    return RateSnapshot(base=base, rates={code: rate / pivot for code, rate in snapshot.rates.items()}, fetched_at=snapshot.fetched_at)
+
+
+def write_snapshot_file(path: str, snapshot: RateSnapshot):
+    """Saves a snapshot in the ExchangeRate-API format, replacing the file atomically."""
+    payload = {"result": "success", "base_code": snapshot.base, "time_last_update_unix": snapshot.fetched_at,
+               "conversion_rates": snapshot.rates}
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(temporary, path)
+
+
+# --- Providers ---
+
+class ExchangeRateApiProvider:
+    """ExchangeRate-API, or a local stand-in for it when given a `url`."""
+
+    def __init__(self, api_key: str, url: str = None, timeout: float = DEFAULT_TIMEOUT_SECONDS, name: str = "exchangerate-api"):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = timeout
+        self.name = name
+
+    def fetch(self, base: str) -> RateSnapshot:
+        return fetch_latest_rates(self.api_key, base, self.timeout, self.url)
+
+
+class SnapshotFileProvider:
+    """
+    The last snapshot saved to a local file, for when no network provider answers.
+    Its rates keep the time they were fetched, so the table reports them as stale.
+    """
+
+    def __init__(self, path: str = EXCHANGE_RATE_SNAPSHOT_PATH, name: str = "snapshot"):
+        self.path = path
+        self.name = name
+
+    def fetch(self, base: str) -> RateSnapshot:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            raise RateUnavailableError(f"No saved exchange rates at {self.path}.") from None
+        fetched_at = data.get("time_last_update_unix") or os.path.getmtime(self.path)
+        return rebase(_parse_latest(data, base, fetched_at), base)
+
+
+class CircuitBreaker:
+    """
+    Closed until `failure_threshold` consecutive failures, then open (calls are
+    skipped) for `reset_timeout` seconds, after which a single trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_BREAKER_FAILURES, reset_timeout: float = DEFAULT_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.opened_at = time.monotonic()  # One trial call per cool-down.
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class ProviderChain:
+    """
+    Tries each provider in order, skipping those whose circuit is open, and
+    returns the first snapshot. `on_fetched(provider, snapshot)` is called after
+    each success, e.g. to refresh the snapshot file.
+    """
+
+    def __init__(self, providers: list, failure_threshold: int = DEFAULT_BREAKER_FAILURES,
+                 reset_timeout: float = DEFAULT_BREAKER_RESET_SECONDS, on_fetched=None):
+        self.providers = list(providers)
+        self.breakers = {provider.name: CircuitBreaker(failure_threshold, reset_timeout) for provider in self.providers}
+        self.on_fetched = on_fetched
+        self.last_errors = {}
+
+    def fetch(self, base: str) -> RateSnapshot:
+        errors = []
+        for provider in self.providers:
+            breaker = self.breakers[provider.name]
+            if not breaker.allow():
+                increment(FX_PROVIDER_CALLS, provider=provider.name, result="skipped")
+                errors.append(f"{provider.name}: circuit open")
+                continue
+            try:
+                snapshot = provider.fetch(base)
+            except Exception as e:
+                breaker.record_failure()
+                increment(FX_PROVIDER_CALLS, provider=provider.name, result="error")
+                self.last_errors[provider.name] = e
+                errors.append(f"{provider.name}: {e}")
+                continue
+            breaker.record_success()
+            increment(FX_PROVIDER_CALLS, provider=provider.name, result="ok")
+            self.last_errors.pop(provider.name, None)
+            if self.on_fetched:
+                self.on_fetched(provider, snapshot)
+            return snapshot
+        raise RateUnavailableError("No exchange-rate provider is available (" + "; ".join(errors) + ").")
+
+
+def build_provider_chain(api_key: str, names: str = DEFAULT_PROVIDERS, snapshot_path: str = EXCHANGE_RATE_SNAPSHOT_PATH) -> ProviderChain:
+    """The chain named in EXCHANGE_RATE_PROVIDERS; live fetches also refresh the snapshot file."""
+    factories = {
+        "exchangerate-api": lambda: ExchangeRateApiProvider(api_key),
+        "local": lambda: ExchangeRateApiProvider(api_key, EXCHANGE_RATE_LOCAL_URL, name="local"),
+        "snapshot": lambda: SnapshotFileProvider(snapshot_path),
+    }
+    providers = []
+    for name in (name.strip() for name in names.split(",")):
+        if name not in factories:
+            raise ValueError(f"Unknown exchange-rate provider '{name}'. Available: {', '.join(factories)}")
+        providers.append(factories[name]())
+
+    def save_snapshot(provider, snapshot: RateSnapshot):
+        if snapshot_path and not isinstance(provider, SnapshotFileProvider):
+            try:
+                write_snapshot_file(snapshot_path, snapshot)
+            except OSError:
+                pass  # The saved copy is only a fallback.
+
+    return ProviderChain(providers, on_fetched=save_snapshot)
+
+
+class RateTable:
+    """
+    TTL-cached base-currency snapshot. Refreshes are single-flight: callers that
+    arrive while one is running share its outcome, so only one caller hits the
+    upstream API per window. Failed refreshes keep serving the last good snapshot
+    until it exceeds `max_staleness`; an offline fallback that is already older
+    than that counts as a failed refresh.
+    """
+
+    def __init__(self, fetcher, base: str = DEFAULT_BASE_CURRENCY, ttl: float = DEFAULT_TTL_SECONDS,
+                 max_staleness: float = DEFAULT_MAX_STALENESS_SECONDS,
+                 retry_interval: float = DEFAULT_RETRY_INTERVAL_SECONDS):
+        self._fetcher = fetcher
+        self.base = base
+        self.ttl = ttl
+        self.max_staleness = max_staleness
+        self.retry_interval = retry_interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._flights = SingleFlight("fx_refresh")
+        self._last_failure_at = 0.0
+        self.last_error = None
+
+    def _is_fresh(self, snapshot, now: float) -> bool:
+        return snapshot is not None and snapshot.age(now) < self.ttl
+
+    def snapshot(self) -> RateSnapshot:
+        """Returns a fresh snapshot, refreshing it if the TTL has expired."""
+        now = time.time()
+        current = self._snapshot
+        if self._is_fresh(current, now):
+            return current
+        return self._flights.do(self.base, self._refresh)
+
+    def _refresh(self) -> RateSnapshot:
+        with self._lock:
+            now = time.time()
+            current = self._snapshot
+            if self._is_fresh(current, now):
+                return current  # Another session's refresh finished just before this one started.
+
+            usable_stale = current is not None and current.age(now) < self.max_staleness
+            if usable_stale and now - self._last_failure_at < self.retry_interval:
+                return current
+
+            try:
+                fresh = self._fetcher(self.base)
+            except Exception as e:
+                self.last_error = e
+                self._last_failure_at = now
+                if usable_stale:
+                    return current
+                if isinstance(e, RateUnavailableError):
+                    raise
+                raise RateUnavailableError(f"Could not refresh exchange rates: {e}") from e
+
+            if fresh.age(now) >= self.max_staleness:
+                self.last_error = RateUnavailableError(
+                    f"The only {self.base} exchange rates available are {fresh.age(now) / 3600:.0f} hours old.")
+                self._last_failure_at = now
+                if usable_stale:
+                    return current
+                raise self.last_error
+            if current is not None and current.fetched_at > fresh.fetched_at:
+                fresh = current  # The fallback is older than what we already serve.
+
+            self._snapshot = fresh
+            self.last_error = None
+            if not self._is_fresh(fresh, now):
+                self._last_failure_at = now  # An offline fallback answered; retry the live providers later.
+            return fresh
+
+    def rate(self, from_currency: str, to_currency: str) -> float:
+        return self.snapshot().cross_rate(from_currency, to_currency)
+
+    def is_stale(self) -> bool:
+        """True when the snapshot being served is older than the TTL."""
+        return self._snapshot is not None and not self._is_fresh(self._snapshot, time.time())
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_rate_table(api_key: str) -> RateTable:
+    """Returns the process-wide rate table for an API key, creating it on first use."""
+    with _tables_lock:
+        table = _tables.get(api_key)
+        if table is None:
+            table = RateTable(build_provider_chain(api_key).fetch)
+            _tables[api_key] = table
+        return table
@@ -0,0 +1,232 @@
+"""
+In-memory search over each user's chat and tool history.
+
+Session titles, chat messages and the text of saved tool inputs and outputs go
+into an inverted index (token -> session ids). A user's index is built from the
+session store on their first search and then kept current by the store's change
+notifications, so a search costs a few set intersections instead of a scan of
+SQLite. Only the most recently searched users' indexes are kept; an evicted
+user's index is rebuilt from the store on their next search. Every query token
+must match; the last one matches as a prefix, so results follow the user while
+they type.
+"""
+import os
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from intent_classifier import tokenize
+from session_store import KIND_CHAT, SessionStore, document_strings, get_session_store
+
+# Users whose index is kept in memory before the least recently searched is dropped.
+DEFAULT_INDEXED_USERS = int(os.getenv("HISTORY_INDEX_USERS", "256"))
+
+
+def _tokens(texts) -> set:
+    return {token for text in texts for token in tokenize(text)}
+
+
+class _UserIndex:
+    """One user's sessions and the postings for their tokens."""
+
+    def __init__(self):
+        self.sessions = {}
+        self.postings = {}
+        self.vocabulary = []  # Sorted, for prefix lookups.
+        self.title_tokens = {}
+        self.content_tokens = {}
+
+    def _post(self, session_id: str, tokens: set):
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                ids = self.postings[token] = set()
+                insort(self.vocabulary, token)
+            ids.add(session_id)
+
+    def _unpost(self, session_id: str, tokens: set):
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(session_id)
+            if not ids:
+                del self.postings[token]
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+
+    def add_session(self, session: dict, texts: list):
+        session_id = session["id"]
+        self.sessions[session_id] = session
+        self.title_tokens[session_id] = _tokens([session["title"]])
+        self.content_tokens[session_id] = _tokens(texts)
+        self._post(session_id, self.title_tokens[session_id] | self.content_tokens[session_id])
+
+    def add_text(self, session_id: str, text: str, updated: float):
+        new = _tokens([text]) - self.content_tokens[session_id]
+        self.content_tokens[session_id] |= new
+        self._post(session_id, new)
+        self.sessions[session_id]["updated"] = max(self.sessions[session_id]["updated"], updated)
+
+    def retitle(self, session_id: str, title: str):
+        old, new = self.title_tokens[session_id], _tokens([title])
+        self._unpost(session_id, old - new - self.content_tokens[session_id])
+        self._post(session_id, new)
+        self.title_tokens[session_id] = new
+        self.sessions[session_id]["title"] = title
+
+    def remove_session(self, session_id: str):
+        self._unpost(session_id, self.title_tokens.pop(session_id) | self.content_tokens.pop(session_id))
+        del self.sessions[session_id]
+
+    def matching(self, tokens: list) -> set:
+        """Ids of sessions containing every token, the last one as a prefix."""
+        *exact, prefix = tokens
+        candidates = None
+        for token in sorted(exact, key=lambda token: len(self.postings.get(token, ()))):
+            ids = self.postings.get(token)
+            if not ids:
+                return set()
+            candidates = set(ids) if candidates is None else candidates & ids
+        prefixed = set()
+        for position in range(bisect_left(self.vocabulary, prefix), len(self.vocabulary)):
+            token = self.vocabulary[position]
+            if not token.startswith(prefix):
+                break
+            prefixed |= self.postings[token] if candidates is None else self.postings[token] & candidates
+        return prefixed
+
+
+class HistoryIndex:
+    """
+    Paginated, newest-first history listing with full-text search. Listens to a
+    SessionStore for changes; events that arrive while a user's index is being
+    built are replayed onto it, and every event is idempotent.
+    """
+
+    def __init__(self, store: SessionStore, max_users: int = DEFAULT_INDEXED_USERS):
+        self.store = store
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._owners = {}
+        self._loading = 0
+        self._missed = []
+        self._lock = threading.Lock()
+        store.add_listener(self)
+
+    # --- Store notifications ---
+
+    def session_added(self, user_id: str, session: dict, texts: list):
+        with self._lock:
+            if self._loading:
+                self._missed.append(("session_added", user_id, session, texts))
+            index = self._users.get(user_id)
+            if index is not None:
+                self._owners[session["id"]] = user_id
+                index.add_session(dict(session), texts)
+
+    def message_added(self, session_id: str, content: str, updated: float):
+        with self._lock:
+            if self._loading:
+                self._missed.append(("message_added", session_id, content, updated))
+            index = self._users.get(self._owners.get(session_id))
+            if index is not None:
+                index.add_text(session_id, content, updated)
+
+    def session_renamed(self, session_id: str, title: str):
+        with self._lock:
+            if self._loading:
+                self._missed.append(("session_renamed", session_id, title))
+            index = self._users.get(self._owners.get(session_id))
+            if index is not None:
+                index.retitle(session_id, title)
+
+    def session_deleted(self, session_id: str):
+        with self._lock:
+            if self._loading:
+                self._missed.append(("session_deleted", session_id))
+            index = self._users.get(self._owners.pop(session_id, None))
+            if index is not None:
+                index.remove_session(session_id)
+
+    # --- Building ---
+
+    def _user_index(self, user_id: str) -> _UserIndex:
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                self._users.move_to_end(user_id)
+                return index
+            self._loading += 1
+            missed_from = len(self._missed)
+        try:
+            # Read outside our lock: the store notifies while holding its own, so taking it here could deadlock.
+            sessions, messages = self.store.user_history(user_id)
+        except BaseException:
+            with self._lock:
+                self._loading -= 1
+                if not self._loading:
+                    self._missed.clear()
+            raise
+        texts = {session["id"]: [] for session in sessions}
+        for session_id, content in messages:
+            texts[session_id].append(content)
+        with self._lock:
+            self._loading -= 1
+            index = self._users.get(user_id)
+            if index is None:
+                index = self._users[user_id] = _UserIndex()
+                for session in sessions:
+                    data = session.pop("data")
+                    if session["kind"] != KIND_CHAT:
+                        texts[session["id"]] += [session["tool_type"] or ""] + document_strings(data)
+                    self._owners[session["id"]] = user_id
+                    index.add_session(session, texts[session["id"]])
+                while len(self._users) > self.max_users:
+                    _, evicted = self._users.popitem(last=False)
+                    for session_id in evicted.sessions:
+                        self._owners.pop(session_id, None)
+                missed = self._missed[missed_from:]
+            else:
+                missed = []
+            if not self._loading:
+                self._missed.clear()
+        for event, *args in missed:
+            if event == "session_added":
+                if args[0] == user_id and args[1]["id"] not in index.sessions:
+                    self.session_added(*args)
+            elif self._owners.get(args[0]) == user_id:
+                getattr(self, event)(*args)
+        return index
+
+    # --- Queries ---
+
+    def page(self, user_id: str, kind: str, query: str = "", offset: int = 0, limit: int = 10) -> tuple:
+        """
+        (sessions, total matches) for one page, newest first, as store.list_sessions
+        rows. An empty query pages straight from the store's (user, kind, updated) index.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return self.store.list_sessions(user_id, kind, limit, offset), self.store.count_sessions(user_id, kind)
+        index = self._user_index(user_id)
+        with self._lock:
+            matches = [index.sessions[session_id] for session_id in index.matching(tokens)]
+            matches = [session for session in matches if session["kind"] == kind]
+            matches.sort(key=lambda session: session["updated"], reverse=True)
+            rows = [{"id": session["id"], "title": session["title"], "tool_type": session["tool_type"],
+                     "updated": session["updated"]} for session in matches[offset:offset + limit]]
+        return rows, len(matches)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_history_index() -> HistoryIndex:
+    """Returns the process-wide history index over the shared session store."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = HistoryIndex(get_session_store())
+        return _index
+
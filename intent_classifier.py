@@ -0,0 +1,250 @@
+"""
+Local fast-path classifier for the chat NLU labels `render_chatbot` branches on.
+
+Keyword rules catch the clear-cut budget/investment/stress phrasings (questions
+asking what something is are left alone: "What is a SIP?" wants an explanation,
+not the Investment Planner), and a small multinomial Naive Bayes model trained
+on logged Gemini NLU outputs covers the rest. Only predictions above the
+confidence threshold are answered locally; everything else still goes to the
+`build_nlu_prompt` LLM call, whose labels are logged and folded back into the
+model.
+
+The log holds users' raw messages, so it is bounded: once NLU_LOG_PATH reaches
+NLU_LOG_MAX_LINES records it is moved to NLU_LOG_PATH + ".1", replacing the
+previous one. At most twice that many of the most recent messages are kept on
+disk, and older ones are deleted. NLU_LOG_MAX_LINES=0 turns the log off; the
+running classifier still learns from each label, but only until the process
+restarts.
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+NLU_LOG_PATH = os.getenv("NLU_LOG_PATH", "nlu_log.jsonl")
+# Records per log file before it is rotated; see the module docstring.
+NLU_LOG_MAX_LINES = int(os.getenv("NLU_LOG_MAX_LINES", "10000"))
+DEFAULT_CONFIDENCE_THRESHOLD = float(os.getenv("NLU_FAST_PATH_THRESHOLD", "0.9"))
+# Labelled examples a class needs before the model's predictions for it are trusted.
+MIN_CLASS_EXAMPLES = 5
+
+ROUTE_BUDGET = "budget"
+ROUTE_INVESTMENT = "investment"
+ROUTE_CHAT = "chat"
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+_INTENT_RULES = {
+    "investment_planning": re.compile(
+        r"\b(invest(ing|ment|ments)?|portfolio|stocks?|shares|equit(y|ies)|mutual funds?|index funds?|etfs?|sip|"
+        r"bonds?|crypto|retire(ment)?|401k|ira|nest egg|compound(ing)? returns?|asset allocation)\b"),
+    "budget_analysis": re.compile(
+        r"\b(budget(ing)?|spend(ing)?|spent|expenses?|overspend(ing)?|bills?|rent|groceries|"
+        r"cut (back|costs?)|make ends meet|paycheck|salary runs out|save more)\b"),
+}
+
+# An investment keyword alone ("stocks", "IRA") is a topic; only planning phrasing makes it a planning request.
+_PLANNING_RE = re.compile(
+    r"\b(should i|shall i|how (much|do|can|should) i|where (should|can|do) i|help me|i (want|need|plan|am planning) to|"
+    r"i'?m (looking|planning|thinking)|plan(ning)? (for|to|my)|start(ing)? (a |an |my )?|build(ing)? (a |an |my )?|"
+    r"best way to|allocate|recommend|is it (a )?good (idea|time))")
+_INFORMATIONAL_RE = re.compile(
+    r"^\W*(what('s| is| are| does)|explain|define|tell me (about|what)|how does|how do .+ work)\b|"
+    r"\b(difference between|meaning of|what (is|are) (a|an|the) )")
+_RULE_REQUIRES = {"investment_planning": _PLANNING_RE}
+
+# Listed by precedence: "broke and stressed" is stress.
+_EMOTION_RULES = {
+    "stress": re.compile(r"\b(stress(ed|ful)?|overwhelm(ed|ing)?|panic(king)?|anxious|anxiety|can'?t cope|drowning)\b"),
+    "concern": re.compile(r"\b(worr(y|ied|ying)|concern(ed)?|afraid|scared|nervous|struggl(e|ing)|can'?t afford|broke|behind on)\b"),
+}
+
+RULE_CONFIDENCE = 0.95
+CONFLICT_CONFIDENCE = 0.5
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def nlu_route(nlu: dict) -> str:
+    """Maps NLU labels to the branch render_chatbot takes for them."""
+    if nlu.get('intent') == 'budget_analysis' and nlu.get('emotion') in ('stress', 'concern'):
+        return ROUTE_BUDGET
+    if nlu.get('intent') == 'investment_planning':
+        return ROUTE_INVESTMENT
+    return ROUTE_CHAT
+
+
+class NaiveBayesLabeler:
+    """Incrementally trainable multinomial Naive Bayes over word tokens."""
+
+    def __init__(self):
+        self.class_counts = Counter()
+        self.token_counts = defaultdict(Counter)
+        self.token_totals = Counter()
+        self.vocabulary = set()
+
+    def learn(self, tokens: list, label: str):
+        self.class_counts[label] += 1
+        self.token_counts[label].update(tokens)
+        self.token_totals[label] += len(tokens)
+        self.vocabulary.update(tokens)
+
+    def predict(self, tokens: list) -> tuple:
+        """Returns (label, posterior probability), or (None, 0.0) when untrained."""
+        trusted = [label for label, count in self.class_counts.items() if count >= MIN_CLASS_EXAMPLES]
+        if len(trusted) < 2:
+            return None, 0.0
+        total = sum(self.class_counts[label] for label in trusted)
+        vocab_size = len(self.vocabulary) + 1
+        scores = {}
+        for label in trusted:
+            counts = self.token_counts[label]
+            denominator = self.token_totals[label] + vocab_size
+            score = math.log(self.class_counts[label] / total)
+            for token in tokens:
+                score += math.log((counts[token] + 1) / denominator)
+            scores[label] = score
+        best = max(scores, key=scores.get)
+        normaliser = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / normaliser
+
+
+class IntentClassifier:
+    """Rules plus Naive Bayes; returns NLU labels only when confident enough."""
+
+    def __init__(self, threshold: float = DEFAULT_CONFIDENCE_THRESHOLD):
+        self.threshold = threshold
+        self.intents = NaiveBayesLabeler()
+        self.emotions = NaiveBayesLabeler()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_log(cls, path: str = NLU_LOG_PATH, threshold: float = DEFAULT_CONFIDENCE_THRESHOLD) -> "IntentClassifier":
+        classifier = cls(threshold)
+        for record in read_nlu_log(path):
+            classifier.learn(record['text'], record)
+        return classifier
+
+    def learn(self, text: str, nlu: dict):
+        """Folds one LLM-labelled message into the model."""
+        tokens = tokenize(text)
+        with self._lock:
+            if nlu.get('intent'):
+                self.intents.learn(tokens, str(nlu['intent']).lower())
+            if nlu.get('emotion'):
+                self.emotions.learn(tokens, str(nlu['emotion']).lower())
+
+    def _match_rules(self, rules: dict, text: str, exclusive: bool = True) -> str | None:
+        """The matching label; with exclusive, None when several match, else the first listed."""
+        hits = [label for label, pattern in rules.items() if pattern.search(text)]
+        return hits[0] if len(hits) == 1 or (hits and not exclusive) else None
+
+    def _match_intent_rules(self, text: str) -> str | None:
+        if _INFORMATIONAL_RE.search(text):
+            return None
+        intent = self._match_rules(_INTENT_RULES, text)
+        required = _RULE_REQUIRES.get(intent)
+        return intent if required is None or required.search(text) else None
+
+    def predict(self, text: str) -> dict:
+        """Best-guess labels with a 'confidence' for the routing decision and its 'source'."""
+        lowered = text.lower()
+        tokens = tokenize(lowered)
+        with self._lock:
+            model_intent, intent_confidence = self.intents.predict(tokens)
+            model_emotion, emotion_confidence = self.emotions.predict(tokens)
+
+        intent, source = model_intent, "model"
+        rule_intent = self._match_intent_rules(lowered)
+        if rule_intent and model_intent not in (None, rule_intent) and intent_confidence >= self.threshold:
+            # Logged labels confidently contradict the keyword rule; let the LLM decide.
+            intent_confidence = CONFLICT_CONFIDENCE
+        elif rule_intent:
+            intent, intent_confidence, source = rule_intent, max(intent_confidence if model_intent == rule_intent else 0.0, RULE_CONFIDENCE), "rules"
+
+        emotion = model_emotion
+        rule_emotion = self._match_rules(_EMOTION_RULES, lowered, exclusive=False)
+        if rule_emotion:
+            emotion, emotion_confidence = rule_emotion, RULE_CONFIDENCE
+
+        prediction = {'intent': intent, 'emotion': emotion}
+        # The emotion only changes the outcome for budget questions, so it only
+        # limits confidence there.
+        confidence = intent_confidence if intent else 0.0
+        if intent == 'budget_analysis':
+            confidence = min(confidence, emotion_confidence if emotion else 0.0)
+        prediction.update(confidence=confidence, source=source)
+        return prediction
+
+    def classify(self, text: str) -> dict | None:
+        """Returns {'intent', 'emotion'} when confident, or None to defer to the LLM."""
+        prediction = self.predict(text)
+        if prediction['confidence'] < self.threshold:
+            return None
+        return {'intent': prediction['intent'], 'emotion': prediction['emotion']}
+
+
+def read_nlu_log(path: str = NLU_LOG_PATH):
+    """Yields logged LLM NLU records, oldest first and rotated file included, skipping malformed lines."""
+    for log_path in (path + ".1", path):
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, encoding='utf-8') as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(record, dict) and record.get('text'):
+                    yield record
+
+
+_log_lock = threading.Lock()
+# Records in each log file this process has written to, counted on first use.
+_log_lines = {}
+
+
+def _count_lines(path: str) -> int:
+    try:
+        with open(path, 'rb') as handle:
+            return sum(1 for _ in handle)
+    except FileNotFoundError:
+        return 0
+
+
+def log_nlu_label(text: str, nlu: dict, latency: float = None, path: str = NLU_LOG_PATH, max_lines: int = NLU_LOG_MAX_LINES):
+    """
+    Appends an LLM NLU result to the training log, rotating it once it holds
+    max_lines records, and updates the live classifier.
+    """
+    record = {'text': text, 'intent': nlu.get('intent'), 'emotion': nlu.get('emotion'), 'latency': latency, 'logged_at': time.time()}
+    if max_lines > 0:
+        with _log_lock:
+            lines = _log_lines.get(path)
+            if lines is None:
+                lines = _count_lines(path)
+            if lines >= max_lines:
+                os.replace(path, path + ".1")
+                lines = 0
+            with open(path, 'a', encoding='utf-8') as handle:
+                handle.write(json.dumps(record) + "\n")
+            _log_lines[path] = lines + 1
+    get_intent_classifier().learn(text, nlu)
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier() -> IntentClassifier:
+    """Returns the process-wide classifier, trained from the NLU log on first use."""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = IntentClassifier.from_log()
+        return _classifier
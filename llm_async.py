@@ -0,0 +1,316 @@
+"""
+Asyncio-based Gemini client shared by the whole process.
+
+Every generate call runs as a coroutine on one background event loop, so a slow
+or rate-limited call never pins a Streamlit script thread in `time.sleep`, and
+the model's async transport (and its connections) is reused across sessions.
+Concurrency is bounded by a semaphore, and quota errors back off with full
+jitter while honouring any retry delay the API suggests.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+from metrics import LLM_RETRIES, SINGLEFLIGHT_CALLS, current_tool, increment
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+DEFAULT_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 30.0
+# How often a waiting script thread wakes up to report retry progress.
+POLL_INTERVAL = 0.2
+
+_RETRY_HINT_PATTERNS = [
+    re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),
+    re.compile(r"retry-after:?\s*(\d+(?:\.\d+)?)", re.IGNORECASE),
+]
+
+
+# Retry progress of the run() that started the current task, if any.
+_current_progress = contextvars.ContextVar("llm_retry_progress", default=None)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when a call is still rate limited after every retry."""
+
+
+def is_quota_error(error: Exception) -> bool:
+    """True for rate-limit / quota errors that are worth retrying with backoff."""
+    return "quota" in str(error).lower() or "429" in str(error)
+
+
+def retry_after_hint(error: Exception) -> float | None:
+    """Extracts a server-suggested retry delay in seconds from an error, if any."""
+    for attribute in ("retry_after", "retry_delay"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, (int, float)):
+            return float(value)
+        if hasattr(value, "total_seconds"):
+            return value.total_seconds()
+    for pattern in _RETRY_HINT_PATTERNS:
+        match = pattern.search(str(error))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def backoff_delay(attempt: int, error: Exception, base: float = DEFAULT_BASE_DELAY, cap: float = DEFAULT_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's hint."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    hint = retry_after_hint(error)
+    return max(delay, hint) if hint is not None else delay
+
+
+class RetryProgress:
+    """Retry count and pending delay, written by the loop and read by the waiting thread."""
+
+    def __init__(self):
+        self.retries = 0
+        self.delay = None
+
+    def record(self, retries: int, delay: float):
+        self.retries = retries
+        self.delay = delay
+
+
+class AsyncLLMClient:
+    """Runs Gemini calls on a dedicated event loop with bounded concurrency."""
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, max_retries: int = DEFAULT_MAX_RETRIES,
+                 base_delay: float = DEFAULT_BASE_DELAY, max_delay: float = DEFAULT_MAX_DELAY):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._streams = {}
+        self._streams_lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-async-loop", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedules a coroutine on the client loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def _next_attempt(self, attempt: int, error: Exception, progress: RetryProgress | None) -> int:
+        if not is_quota_error(error):
+            raise error
+        attempt += 1
+        if attempt >= self.max_retries:
+            raise LLMUnavailableError("We're having trouble reaching the service right now. Please wait a moment and try again.") from error
+        delay = backoff_delay(attempt - 1, error, self.base_delay, self.max_delay)
+        increment(LLM_RETRIES, tool=current_tool.get())
+        if progress is not None:
+            progress.record(attempt, delay)
+        await asyncio.sleep(delay)  # Outside the semaphore, so waiting doesn't hold a slot.
+        return attempt
+
+    async def generate(self, model, prompt, progress: RetryProgress = None, **kwargs):
+        """Awaitable generate_content with jittered retries on quota errors."""
+        progress = progress or _current_progress.get()
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                try:
+                    return await model.generate_content_async(prompt, **kwargs)
+                except Exception as e:
+                    error = e
+            attempt = await self._next_attempt(attempt, error, progress)
+
+    async def stream(self, model, prompt, progress: RetryProgress = None):
+        """Async iterator of text chunks; quota errors are retried until the first chunk arrives."""
+        progress = progress or _current_progress.get()
+        attempt = 0
+        while True:
+            yielded = False
+            async with self._semaphore:
+                try:
+                    response = await model.generate_content_async(prompt, stream=True)
+                    async for chunk in response:
+                        if chunk.text:
+                            yielded = True
+                            yield chunk.text
+                    return
+                except Exception as e:
+                    if yielded:
+                        raise  # Retrying would duplicate text the user has already seen.
+                    error = e
+            attempt = await self._next_attempt(attempt, error, progress)
+
+    def run(self, coro, on_retry=None):
+        """
+        Blocking convenience for script threads: runs a coroutine on the client loop and
+        waits for it, calling on_retry(retries, delay) on the waiting thread whenever any
+        generate() inside it schedules a retry.
+        """
+        progress = RetryProgress()
+
+        async def with_progress():
+            _current_progress.set(progress)
+            return await coro
+
+        future = self.submit(with_progress())
+        reported = 0
+        while True:
+            try:
+                return future.result(timeout=POLL_INTERVAL)
+            except concurrent.futures.TimeoutError:
+                if on_retry and progress.retries > reported:
+                    reported = progress.retries
+                    on_retry(progress.retries, progress.delay)
+
+    def call(self, model, prompt, on_retry=None, **kwargs):
+        """Blocking generate() for script threads; see run()."""
+        return self.run(self.generate(model, prompt, **kwargs), on_retry)
+
+    def open_stream(self, model, prompt, on_complete=None, tool: str = "chat", key=None) -> "LLMStream":
+        """
+        Starts a streaming generation immediately; iterate the result to consume it.
+        With a key, a stream opened while another one for the same key is still
+        running follows that one instead of making its own upstream call.
+        """
+        if key is None:
+            return LLMStream(self, model, prompt, on_complete, tool)
+        with self._streams_lock:
+            leader = self._streams.get(key)
+            stream = leader.follow() if leader is not None else None
+            if stream is None:
+                stream = self._streams[key] = LLMStream(self, model, prompt, on_complete, tool,
+                                                        on_finished=lambda finished: self._forget_stream(key, finished))
+        increment(SINGLEFLIGHT_CALLS, group="llm_stream", role="leader" if stream._leader is stream else "follower")
+        return stream
+
+    def _forget_stream(self, key, stream: "LLMStream"):
+        with self._streams_lock:
+            if self._streams.get(key) is stream:
+                del self._streams[key]
+
+
+class LLMStream:
+    """
+    A streaming generation already running on the client loop. Chunks are buffered
+    until iterated; cancel() abandons the upstream call. `latency` is filled with
+    'time_to_first_token' and 'total_latency' in seconds, and on_complete(text,
+    latency) is called once a non-empty answer has fully arrived.
+
+    follow() returns another stream over the same generation that first replays
+    what has arrived so far; the upstream call is only cancelled once every
+    stream over it has been cancelled.
+    """
+    _DONE = object()
+
+    def __init__(self, client: AsyncLLMClient = None, model=None, prompt=None, on_complete=None, tool: str = "chat",
+                 on_finished=None):
+        self.latency = {}
+        self.on_retry = None
+        self._progress = RetryProgress()
+        self._chunks = queue.Queue()
+        self._started = time.perf_counter()
+        self._future = None
+        self._leader = self
+        self._lock = threading.Lock()
+        self._history = []
+        self._subscribers = [self._chunks]
+        self._on_finished = on_finished
+        if client is not None:
+            self._future = client.submit(self._produce(client, model, prompt, on_complete, tool))
+
+    @classmethod
+    def from_text(cls, text: str) -> "LLMStream":
+        """An already-finished stream, e.g. for a cached response."""
+        stream = cls()
+        stream.latency = {"time_to_first_token": 0.0, "total_latency": 0.0}
+        stream._publish(text)
+        stream._publish(cls._DONE)
+        return stream
+
+    def follow(self) -> "LLMStream | None":
+        """A stream over the same generation, or None if this one has been cancelled."""
+        with self._lock:
+            if not self._subscribers:
+                return None
+            follower = LLMStream()
+            follower.latency = self.latency
+            follower._progress = self._progress
+            follower._leader = self
+            follower._subscribers = None
+            for item in self._history:
+                follower._chunks.put(item)
+            self._subscribers.append(follower._chunks)
+            return follower
+
+    def _publish(self, item):
+        with self._lock:
+            self._history.append(item)
+            for chunks in self._subscribers:
+                chunks.put(item)
+
+    def _finish(self):
+        if self._on_finished is not None:
+            self._on_finished(self)
+            self._on_finished = None
+
+    async def _produce(self, client, model, prompt, on_complete, tool):
+        current_tool.set(tool)
+        pieces = []
+        try:
+            async for text in client.stream(model, prompt, self._progress):
+                if not pieces:
+                    self.latency["time_to_first_token"] = time.perf_counter() - self._started
+                pieces.append(text)
+                self._publish(text)
+            self.latency["total_latency"] = time.perf_counter() - self._started
+            if on_complete and pieces:
+                on_complete("".join(pieces), self.latency)
+        except Exception as e:
+            self._publish(e)
+        finally:
+            self._finish()  # Before _DONE, so a stream opened after the last chunk starts a new call.
+            self._publish(self._DONE)
+
+    def __iter__(self):
+        reported = 0
+        while True:
+            try:
+                item = self._chunks.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self.on_retry and self._progress.retries > reported:
+                    reported = self._progress.retries
+                    self.on_retry(self._progress.retries, self._progress.delay)
+                continue
+            if item is self._DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        """Stops buffering for this stream, and abandons the generation if no other stream follows it."""
+        leader = self._leader
+        with leader._lock:
+            if self._chunks in leader._subscribers:
+                leader._subscribers.remove(self._chunks)
+            abandoned = not leader._subscribers
+        if abandoned and leader._future is not None:
+            leader._finish()
+            leader._future.cancel()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> AsyncLLMClient:
+    """Returns the process-wide async LLM client, starting its loop on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AsyncLLMClient()
+        return _client
@@ -0,0 +1,200 @@
+"""
+Content-addressed cache for Gemini responses.
+
+Entries are keyed by a hash of the model name, the whitespace-normalized prompt
+and whether JSON output was requested, held in an in-memory LRU tier in front of a size-bounded SQLite tier,
+and expire after a per-tool TTL.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+DEFAULT_DB_PATH = os.getenv("LLM_CACHE_DB", "llm_cache.db")
+DEFAULT_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+DEFAULT_DISK_BYTES = int(os.getenv("LLM_CACHE_DISK_BYTES", str(64 * 1024 * 1024)))
+
+# Seconds a response stays valid, per tool. Override with LLM_CACHE_TTL_<TOOL>.
+DEFAULT_TTLS = {
+    "currency": 3600,
+    "budget": 7 * 86400,
+    "nlu": 30 * 86400,
+    "expense_extraction": 30 * 86400,
+    "categorization": 30 * 86400,
+    "insights": 7 * 86400,
+    "investment": 7 * 86400,
+    "chat": 86400,
+    "default": 3600,
+}
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    tool TEXT NOT NULL,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    generation_seconds REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at);
+"""
+
+
+def normalize_prompt(prompt: str) -> str:
+    return _WHITESPACE_RE.sub(" ", prompt).strip()
+
+
+def cache_key(model_name: str, prompt: str, json_mode: bool = False) -> str:
+    mode = "\0json" if json_mode else ""  # Free-text keys stay as they were before JSON mode existed.
+    return hashlib.sha256(f"{model_name}{mode}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+def ttl_for(tool: str) -> float:
+    override = os.getenv(f"LLM_CACHE_TTL_{tool.upper()}")
+    return float(override) if override else DEFAULT_TTLS.get(tool, DEFAULT_TTLS["default"])
+
+
+class CachedResponse:
+    """Stands in for a generate_content response; only `.text` is used by callers."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class LLMResponseCache:
+    """Two-tier (memory LRU + SQLite) response cache with per-tool hit/miss counters."""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+                 disk_bytes: int = DEFAULT_DISK_BYTES):
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()  # key -> (text, expires_at, generation_seconds)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # Running byte total of the disk tier, so a put needn't SUM the whole table.
+        self._disk_total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.counts = Counter()
+        self.seconds_saved = 0.0
+        self.evictions = 0
+
+    def get(self, key: str, tool: str = "default") -> str | None:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[1] > now:
+                self._memory.move_to_end(key)
+                self._record_hit(tool, "memory", entry[2])
+                return entry[0]
+            if entry:
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT text, expires_at, generation_seconds FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and row[1] > now:
+                with self._conn:
+                    self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._remember(key, row)
+                self._record_hit(tool, "disk", row[2])
+                return row[0]
+
+            self.counts[(tool, "miss")] += 1
+            return None
+
+    def put(self, key: str, text: str, tool: str = "default", generation_seconds: float = 0.0):
+        now = time.time()
+        expires_at = now + ttl_for(tool)
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            self._remember(key, (text, expires_at, generation_seconds))
+            with self._conn:
+                self._disk_total += size - self._stored_size(key)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, tool, text, size, generation_seconds, expires_at, now))
+                self._evict_disk(now)
+
+    def invalidate(self, key: str):
+        """Drops an entry from both tiers, e.g. after its text failed to parse."""
+        with self._lock:
+            self._memory.pop(key, None)
+            with self._conn:
+                self._disk_total -= self._stored_size(key)
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def _remember(self, key: str, entry: tuple):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _stored_size(self, key: str) -> int:
+        row = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _evict_disk(self, now: float):
+        expired = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses WHERE expires_at <= ?", (now,)).fetchone()[0]
+        if expired:
+            self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            self._disk_total -= expired
+        if self._disk_total <= self.disk_bytes:
+            return
+        # Other processes may share the file, so recount before evicting on the running total's word.
+        self._disk_total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if self._disk_total <= self.disk_bytes:
+            return
+        # Drop least recently used rows until back under the byte budget.
+        excess = self._disk_total - self.disk_bytes
+        freed = 0
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self._disk_total -= freed
+        self.evictions += len(doomed)
+
+    def _record_hit(self, tool: str, tier: str, generation_seconds: float):
+        self.counts[(tool, f"{tier}_hit")] += 1
+        self.seconds_saved += generation_seconds
+
+    def stats(self) -> dict:
+        """Totals plus a per-tool breakdown of hits and misses."""
+        with self._lock:
+            per_tool = {}
+            for (tool, kind), count in self.counts.items():
+                per_tool.setdefault(tool, Counter())[kind] = count
+            hits = sum(count for (tool, kind), count in self.counts.items() if kind.endswith("_hit"))
+            misses = sum(count for (tool, kind), count in self.counts.items() if kind == "miss")
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "seconds_saved": self.seconds_saved,
+                "memory_entries": len(self._memory),
+                "evictions": self.evictions,
+                "per_tool": {tool: dict(counts) for tool, counts in per_tool.items()},
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Returns the process-wide response cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache()
+        return _cache
@@ -0,0 +1,271 @@
+"""
+Lightweight in-process metrics for the tool flows and chat turns.
+
+Each stage of a flow (exchange-rate lookup, LLM call, JSON parsing, local
+computation, rendering) is timed with `span()`, and LLM retries and prompt /
+response sizes are counted alongside. Observations go into fixed-bucket
+histograms, so recording costs two perf_counter() calls, a bisect and a locked
+increment, cheap enough to leave on in production.
+
+`render_prometheus()` writes everything in the Prometheus text format (served at
+/metrics by api.py, and by `start_http_exporter()` in the Streamlit process when
+METRICS_EXPORTER_PORT is set) and `summary()` feeds the app's debug panel. Each
+process keeps its own registry, so with several API workers every worker reports
+its own.
+"""
+import contextvars
+import functools
+import math
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STAGE_SECONDS = "lefibot_stage_seconds"
+STAGE_ERRORS = "lefibot_stage_errors_total"
+LLM_RETRIES = "lefibot_llm_retries_total"
+LLM_CACHE_LOOKUPS = "lefibot_llm_cache_lookups_total"
+LLM_PROMPT_CHARS = "lefibot_llm_prompt_chars"
+LLM_RESPONSE_CHARS = "lefibot_llm_response_chars"
+FX_PROVIDER_CALLS = "lefibot_fx_provider_calls_total"
+SINGLEFLIGHT_CALLS = "lefibot_singleflight_calls_total"
+STRUCTURED_PARSES = "lefibot_structured_parses_total"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (100, 300, 1000, 3000, 10000, 30000, 100000)
+
+_FAMILIES = {
+    STAGE_SECONDS: ("histogram", "Time spent in each stage of a tool flow or chat turn.", LATENCY_BUCKETS),
+    STAGE_ERRORS: ("counter", "Stages that ended with an exception.", None),
+    LLM_RETRIES: ("counter", "LLM calls retried after a quota or rate-limit error.", None),
+    LLM_CACHE_LOOKUPS: ("counter", "LLM response cache lookups by result.", None),
+    LLM_PROMPT_CHARS: ("histogram", "Characters sent to the LLM per call.", SIZE_BUCKETS),
+    LLM_RESPONSE_CHARS: ("histogram", "Characters received from the LLM per call.", SIZE_BUCKETS),
+    FX_PROVIDER_CALLS: ("counter", "Exchange-rate provider calls by result (ok, error, or skipped by an open circuit).", None),
+    SINGLEFLIGHT_CALLS: ("counter", "Upstream calls made (leader) or shared with an identical in-flight call (follower).", None),
+    STRUCTURED_PARSES: ("counter", "JSON answers per prompt builder by outcome (parsed, repaired or failed).", None),
+}
+
+# Tool whose flow is running, used as the `tool` label of spans that don't name one.
+current_tool = contextvars.ContextVar("metrics_tool", default="none")
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus model."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf.
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation inside the bucket holding the q-th observation."""
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    """Histograms and counters keyed by metric name and sorted label pairs."""
+
+    def __init__(self, families: dict = None):
+        self.families = dict(families or _FAMILIES)
+        self._series = {name: {} for name in self.families}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.families[name][2])
+            histogram.observe(value)
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[name]
+            series[key] = series.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            for series in self._series.values():
+                series.clear()
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, _) in self.families.items():
+                series = self._series[name]
+                if not series:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series.items()):
+                    if kind == "counter":
+                        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(value.buckets + (math.inf,), value.counts):
+                        cumulative += bucket_count
+                        le = "+Inf" if bound == math.inf else f"{bound:g}"
+                        bucket_labels = _format_labels(labels, f'le="{le}"')
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value.sum:g}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, name: str = STAGE_SECONDS) -> list:
+        """One row per label set: the labels plus count, mean, p50, p95 and (for histograms) sum."""
+        rows = []
+        with self._lock:
+            for labels, value in sorted(self._series[name].items()):
+                row = dict(labels)
+                if isinstance(value, Histogram):
+                    row.update(count=value.count, sum=value.sum, mean=value.sum / value.count if value.count else math.nan,
+                               p50=value.quantile(0.5), p95=value.quantile(0.95))
+                else:
+                    row["count"] = value
+                rows.append(row)
+        return rows
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+
+def observe(name: str, value: float, **labels):
+    _registry.observe(name, value, **labels)
+
+
+def increment(name: str, amount: float = 1, **labels):
+    _registry.increment(name, amount, **labels)
+
+
+def render_prometheus() -> str:
+    return _registry.render_prometheus()
+
+
+def summary(name: str = STAGE_SECONDS) -> list:
+    return _registry.summary(name)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # Scrapes every few seconds would flood the app's log.
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def start_http_exporter(port: int, host: str = "127.0.0.1"):
+    """
+    Serves this process's registry at http://host:port/metrics from a daemon thread,
+    for processes without their own HTTP API (the Streamlit app). Only the first call
+    starts a server; an OSError (e.g. the port is taken) is raised once and not retried.
+    """
+    global _exporter
+    with _exporter_lock:
+        if _exporter is not None:
+            return
+        _exporter = False
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+        _exporter = server
+
+
+class span:
+    """
+    Times a block as one stage: `with span("llm"): ...`. The tool label defaults
+    to the flow's current tool. An exception is counted in STAGE_ERRORS and the
+    time until it was raised is still recorded.
+    """
+
+    __slots__ = ("stage", "tool", "_started")
+
+    def __init__(self, stage: str, tool: str = None):
+        self.stage = stage
+        self.tool = tool
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        tool = self.tool or current_tool.get()
+        _registry.observe(STAGE_SECONDS, time.perf_counter() - self._started, stage=self.stage, tool=tool)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            _registry.increment(STAGE_ERRORS, stage=self.stage, tool=tool)
+        return False
+
+
+class tool_scope:
+    """Labels spans and retry counts inside the block with `tool`."""
+
+    __slots__ = ("tool", "_token")
+
+    def __init__(self, tool: str):
+        self.tool = tool
+
+    def __enter__(self):
+        self._token = current_tool.set(self.tool)
+        return self
+
+    def __exit__(self, *exc):
+        current_tool.reset(self._token)
+        return False
+
+
+def traced_tool(tool: str):
+    """Decorates a tool coroutine: its stages are labelled with `tool` and the whole call is timed as stage 'total'."""
+    def decorate(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with tool_scope(tool), span("total"):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,662 @@
+"""
+UI-independent core of the LefiBot tools and chatbot.
+
+Prompt building, cached LLM calls, structured-output parsing and the local
+computations behind each tool live here as plain functions and coroutines, with
+no Streamlit imports. The Streamlit app, the HTTP API (`api.py`) and batch runs
+all call the same tool coroutines in `TOOLS`; they run on the shared LLM client
+loop, via run() from a blocking caller or arun() from another event loop.
+"""
+import asyncio
+import inspect
+import os
+import sys
+import threading
+import time
+import typing
+from datetime import date, datetime, timedelta
+
+from dotenv import load_dotenv
+
+from chat_context import CHARS_PER_TOKEN, CONTEXT_TOKEN_BUDGET, format_history
+from fx_history import get_history_store
+from fx_rates import get_rate_table
+from llm_async import LLMStream, LLMUnavailableError, get_llm_client
+from llm_cache import CachedResponse, cache_key, get_llm_cache
+from metrics import (LLM_CACHE_LOOKUPS, LLM_PROMPT_CHARS, LLM_RESPONSE_CHARS, STAGE_SECONDS, increment, observe, span,
+                     tool_scope, traced_tool)
+from singleflight import AsyncSingleFlight
+from structured_output import JSON_MODE, StructuredOutputError, parse_structured
+
+load_dotenv()
+API_KEY = os.getenv("GOOGLE_API_KEY")
+# You will need to get an API key from a service like ExchangeRate-API.com
+EXCHANGE_RATE_API_KEY = os.getenv("EXCHANGE_RATE_API_KEY")
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash-latest")
+
+
+class ConfigurationError(RuntimeError):
+    """Raised when a required API key is missing."""
+
+
+CURRENCIES = {
+    'USD': 'United States Dollar', 'EUR': 'Euro', 'JPY': 'Japanese Yen', 'GBP': 'British Pound Sterling',
+    'AUD': 'Australian Dollar', 'CAD': 'Canadian Dollar', 'CHF': 'Swiss Franc', 'CNY': 'Chinese Yuan',
+    'SEK': 'Swedish Krona', 'NZD': 'New Zealand Dollar', 'MXN': 'Mexican Peso', 'SGD': 'Singapore Dollar',
+    'HKD': 'Hong Kong Dollar', 'NOK': 'Norwegian Krone', 'KRW': 'South Korean Won', 'TRY': 'Turkish Lira',
+    'RUB': 'Russian Ruble', 'INR': 'Indian Rupee', 'BRL': 'Brazilian Real', 'ZAR': 'South African Rand',
+    'AED': 'United Arab Emirates Dirham', 'AFN': 'Afghan Afghani', 'ALL': 'Albanian Lek', 'AMD': 'Armenian Dram',
+    'ANG': 'Netherlands Antillean Guilder', 'AOA': 'Angolan Kwanza', 'ARS': 'Argentine Peso',
+    'AWG': 'Aruban Florin', 'AZN': 'Azerbaijani Manat', 'BAM': 'Bosnia-Herzegovina Convertible Mark',
+    'BBD': 'Barbadian Dollar', 'BDT': 'Bangladeshi Taka', 'BGN': 'Bulgarian Lev', 'BHD': 'Bahraini Dinar',
+    'BIF': 'Burundian Franc', 'BMD': 'Bermudan Dollar', 'BND': 'Brunei Dollar', 'BOB': 'Bolivian Boliviano',
+    'BSD': 'Bahamian Dollar', 'BTN': 'Bhutanese Ngultrum', 'BWP': 'Botswanan Pula', 'BYN': 'Belarusian Ruble',
+    'BZD': 'Belize Dollar', 'CDF': 'Congolese Franc', 'CLP': 'Chilean Peso', 'COP': 'Colombian Peso',
+    'CRC': 'Costa Rican Colón', 'CUP': 'Cuban Peso', 'CVE': 'Cape Verdean Escudo', 'CZK': 'Czech Koruna',
+    'DJF': 'Djiboutian Franc', 'DKK': 'Danish Krone', 'DOP': 'Dominican Peso', 'DZD': 'Algerian Dinar',
+    'EGP': 'Egyptian Pound', 'ERN': 'Eritrean Nakfa', 'ETB': 'Ethiopian Birr', 'FJD': 'Fijian Dollar',
+    'FKP': 'Falkland Islands Pound', 'FOK': 'Faroese Króna', 'GEL': 'Georgian Lari', 'GGP': 'Guernsey Pound',
+    'GHS': 'Ghanaian Cedi', 'GIP': 'Gibraltar Pound', 'GMD': 'Gambian Dalasi', 'GNF': 'Guinean Franc',
+    'GTQ': 'Guatemalan Quetzal', 'GYD': 'Guyanaese Dollar', 'HNL': 'Honduran Lempira', 'HRK': 'Croatian Kuna',
+    'HTG': 'Haitian Gourde', 'HUF': 'Hungarian Forint', 'IDR': 'Indonesian Rupiah', 'ILS': 'Israeli New Shekel',
+    'IMP': 'Isle of Man Pound', 'IQD': 'Iraqi Dinar', 'IRR': 'Iranian Rial', 'ISK': 'Icelandic Króna',
+    'JEP': 'Jersey Pound', 'JMD': 'Jamaican Dollar', 'JOD': 'Jordanian Dinar', 'KES': 'Kenyan Shilling',
+    'KGS': 'Kyrgystani Som', 'KHR': 'Cambodian Riel', 'KID': 'Kiribati Dollar', 'KMF': 'Comorian Franc',
+    'KWD': 'Kuwaiti Dinar', 'KYD': 'Cayman Islands Dollar', 'KZT': 'Kazakhstani Tenge', 'LAK': 'Laotian Kip',
+    'LBP': 'Lebanese Pound', 'LKR': 'Sri Lankan Rupee', 'LRD': 'Liberian Dollar', 'LSL': 'Lesotho Loti',
+    'LYD': 'Libyan Dinar', 'MAD': 'Moroccan Dirham', 'MDL': 'Moldovan Leu', 'MGA': 'Malagasy Ariary',
+    'MKD': 'Macedonian Denar', 'MMK': 'Myanma Kyat', 'MNT': 'Mongolian Tugrik', 'MOP': 'Macanese Pataca',
+    'MRU': 'Mauritanian Ouguiya', 'MUR': 'Mauritian Rupee', 'MVR': 'Maldivian Rufiyaa', 'MWK': 'Malawian Kwacha',
+    'MYR': 'Malaysian Ringgit', 'MZN': 'Mozambican Metical', 'NAD': 'Namibian Dollar', 'NGN': 'Nigerian Naira',
+    'NIO': 'Nicaraguan Córdoba', 'NPR': 'Nepalese Rupee', 'OMR': 'Omani Rial', 'PAB': 'Panamanian Balboa',
+    'PEN': 'Peruvian Sol', 'PGK': 'Papua New Guinean Kina', 'PHP': 'Philippine Peso', 'PKR': 'Pakistani Rupee',
+    'PLN': 'Polish Zloty', 'PYG': 'Paraguayan Guarani', 'QAR': 'Qatari Rial', 'RON': 'Romanian Leu',
+    'RSD': 'Serbian Dinar', 'RWF': 'Rwandan Franc', 'SAR': 'Saudi Riyal', 'SBD': 'Solomon Islands Dollar',
+    'SCR': 'Seychellois Rupee', 'SDG': 'Sudanese Pound', 'SHP': 'Saint Helena Pound', 'SLE': 'Sierra Leonean Leone',
+    'SOS': 'Somali Shilling', 'SRD': 'Surinamese Dollar', 'SSP': 'South Sudanese Pound',
+    'STN': 'São Tomé and Príncipe Dobra', 'SYP': 'Syrian Pound', 'SZL': 'Eswatini Lilangeni',
+    'THB': 'Thai Baht', 'TJS': 'Tajikistani Somoni', 'TMT': 'Turkmenistani Manat', 'TND': 'Tunisian Dinar',
+    'TOP': 'Tongan Paʻanga', 'TTD': 'Trinidad and Tobago Dollar', 'TVD': 'Tuvaluan Dollar',
+    'TWD': 'New Taiwan Dollar', 'TZS': 'Tanzanian Shilling', 'UAH': 'Ukrainian Hryvnia',
+    'UGX': 'Ugandan Shilling', 'UYU': 'Uruguayan Peso', 'UZS': 'Uzbekistan Som', 'VES': 'Venezuelan Bolívar',
+    'VND': 'Vietnamese Dong', 'VUV': 'Vanuatu Vatu', 'WST': 'Samoan Tala', 'XAF': 'Central African CFA Franc',
+    'XCD': 'East Caribbean Dollar', 'XDR': 'Special Drawing Rights', 'XOF': 'West African CFA Franc',
+    'XPF': 'CFP Franc', 'YER': 'Yemeni Rial', 'ZMW': 'Zambian Kwacha', 'ZWL': 'Zimbabwean Dollar'
+}
+# A key of CURRENCIES; tool inputs annotated with it are checked by bind_tool_inputs.
+CurrencyCode = typing.NewType("CurrencyCode", str)
+
+
+def check_currencies(*codes):
+    """Raises ValueError for codes outside CURRENCIES, which no rate refresh would ever fix."""
+    unknown = [code for code in codes if code not in CURRENCIES]
+    if unknown:
+        raise ValueError(f"Unknown currency code {', '.join(map(repr, unknown))}. Use a code such as USD, EUR or INR.")
+
+
+# Default targets of the multi-currency conversion, e.g. MATRIX_CURRENCIES="USD,EUR,GBP,INR".
+MATRIX_CURRENCIES = [code.strip() for code in os.getenv("MATRIX_CURRENCIES", ",".join(list(CURRENCIES)[:20])).split(",") if code.strip()]
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """
+    One Gemini model per process, so its async transport and connections are reused.
+    The SDK (over a second to import) is loaded here, on the first LLM call.
+    """
+    global _model
+    if not API_KEY:
+        raise ConfigurationError("GOOGLE_API_KEY not found.")
+    with _model_lock:
+        if _model is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=API_KEY)
+            _model = genai.GenerativeModel(MODEL_NAME)
+        return _model
+
+
+def is_blocked_prompt(error: Exception) -> bool:
+    """True if Gemini refused the prompt on safety grounds. Never imports the SDK itself."""
+    genai = sys.modules.get("google.generativeai")
+    return genai is not None and isinstance(error, genai.types.BlockedPromptException)
+
+
+# --- Running service coroutines ---
+
+def run(coro, on_retry=None):
+    """Runs a service coroutine from a blocking caller; on_retry(retries, delay) reports backoff."""
+    return get_llm_client().run(coro, on_retry)
+
+
+async def arun(coro):
+    """Awaits a service coroutine from another event loop (e.g. an ASGI server's)."""
+    return await asyncio.wrap_future(get_llm_client().submit(coro))
+
+
+# --- LLM calls ---
+
+# Identical prompts in flight at once, from any session, share one Gemini call.
+_llm_flights = AsyncSingleFlight("llm")
+
+
+def llm_cache_key(model, prompt, json_mode: bool = False) -> str:
+    """Cache key for a prompt sent to a specific model, in JSON mode or not."""
+    return cache_key(getattr(model, "model_name", type(model).__name__), prompt, json_mode)
+
+
+async def generate_content(model, prompt, tool: str = "default", json_mode: bool = False):
+    """
+    generate_content on the shared async LLM client, with quota errors retried there
+    with jittered backoff (LLMUnavailableError once retries run out). Responses are
+    served from and stored in the shared LLM cache under the tool's TTL. With
+    json_mode the model is asked for a bare JSON document. Concurrent calls
+    for the same prompt share one request.
+    """
+    cache = get_llm_cache()
+    key = llm_cache_key(model, prompt, json_mode)
+    cached_text = cache.get(key, tool)
+    increment(LLM_CACHE_LOOKUPS, tool=tool, result="miss" if cached_text is None else "hit")
+    if cached_text is not None:
+        return CachedResponse(cached_text)
+
+    async def call():
+        observe(LLM_PROMPT_CHARS, len(prompt), tool=tool)
+        started = time.perf_counter()
+        with tool_scope(tool), span("llm"):
+            response = await get_llm_client().generate(model, prompt, generation_config=JSON_MODE if json_mode else None)
+        try:
+            observe(LLM_RESPONSE_CHARS, len(response.text), tool=tool)
+            cache.put(key, response.text, tool, time.perf_counter() - started)
+        except ValueError:
+            pass # No text to cache (e.g. the candidate was blocked)
+        return response
+
+    return await _llm_flights.do(key, call)
+
+
+async def generate_structured(model, prompt, builder: str, tool: str = "default") -> dict:
+    """
+    Generates in JSON mode and parses the answer against the builder's schema.
+    A response that can't be parsed is evicted from the cache before re-raising,
+    so trying again really does regenerate.
+    """
+    response = await generate_content(model, prompt, tool=tool, json_mode=True)
+    try:
+        with span("parse", tool):
+            return parse_structured(response.text, builder)
+    except StructuredOutputError:
+        get_llm_cache().invalidate(llm_cache_key(model, prompt, json_mode=True))
+        raise
+
+
+def stream_generate_content(model, prompt, tool: str = "chat") -> LLMStream:
+    """
+    Streaming counterpart of generate_content. The generation starts immediately
+    on the async client; iterate the returned stream to receive text chunks, or
+    cancel() it to abandon the call. Its `latency` holds time-to-first-token and
+    total latency. A cached response is returned as a single, already-finished chunk,
+    and a prompt already streaming for another session follows that stream.
+    """
+    cache = get_llm_cache()
+    key = llm_cache_key(model, prompt)
+    cached_text = cache.get(key, tool)
+    increment(LLM_CACHE_LOOKUPS, tool=tool, result="miss" if cached_text is None else "hit")
+    if cached_text is not None:
+        return LLMStream.from_text(cached_text)
+
+    def on_complete(text: str, latency: dict):
+        observe(LLM_RESPONSE_CHARS, len(text), tool=tool)
+        observe(STAGE_SECONDS, latency["time_to_first_token"], stage="first_token", tool=tool)
+        observe(STAGE_SECONDS, latency["total_latency"], stage="llm_stream", tool=tool)
+        cache.put(key, text, tool, latency["total_latency"])
+
+    observe(LLM_PROMPT_CHARS, len(prompt), tool=tool)
+    return get_llm_client().open_stream(model, prompt, on_complete=on_complete, tool=tool, key=key)
+
+
+def summarize_chat_async(previous_summary: str, messages: list):
+    """
+    Runs a chat summary update on the shared LLM loop; returns a Future of the new
+    summary text. An identical summary already in flight is shared.
+    """
+    model = get_model()
+    prompt = build_chat_summary_prompt(previous_summary, messages)
+
+    async def call():
+        observe(LLM_PROMPT_CHARS, len(prompt), tool="chat_summary")
+        with tool_scope("chat_summary"), span("llm"):
+            response = await get_llm_client().generate(model, prompt)
+        observe(LLM_RESPONSE_CHARS, len(response.text), tool="chat_summary")
+        return response
+
+    async def summarize():
+        response = await _llm_flights.do(llm_cache_key(model, prompt), call)
+        return response.text
+
+    return get_llm_client().submit(summarize())
+
+
+# --- Local computations ---
+
+def get_rate_snapshot() -> tuple:
+    """
+    (snapshot, stale) from the shared, TTL-cached rate table; stale is True when
+    the rate service is unreachable and the last known table is served. Fresh
+    tables are recorded in the history store. Raises RateUnavailableError.
+    """
+    if not EXCHANGE_RATE_API_KEY:
+        raise ConfigurationError("EXCHANGE_RATE_API_KEY not found.")
+    rate_table = get_rate_table(EXCHANGE_RATE_API_KEY)
+    with span("exchange_rate"):
+        snapshot = rate_table.snapshot()
+    stale = rate_table.is_stale()
+    if not stale:
+        get_history_store().record_snapshot(snapshot)
+    return snapshot, stale
+
+
+def get_exchange_rate(from_currency: str, to_currency: str) -> tuple:
+    """(rate, stale) for one pair; see get_rate_snapshot. Unknown codes raise ValueError."""
+    check_currencies(from_currency, to_currency)
+    snapshot, stale = get_rate_snapshot()
+    return snapshot.cross_rate(from_currency, to_currency), stale
+
+
+def build_currency_data(from_currency: str, to_currency: str, amount: float, real_time_rate: float, lookup_date: date = None) -> dict:
+    """Computes the conversion and looks up historical rates locally, in the structure `display_currency_results` expects."""
+    history = get_history_store()
+    yesterday = date.today() - timedelta(days=1)
+    data = {
+        "real_time": {"rate": real_time_rate, "converted_amount": amount * real_time_rate},
+        "historical_trend": history.series(from_currency, to_currency, yesterday - timedelta(days=29), yesterday),
+    }
+    if lookup_date:
+        point = history.rate_on(from_currency, to_currency, lookup_date)
+        if point:
+            data["historical_rate"] = {"date": point["date"], "rate": point["rate"], "converted_amount": amount * point["rate"]}
+    return data
+
+
+def build_currency_matrix(snapshot, from_currency: str, amount: float, currencies: list) -> dict:
+    """The amount in each currency and their full cross-rate matrix, all from one snapshot."""
+    codes = list(dict.fromkeys([from_currency, *currencies]))
+    matrix = snapshot.cross_rate_matrix(codes)
+    return {
+        "currencies": codes,
+        "converted": dict(zip(codes, (amount * matrix[0]).tolist())),
+        "matrix": matrix.tolist(),
+        "rates_as_of": datetime.fromtimestamp(snapshot.fetched_at),
+    }
+
+
+# --- Prompt builders ---
+
+def build_advanced_currency_prompt(from_currency: str, to_currency: str, amount: float, data: dict, lookup_date: date = None) -> str:
+    """Builds a prompt asking only for short explanations of the locally computed conversion figures."""
+    real_time = data["real_time"]
+    trend = data.get("historical_trend") or []
+    trend_part = "No historical trend data is available."
+    if len(trend) >= 2:
+        rates = [point["rate"] for point in trend]
+        change = (rates[-1] - rates[0]) / rates[0] * 100
+        trend_part = f"Over the last {len(trend)} days the rate moved from {rates[0]:.4f} to {rates[-1]:.4f} ({change:+.2f}%), ranging between {min(rates):.4f} and {max(rates):.4f}."
+
+    date_prompt_part = ""
+    hist = data.get("historical_rate")
+    if lookup_date and hist:
+        date_prompt_part = f"""
+    - On {hist['date']} the rate was {hist['rate']:.4f}, so {amount} {from_currency} was {hist['converted_amount']:,.2f} {to_currency}.
+    """
+
+    return f"""
+    You are an expert currency analyst. The figures below are already calculated; do not recalculate or invent any numbers.
+
+    - Today {amount} {from_currency} = {real_time['converted_amount']:,.2f} {to_currency} at a rate of {real_time['rate']:.4f}.
+    - {trend_part}
+    {date_prompt_part}
+
+    Respond with a single JSON object with these keys:
+    - "real_time_explanation": One short sentence describing today's conversion and the recent trend.
+    - "historical_explanation": One short sentence comparing the historical date to today (empty string if no historical date is given).
+
+    JSON Output:
+    """
+
+
+def build_budget_summary_prompt(income: float, expenses: dict, currency: str) -> str:
+    """Builds a prompt for a budget summary."""
+    expense_details = "\n".join([f"- {category.capitalize()}: {currency}{amount}" for category, amount in expenses.items()])
+    total_expenses = sum(expenses.values())
+    net_income = income - total_expenses
+    
+    return f"""
+    You are LefiBot, a professional financial assistant. Analyze the budget and provide a concise summary.
+    Budget:
+    - Monthly Income: {currency}{income:,.2f}
+    - Expenses:
+    {expense_details}
+    - Total Monthly Expenses: {currency}{total_expenses:,.2f}
+    - Net Income: {currency}{net_income:,.2f}
+
+    Respond in a clean JSON format with two keys: "summary_text" and "top_categories".
+    - "summary_text": A markdown-formatted string with a heading "### AI Summary & Tips" containing:
+        1. A sentence on overall financial health.
+        2. One practical tip for improvement.
+    - "top_categories": A list of the top 2-3 spending categories as strings.
+    
+    JSON Output:
+    """
+
+
+def build_chatbot_prompt(user_query: str, context: dict = None) -> str:
+    """Builds a prompt for the general finance chatbot, with bounded conversation context if given."""
+    context = context or {}
+    summary = f"Summary of the earlier conversation: {context['summary']}\n" if context.get("summary") else ""
+    history = f"Recent conversation:\n{format_history(context['history'])}\n" if context.get("history") else ""
+    return f"""
+    You are LefiBot, a helpful and professional financial assistant. Answer the user's personal finance question clearly, concisely, and in a friendly manner.
+    Use the conversation so far only where it is relevant to the question.
+    {summary}{history}
+    User's Question: "{user_query}"
+    """
+
+
+def build_chat_summary_prompt(previous_summary: str, messages: list) -> str:
+    """Builds a prompt that folds older chat messages into the running conversation summary."""
+    return f"""
+    Update the running summary of a conversation between a user and LefiBot, a personal finance assistant.
+    Keep the user's financial facts (income, expenses, goals, amounts, deadlines), preferences and open questions; drop small talk.
+    Reply with the updated summary only, in at most {CONTEXT_TOKEN_BUDGET // 2 * CHARS_PER_TOKEN // 6} words.
+
+    Current summary: {previous_summary or "(none)"}
+
+    New messages:
+    {format_history(messages)}
+    """
+
+
+def build_nlu_prompt(text: str) -> str:
+    """Builds an advanced prompt for NLU analysis."""
+    return f"""
+    Analyze the following text for advanced Natural Language Understanding insights.
+    Provide the output in a clean JSON format with the following keys:
+    - 'sentiment': A string ('positive', 'negative', or 'neutral').
+    - 'sentiment_score': A float between -1.0 (very negative) and 1.0 (very positive).
+    - 'emotion': A single dominant emotion detected in the text (e.g., 'stress', 'joy', 'concern', 'optimism').
+    - 'intent': The user's primary goal (e.g., 'seeking advice', 'expressing frustration', 'querying data', 'budget_analysis', 'investment_planning').
+    - 'summary': A concise, one-sentence summary of the text.
+    - 'keywords': A list of up to 5 most important keywords.
+    - 'entities': A list of named entities.
+
+    Text to analyze: "{text}"
+    JSON Output:
+    """
+
+
+def build_expense_extraction_prompt(text: str) -> str:
+    """Builds a prompt to extract key-value pairs for expenses from a text."""
+    return f"""
+    Extract financial expense data from the following text and return it as a JSON object.
+    The keys should be the expense categories (e.g., "rent", "groceries", "transport") and the values should be the numerical amounts.
+    If multiple amounts are found for the same category, sum them up.
+    
+    Example:
+    Text: "My rent is 15000, and I spend 8000 on groceries."
+    Output: {{ "Rent": 15000, "Groceries": 8000 }}
+
+    Text: "{text}"
+    JSON Output:
+    """
+
+
+def build_transaction_categorization_prompt(descriptions: list, categories: list) -> str:
+    """Builds a prompt to categorize a batch of bank transaction descriptions."""
+    numbered = "\n".join([f"{index}. {description}" for index, description in enumerate(descriptions, 1)])
+    return f"""
+    Categorize each bank transaction description below into exactly one of these categories: {", ".join(categories)}.
+    Return a JSON object whose keys are the description numbers and whose values are the categories.
+
+    Example Output: {{ "1": "Groceries", "2": "Transport" }}
+
+    Descriptions:
+    {numbered}
+    JSON Output:
+    """
+
+
+def build_spending_insight_prompt(income: float, expenses: dict, goals: list, currency: str) -> str:
+    """Builds a prompt for deep spending insights."""
+    expense_details = "\n".join([f"- {category.capitalize()}: {currency}{amount}" for category, amount in expenses.items()])
+    goal_details = "\n".join([f"- {goal['name']}: {currency}{goal['cost']} (Deadline: {goal['deadline_months']} months)" for goal in goals]) if goals else "No specific goals provided."
+    total_expenses = sum(expenses.values())
+    surplus = income - total_expenses
+    
+    return f"""
+    Perform a deep financial analysis based on the data below. Provide structured, actionable insights.
+
+    User Financial Profile:
+    - Monthly Income: {currency}{income}
+    - Monthly Expenses:
+    {expense_details}
+    - Future Goals:
+    {goal_details}
+    - Calculated Monthly Surplus (after expenses): {currency}{surplus}
+
+    Generate a detailed report in a clean JSON format with the following keys:
+    - "executive_summary": A concise markdown paragraph summarizing their financial health.
+    - "spending_breakdown": A markdown string categorizing expenses into Fixed vs. Variable.
+    - "needs_vs_wants": A markdown string classifying expenses into Needs vs. Wants.
+    - "red_flags": A markdown string identifying potential budgetary risks.
+    - "goal_feasibility": A markdown string analyzing if goals are on track.
+    - "recommendations": A markdown string with the top 3 actionable recommendations.
+    
+    JSON Output:
+    """
+
+
+def build_investment_prompt(current_savings: float, monthly_investment: float, years_to_goal: int, risk_tolerance: str, currency: str, projection: dict) -> str:
+    """Builds a prompt for the narrative of an investment plan whose figures are projected locally."""
+    allocation = ", ".join([f"{item['asset']} {item['percentage']}%" for item in projection["portfolio_breakdown"]])
+    simulation_part = ""
+    simulation = projection.get("monte_carlo")
+    if simulation:
+        final = simulation["bands"][-1]
+        simulation_part = f"- Simulated Range after {years_to_goal} years: {currency}{final['p10']:,.2f} (P10) to {currency}{final['p90']:,.2f} (P90), median {currency}{final['p50']:,.2f}"
+        if "success_probability" in simulation:
+            simulation_part += f"\n    - Probability of reaching the {currency}{simulation['goal_amount']:,.2f} goal: {simulation['success_probability']:.0%}"
+    return f"""
+    You are a Certified Financial Planner (CFP) AI. Based on the user's data and the projection below, write a comprehensive investment plan.
+    User's Financial Profile:
+    - Current Savings: {currency}{current_savings:,.2f}
+    - Monthly Investment: {currency}{monthly_investment:,.2f}
+    - Years to Investment Goal: {years_to_goal} years
+    - Risk Tolerance: {risk_tolerance}
+
+    Projection (already calculated; do not recalculate or invent other figures):
+    - Recommended Allocation: {allocation}
+    - Assumed Average Annual Return: {projection['annual_return']:.1%}
+    - Projected Value after {years_to_goal} years: {currency}{projection['final_value']:,.2f}
+    - Total Contributions: {currency}{projection['total_contributions']:,.2f}
+    {simulation_part}
+
+    Provide the response in a single, structured JSON format with the following keys:
+    - "summary": A markdown-formatted paragraph providing a high-level overview of the plan.
+    - "action_plan": A markdown-formatted list of 3-5 actionable steps the user should take.
+    
+    JSON Output:
+    """
+
+
+# --- Tools ---
+# Each tool takes the same inputs the app records for its history entry and
+# returns the outputs the app displays, so all three front ends share them.
+
+@traced_tool("currency")
+async def convert_currency(from_currency: CurrencyCode, to_currency: CurrencyCode, amount: float, is_historical: bool = False,
+                           lookup_date: date = None) -> dict:
+    """Converts at the live rate, adds the local trend and, if asked, a historical rate, with short AI explanations."""
+    check_currencies(from_currency, to_currency)
+    if isinstance(lookup_date, str):
+        lookup_date = date.fromisoformat(lookup_date)
+    lookup_date = lookup_date if is_historical else None
+    real_time_rate, stale = await asyncio.to_thread(get_exchange_rate, from_currency, to_currency)
+    with span("history"):
+        data = await asyncio.to_thread(build_currency_data, from_currency, to_currency, amount, real_time_rate, lookup_date)
+    data["stale"] = stale
+    data["ai_explained"] = False
+    try:
+        # The figures are computed locally; the AI only explains them
+        prompt = build_advanced_currency_prompt(from_currency, to_currency, amount, data, lookup_date)
+        explanations = await generate_structured(get_model(), prompt, "build_advanced_currency_prompt", tool="currency")
+        data["real_time"]["explanation"] = explanations.get("real_time_explanation")
+        if "historical_rate" in data:
+            data["historical_rate"]["explanation"] = explanations.get("historical_explanation")
+        data["ai_explained"] = True
+    except (StructuredOutputError, LLMUnavailableError):
+        pass # The figures stand on their own
+
+    data["real_time"]["explanation"] = data["real_time"].get("explanation") or f"Converted at the live rate of {real_time_rate:.4f}."
+    if "historical_rate" in data:
+        data["historical_rate"]["explanation"] = data["historical_rate"].get("explanation") or f"Converted at the rate on {data['historical_rate']['date']}."
+    return data
+
+
+@traced_tool("currency_matrix")
+async def convert_to_many(from_currency: CurrencyCode, amount: float, currencies: list[CurrencyCode] = None) -> dict:
+    """Converts one amount into many currencies and builds their cross-rate matrix; one rate fetch and no LLM call."""
+    check_currencies(from_currency, *(currencies or ()))
+    snapshot, stale = await asyncio.to_thread(get_rate_snapshot)
+    with span("matrix"):
+        data = build_currency_matrix(snapshot, from_currency, amount, currencies or MATRIX_CURRENCIES)
+    data["stale"] = stale
+    return data
+
+
+@traced_tool("budget")
+async def analyze_budget(income: float, expenses: dict[str, float], currency: str = "₹") -> dict:
+    """AI summary and top categories for a monthly budget."""
+    prompt = build_budget_summary_prompt(income, expenses, currency)
+    return await generate_structured(get_model(), prompt, "build_budget_summary_prompt", tool="budget")
+
+
+@traced_tool("nlu")
+async def analyze_text(text_input: str) -> dict:
+    """Sentiment, emotion, intent, summary, keywords and entities for a piece of text."""
+    return await generate_structured(get_model(), build_nlu_prompt(text_input), "build_nlu_prompt", tool="nlu")
+
+
+class Goal(typing.TypedDict):
+    name: str
+    cost: float
+    deadline_months: int
+
+
+@traced_tool("insights")
+async def spending_insights(income: float, expenses: dict[str, float], goals: list[Goal] = None, currency: str = "₹") -> dict:
+    """Deep spending report against the user's goals."""
+    prompt = build_spending_insight_prompt(income, expenses, goals or [], currency)
+    return await generate_structured(get_model(), prompt, "build_spending_insight_prompt", tool="insights")
+
+
+@traced_tool("investment")
+async def plan_investment(current_savings: float, monthly_investment: float, years_to_goal: int, risk_tolerance: str = "Medium",
+                          currency: str = "₹", run_simulation: bool = False, goal_amount: float = None) -> dict:
+    """Local projection (and optional Monte Carlo simulation) plus an AI-written summary and action plan."""
+    from projections import project_growth, simulate_outcomes  # NumPy is only needed by this tool.
+
+    with span("projection"):
+        projection = project_growth(current_savings, monthly_investment, years_to_goal, risk_tolerance)
+    if run_simulation:
+        with span("simulation"):
+            projection["monte_carlo"] = await asyncio.to_thread(simulate_outcomes, current_savings, monthly_investment, years_to_goal, risk_tolerance, goal_amount)
+    prompt = build_investment_prompt(current_savings, monthly_investment, years_to_goal, risk_tolerance, currency, projection)
+    narrative = await generate_structured(get_model(), prompt, "build_investment_prompt", tool="investment")
+    return {**projection, **narrative}
+
+
+@traced_tool("chat")
+async def chat_reply(message: str, context: dict = None) -> str:
+    """LefiBot's answer to one chat message, given bounded conversation context."""
+    response = await generate_content(get_model(), build_chatbot_prompt(message, context), tool="chat")
+    return response.text
+
+
+TOOLS = {
+    "currency": convert_currency,
+    "currency_matrix": convert_to_many,
+    "budget": analyze_budget,
+    "nlu": analyze_text,
+    "insights": spending_insights,
+    "investment": plan_investment,
+}
+
+# History entries record the tool by its menu label.
+TOOL_TYPES = {
+    "💸 Currency Converter": "currency",
+    "📈 Budget Analyzer": "budget",
+    "🧠 NLU Analysis": "nlu",
+    "🔮 Spending Insights": "insights",
+    "✨ Investment Planner": "investment",
+}
+
+
+def bind_tool_inputs(tool: str, inputs: dict) -> inspect.BoundArguments:
+    """
+    Checks inputs against a tool's parameters and their annotations; raises KeyError
+    for unknown tools and TypeError for missing, unknown or wrongly typed inputs.
+    """
+    signature = inspect.signature(TOOLS[tool])
+    bound = signature.bind(**inputs)
+    bound.apply_defaults()
+    hints = typing.get_type_hints(TOOLS[tool])
+    for name, value in bound.arguments.items():
+        if name in hints and not (value is None and signature.parameters[name].default is None):
+            _check_input(name, value, hints[name])
+    return bound
+
+
+# JSON types accepted for each annotation; numbers may be given as ints, dates as ISO strings.
+_JSON_TYPES = {float: ((int, float), "a number"), int: ((int,), "an integer"), str: ((str,), "a string"),
+               bool: ((bool,), "true or false"), dict: ((dict,), "an object"), list: ((list,), "a list"),
+               date: ((date, str), "a YYYY-MM-DD date"), CurrencyCode: ((str,), "a currency code such as USD")}
+
+
+def _check_input(path: str, value, annotation):
+    if typing.is_typeddict(annotation):
+        _check_input(path, value, dict)
+        for key, expected in typing.get_type_hints(annotation).items():
+            if key not in value:
+                raise TypeError(f"'{path}' is missing '{key}'")
+            _check_input(f"{path}.{key}", value[key], expected)
+        return
+    origin, args = typing.get_origin(annotation) or annotation, typing.get_args(annotation)
+    accepted, description = _JSON_TYPES.get(origin, ((object,), ""))
+    valid = isinstance(value, accepted) and (origin is bool or not isinstance(value, bool))
+    if valid and origin is CurrencyCode:
+        valid = value in CURRENCIES
+    if valid and origin is date and isinstance(value, str):
+        try:
+            date.fromisoformat(value)
+        except ValueError:
+            valid = False
+    if not valid:
+        raise TypeError(f"'{path}' must be {description}, not {value!r:.40}")
+    if origin is list and args:
+        for position, item in enumerate(value):
+            _check_input(f"{path}[{position}]", item, args[0])
+    elif origin is dict and args:
+        for key, item in value.items():
+            _check_input(f"{path}.{key}", item, args[1])
+
+
+def json_default(value):
+    """json.dumps `default` for tool outputs, which may hold dates and NumPy scalars."""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()  # NumPy scalars
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,388 @@
+"""
+Persistent store for chat conversations and tool results.
+
+Sessions and messages live in SQLite, so history survives restarts and isn't
+held in `st.session_state`. Only a window of each conversation's most recent
+messages is kept in memory, inside an LRU of recently used sessions; older
+messages are paged in from disk on request. Resident memory per session is
+therefore bounded by the window, however long the conversation gets.
+
+Several processes (e.g. API workers) may share one database: message numbers
+are assigned inside the insert's transaction, and get_chat(refresh=True) brings
+a cached conversation up to date with what other processes have written.
+
+Small per-user preferences (such as categorization rules) are kept alongside
+the history with get_setting/set_setting.
+
+Listeners registered with `add_listener` (such as the history search index) are
+told about every added, changed or deleted session and every new message.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import date, datetime
+
+DEFAULT_DB_PATH = os.getenv("SESSION_DB", "sessions.db")
+# Most recent messages kept in memory per conversation.
+DEFAULT_WINDOW = int(os.getenv("SESSION_WINDOW", "50"))
+# Sessions kept in memory across all users before the least recently used is evicted.
+DEFAULT_CACHE_SESSIONS = int(os.getenv("SESSION_CACHE_SIZE", "256"))
+
+KIND_CHAT = "chat"
+KIND_TOOL = "tool"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    title TEXT NOT NULL,
+    tool_type TEXT,
+    data TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_user ON sessions (user_id, kind, updated);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    meta TEXT,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS user_settings (
+    user_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (user_id, key)
+) WITHOUT ROWID;
+"""
+
+
+def _encode(value):
+    if isinstance(value, (date, datetime)):
+        return {"__date__": value.isoformat(), "datetime": isinstance(value, datetime)}
+    if hasattr(value, "item"):
+        return value.item()  # NumPy scalars
+    raise TypeError(f"Cannot store {type(value).__name__}")
+
+
+def _decode(obj: dict):
+    if "__date__" in obj:
+        return datetime.fromisoformat(obj["__date__"]) if obj.get("datetime") else date.fromisoformat(obj["__date__"])
+    return obj
+
+
+def dumps(value) -> str:
+    return json.dumps(value, default=_encode, separators=(",", ":"))
+
+
+def loads(text: str):
+    return json.loads(text, object_hook=_decode) if text else None
+
+
+def document_strings(value) -> list:
+    """Every string inside a tool's inputs/outputs, the searchable text of a tool result."""
+    strings = []
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            strings.append(item)
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return strings
+
+
+def new_session_id(kind: str) -> str:
+    return f"{kind}_{uuid.uuid4().hex}"
+
+
+def new_user_id() -> str:
+    return uuid.uuid4().hex
+
+
+class ChatSession:
+    """A conversation's title plus a bounded window of its most recent messages."""
+
+    def __init__(self, session_id: str, title: str, messages: list, total: int, window: int, data: dict = None):
+        self.id = session_id
+        self.title = title
+        self.messages = deque(messages, maxlen=window)
+        self.total = total
+        self.data = data or {}
+
+    @property
+    def first_loaded_seq(self) -> int:
+        return self.messages[0]["seq"] if self.messages else self.total
+
+    @property
+    def has_earlier(self) -> bool:
+        return self.first_loaded_seq > 0
+
+
+def _message(row) -> dict:
+    seq, role, content, meta = row
+    message = {"seq": seq, "role": role, "content": content}
+    if meta:
+        message.update(loads(meta))
+    return message
+
+
+class SessionStore:
+    """SQLite-backed chat and tool history with an in-memory LRU of recent sessions."""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, window: int = DEFAULT_WINDOW, cache_sessions: int = DEFAULT_CACHE_SESSIONS):
+        self.path = path
+        self.window = window
+        self.cache_sessions = cache_sessions
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()
+        self._listeners = []
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _cache_put(self, session_id: str, value):
+        self._cache[session_id] = value
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_sessions:
+            self._cache.popitem(last=False)
+
+    def _cache_get(self, session_id: str):
+        value = self._cache.get(session_id)
+        if value is not None:
+            self._cache.move_to_end(session_id)
+        return value
+
+    def add_listener(self, listener):
+        """
+        Registers an object with session_added(user_id, session, texts),
+        message_added(session_id, content, updated), session_renamed(session_id,
+        title) and session_deleted(session_id). They are called with the store's
+        lock held, so they must not call back into the store.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def _notify(self, event: str, *args):
+        for listener in self._listeners:
+            getattr(listener, event)(*args)
+
+    # --- Listing ---
+
+    def list_sessions(self, user_id: str, kind: str, limit: int = 20, offset: int = 0) -> list:
+        """Newest-first [{'id', 'title', 'tool_type', 'updated'}] for one user."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title, tool_type, updated FROM sessions WHERE user_id = ? AND kind = ? "
+                "ORDER BY updated DESC LIMIT ? OFFSET ?", (user_id, kind, limit, offset)).fetchall()
+        return [{"id": row[0], "title": row[1], "tool_type": row[2], "updated": row[3]} for row in rows]
+
+    def count_sessions(self, user_id: str, kind: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions WHERE user_id = ? AND kind = ?", (user_id, kind)).fetchone()[0]
+
+    def user_history(self, user_id: str) -> tuple:
+        """
+        Everything searchable for one user: ([{'id', 'kind', 'title', 'tool_type',
+        'updated', 'data'}], [(session_id, message content)]).
+        """
+        with self._lock:
+            sessions = self._conn.execute(
+                "SELECT id, kind, title, tool_type, updated, data FROM sessions WHERE user_id = ?", (user_id,)).fetchall()
+            messages = self._conn.execute(
+                "SELECT m.session_id, m.content FROM messages m JOIN sessions s ON s.id = m.session_id WHERE s.user_id = ?",
+                (user_id,)).fetchall()
+        return [{"id": row[0], "kind": row[1], "title": row[2], "tool_type": row[3], "updated": row[4], "data": loads(row[5])}
+                for row in sessions], messages
+
+    def delete_session(self, session_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._cache.pop(session_id, None)
+            self._notify("session_deleted", session_id)
+
+    def clear(self, user_id: str, kind: str):
+        """Deletes every session of one kind for a user."""
+        with self._lock, self._conn:
+            ids = [row[0] for row in self._conn.execute("SELECT id FROM sessions WHERE user_id = ? AND kind = ?", (user_id, kind))]
+            self._conn.executemany("DELETE FROM messages WHERE session_id = ?", [(session_id,) for session_id in ids])
+            self._conn.execute("DELETE FROM sessions WHERE user_id = ? AND kind = ?", (user_id, kind))
+            for session_id in ids:
+                self._cache.pop(session_id, None)
+                self._notify("session_deleted", session_id)
+
+    # --- Chats ---
+
+    def create_chat(self, user_id: str, title: str = "New Chat", greeting: str = None) -> ChatSession:
+        session_id = new_session_id(KIND_CHAT)
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute("INSERT INTO sessions (id, user_id, kind, title, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                                   (session_id, user_id, KIND_CHAT, title, now, now))
+            session = ChatSession(session_id, title, [], 0, self.window)
+            self._cache_put(session_id, session)
+            self._notify("session_added", user_id, {"id": session_id, "kind": KIND_CHAT, "title": title, "tool_type": None, "updated": now}, [])
+            if greeting:
+                self.append_message(session_id, "assistant", greeting)
+            return session
+
+    def get_chat(self, session_id: str, refresh: bool = False) -> ChatSession | None:
+        """
+        The conversation with its most recent window of messages, or None if there is
+        no chat with that id. With refresh, a cached conversation first picks up
+        messages, title and data written by other processes.
+        """
+        with self._lock:
+            session = self._cache_get(session_id)
+            if session is not None:
+                if not isinstance(session, ChatSession):
+                    return None  # A tool result's id.
+                return self._refresh(session) if refresh else session
+            row = self._conn.execute("SELECT title, data FROM sessions WHERE id = ? AND kind = ?", (session_id, KIND_CHAT)).fetchone()
+            if row is None:
+                return None
+            total = self._conn.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT seq, role, content, meta FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq",
+                (session_id, max(total - self.window, 0))).fetchall()
+            session = ChatSession(session_id, row[0], [_message(r) for r in rows], total, self.window, loads(row[1]))
+            self._cache_put(session_id, session)
+            return session
+
+    def _refresh(self, session: ChatSession) -> ChatSession:
+        row = self._conn.execute("SELECT title, data FROM sessions WHERE id = ?", (session.id,)).fetchone()
+        if row is None:
+            self._cache.pop(session.id, None)
+            return None
+        session.title, session.data = row[0], loads(row[1]) or {}
+        rows = self._conn.execute("SELECT seq, role, content, meta FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq",
+                                  (session.id, session.total)).fetchall()
+        session.messages.extend(_message(r) for r in rows)
+        session.total += len(rows)
+        return session
+
+    def load_earlier(self, session_id: str, before_seq: int, limit: int = DEFAULT_WINDOW) -> list:
+        """Up to `limit` messages immediately before `before_seq`, oldest first. Not cached."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content, meta FROM messages WHERE session_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (session_id, before_seq, limit)).fetchall()
+        return [_message(row) for row in reversed(rows)]
+
+    def load_range(self, session_id: str, start_seq: int, end_seq: int) -> list:
+        """Messages with start_seq <= seq < end_seq, oldest first. Not cached."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content, meta FROM messages WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (session_id, start_seq, end_seq)).fetchall()
+        return [_message(row) for row in rows]
+
+    def append_message(self, session_id: str, role: str, content: str, **meta) -> dict:
+        """Persists a message (extra keyword fields such as latency go in `meta`) and adds it to the window."""
+        with self._lock:
+            session = self.get_chat(session_id)
+            if session is None:
+                raise KeyError(session_id)
+            now = time.time()
+            with self._conn:
+                # Numbered in the same write transaction, so appends from other processes can't collide.
+                self._conn.execute(
+                    "INSERT INTO messages (session_id, seq, role, content, meta) "
+                    "SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ?, ? FROM messages WHERE session_id = ?",
+                    (session_id, role, content, dumps(meta) if meta else None, session_id))
+                seq = self._conn.execute("SELECT MAX(seq) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+                self._conn.execute("UPDATE sessions SET updated = ? WHERE id = ?", (now, session_id))
+            message = {"seq": seq, "role": role, "content": content, **meta}
+            if seq != session.total:
+                self._refresh(session)  # Another process appended first; load its messages and ours in order.
+            else:
+                session.messages.append(message)
+                session.total += 1
+            self._notify("message_added", session_id, content, now)
+            return message
+
+    def rename(self, session_id: str, title: str):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE sessions SET title = ? WHERE id = ?", (title, session_id))
+            session = self._cache.get(session_id)
+            if session is not None:
+                session.title = title
+            self._notify("session_renamed", session_id, title)
+
+    def update_data(self, session_id: str, **values):
+        """Merges values into a session's JSON `data` (e.g. a chat's running summary)."""
+        with self._lock, self._conn:
+            session = self.get_chat(session_id)
+            if session is None:
+                raise KeyError(session_id)
+            session.data.update(values)
+            self._conn.execute("UPDATE sessions SET data = ? WHERE id = ?", (dumps(session.data), session_id))
+
+    # --- Tool results ---
+
+    def save_tool(self, user_id: str, title: str, tool_type: str, inputs: dict, outputs) -> str:
+        session_id = new_session_id(KIND_TOOL)
+        now = time.time()
+        record = {"title": title, "tool_type": tool_type, "inputs": inputs, "outputs": outputs}
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO sessions (id, user_id, kind, title, tool_type, data, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (session_id, user_id, KIND_TOOL, title, tool_type, dumps({"inputs": inputs, "outputs": outputs}), now, now))
+            self._cache_put(session_id, record)
+            self._notify("session_added", user_id, {"id": session_id, "kind": KIND_TOOL, "title": title, "tool_type": tool_type, "updated": now},
+                         [tool_type] + document_strings({"inputs": inputs, "outputs": outputs}))
+        return session_id
+
+    def get_tool(self, session_id: str) -> dict | None:
+        """{'title', 'tool_type', 'inputs', 'outputs'} for a saved tool result, or None."""
+        with self._lock:
+            record = self._cache_get(session_id)
+            if record is not None:
+                return None if isinstance(record, ChatSession) else record
+            row = self._conn.execute("SELECT title, tool_type, data FROM sessions WHERE id = ? AND kind = ?", (session_id, KIND_TOOL)).fetchone()
+            if row is None:
+                return None
+            record = {"title": row[0], "tool_type": row[1], **loads(row[2])}
+            self._cache_put(session_id, record)
+            return record
+
+    # --- User settings ---
+
+    def get_setting(self, user_id: str, key: str, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM user_settings WHERE user_id = ? AND key = ?", (user_id, key)).fetchone()
+        return default if row is None else loads(row[0])
+
+    def set_setting(self, user_id: str, key: str, value):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO user_settings (user_id, key, value) VALUES (?, ?, ?)", (user_id, key, dumps(value)))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Returns the process-wide session store, opening SESSION_DB on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+        return _store
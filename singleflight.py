@@ -0,0 +1,87 @@
+"""
+Request coalescing ("single flight") for upstream calls shared across sessions.
+
+While a call for a key is in flight, identical calls wait for it and receive
+its result (or its exception) instead of reaching the upstream themselves. A
+burst of sessions asking for the same FAQ answer or refreshing the same rate
+table therefore costs one Gemini or rate-API call. Nothing is kept once a call
+finishes; reuse after that is the caches' job.
+
+Every call is counted in SINGLEFLIGHT_CALLS as a leader (it made the upstream
+call) or a follower (it shared one), so followers / (leaders + followers) is the
+coalescing ratio of each group.
+"""
+import asyncio
+import threading
+
+from metrics import SINGLEFLIGHT_CALLS, increment
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces blocking calls made from any thread."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """Runs function() unless a call for key is already in flight, in which case waits for that one's outcome."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        increment(SINGLEFLIGHT_CALLS, group=self.name, role="leader" if leader else "follower")
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces coroutines on one event loop (the shared LLM client's). The call
+    runs as its own task, so a caller that is cancelled, e.g. a session that
+    moved on, doesn't cancel it for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks = {}
+
+    def _finished(self, key, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here so a call nobody awaits any more isn't logged as unhandled.
+
+    async def do(self, key, coroutine_function):
+        """Awaits coroutine_function() unless a call for key is already in flight, in which case awaits that one."""
+        task = self._tasks.get(key)
+        leader = task is None
+        if leader:
+            task = self._tasks[key] = asyncio.ensure_future(coroutine_function())
+            task.add_done_callback(lambda done: self._finished(key, done))
+        increment(SINGLEFLIGHT_CALLS, group=self.name, role="leader" if leader else "follower")
+        return await asyncio.shield(task)
@@ -0,0 +1,323 @@
+"""
+Streaming bank-statement import for the Budget Analyzer.
+
+CSV and OFX/QFX exports are parsed incrementally from a file path or binary
+stream, a chunk of transactions at a time, and folded into running totals, so
+memory stays flat no matter how large the export is. The result is the
+per-category monthly `expenses` dict the budget prompt builders expect.
+"""
+import codecs
+import csv
+import io
+import os
+import re
+from collections import Counter, namedtuple
+from datetime import datetime
+
+DEFAULT_CHUNK_ROWS = 10_000
+OFX_READ_BYTES = 1 << 16
+UNCATEGORIZED = "Uncategorized"
+
+Transaction = namedtuple("Transaction", ["month", "description", "amount", "category"])
+
+_DATE_COLUMNS = ("date", "transaction date", "posted date", "posting date", "booking date", "value date")
+_DESCRIPTION_COLUMNS = ("description", "narration", "details", "merchant", "payee", "name", "memo", "particulars")
+_AMOUNT_COLUMNS = ("amount", "transaction amount", "amt")
+_DEBIT_COLUMNS = ("debit", "withdrawal", "withdrawals", "debit amount", "money out", "paid out")
+_CREDIT_COLUMNS = ("credit", "deposit", "deposits", "credit amount", "money in", "paid in")
+_CATEGORY_COLUMNS = ("category", "categories", "type of spend")
+_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%d-%m-%Y", "%m-%d-%Y", "%Y/%m/%d", "%d.%m.%Y", "%d %b %Y", "%b %d, %Y",
+                 "%d-%b-%Y", "%Y%m%d", "%d/%m/%y", "%m/%d/%y", "%d-%m-%y", "%m-%d-%y", "%d.%m.%y", "%d %b %y", "%d-%b-%y")
+_MONTH_FIRST_FORMATS = ("%m/%d/%Y", "%m-%d-%Y", "%m/%d/%y", "%m-%d-%y")
+_DAY_FIRST_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y", "%d-%m-%y")
+# A time of day after the date ("2024-01-05T10:00:00Z", "05/01/2024 10:00 AM") is ignored.
+_TIME_SUFFIX_RE = re.compile(r"(?:T|\s+)\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?\s*(?:[AaPp][Mm])?\s*(?:Z|[+-]\d{2}:?\d{2})?$")
+# Date orders for statements whose dates never show a day above 12.
+DATE_ORDER_AUTO = "auto"
+DATE_ORDER_DAY_FIRST = "day_first"
+DATE_ORDER_MONTH_FIRST = "month_first"
+# Rows held back while their dates are still ambiguous; after that the file is read day first.
+DATE_SNIFF_ROWS = 10_000
+_AMOUNT_CLEAN_RE = re.compile(r"[^\d.\-]")
+
+
+class StatementFormatError(ValueError):
+    """Raised when a statement's layout can't be recognised."""
+
+
+class _MonthParser:
+    """
+    Maps raw date strings to 'YYYY-MM' with a single format per file. observe()
+    narrows the formats consistent with every date seen so far, so 01/05/2024 is
+    undecided until a date such as 01/31/2024 settles month-first; settle() picks
+    the preferred remaining format (day first unless the order says otherwise).
+    """
+
+    def __init__(self, date_order: str = DATE_ORDER_AUTO):
+        excluded = {DATE_ORDER_DAY_FIRST: _MONTH_FIRST_FORMATS, DATE_ORDER_MONTH_FIRST: _DAY_FIRST_FORMATS}.get(date_order, ())
+        self._formats = tuple(fmt for fmt in _DATE_FORMATS if fmt not in excluded)
+        self._candidates = None
+        self.format = None
+        self._cache = {}
+
+    def observe(self, raw: str) -> bool:
+        """Narrows the candidate formats with one date; True once the format is settled."""
+        if self.format:
+            return True
+        text = _date_text(raw)
+        matching = {fmt for fmt in self._formats if _parses(text, fmt)}
+        if not matching:
+            return False
+        if self._candidates is None or not self._candidates & matching:
+            self._candidates = matching
+        else:
+            self._candidates &= matching
+        if len(self._candidates) == 1:
+            self.settle()
+        return self.format is not None
+
+    def settle(self):
+        """Fixes the format: the only candidate left, else the first in preference order."""
+        if not self.format:
+            self.format = next((fmt for fmt in self._formats if fmt in (self._candidates or ())), self._formats[0])
+
+    def __call__(self, raw: str) -> str | None:
+        month = self._cache.get(raw)
+        if month is not None or raw in self._cache:
+            return month
+        if not self.format:
+            self.observe(raw)
+            self.settle()
+        try:
+            month = datetime.strptime(_date_text(raw), self.format).strftime("%Y-%m")
+        except ValueError:
+            month = None  # Never re-read a row in another format than the rest of the file.
+        if len(self._cache) < 100_000:
+            self._cache[raw] = month
+        return month
+
+
+def _date_text(raw: str) -> str:
+    return _TIME_SUFFIX_RE.sub("", raw.strip())
+
+
+def _parses(text: str, fmt: str) -> bool:
+    try:
+        datetime.strptime(text, fmt)
+    except ValueError:
+        return False
+    return True
+
+
+def _resolve_months(records, to_month: _MonthParser, chunk_rows: int):
+    """
+    Turns (raw date, description, amount, category) records into chunks of
+    Transactions. Records are held back while the date format is still ambiguous,
+    at most DATE_SNIFF_ROWS of them, so every row of a file is read the same way.
+    """
+    pending = []
+    chunk = []
+    for record in records:
+        settled = to_month.observe(record[0])
+        if settled and not pending:
+            chunk.append(Transaction(to_month(record[0]), *record[1:]))
+        else:
+            pending.append(record)
+            if settled or len(pending) >= DATE_SNIFF_ROWS:
+                chunk.extend(Transaction(to_month(raw), *rest) for raw, *rest in pending)
+                pending = []
+        while len(chunk) >= chunk_rows:
+            yield chunk[:chunk_rows]
+            chunk = chunk[chunk_rows:]
+    chunk.extend(Transaction(to_month(raw), *rest) for raw, *rest in pending)
+    if chunk:
+        yield chunk
+
+
+def parse_amount(raw: str) -> float | None:
+    """Parses bank-formatted amounts such as '1,234.50', '(45.00)', '₹ 900 DR' or '-12'."""
+    if raw is None:
+        return None
+    text = raw.strip()
+    if not text:
+        return None
+    negative = (text.startswith("(") and text.endswith(")")) or text.upper().endswith("DR")
+    cleaned = _AMOUNT_CLEAN_RE.sub("", text)
+    if cleaned in ("", "-", ".", "-."):
+        return None
+    value = float(cleaned)
+    return -abs(value) if negative else value
+
+
+def _find_column(header: list, candidates: tuple, exclude: tuple = ()) -> int | None:
+    """Index of the first exact header match, else of a header containing a candidate (e.g. 'txn date')."""
+    for name in candidates:
+        if name in header:
+            return header.index(name)
+    for index, column in enumerate(header):
+        if index not in exclude and any(name in column for name in candidates):
+            return index
+    return None
+
+
+def _open_text(file):
+    """Returns (text stream, cleanup) for a path, text stream or binary stream such as an upload."""
+    if isinstance(file, (str, os.PathLike)):
+        stream = open(file, encoding="utf-8-sig", newline="", errors="replace")
+        return stream, stream.close
+    if isinstance(file, io.TextIOBase):
+        return file, lambda: None
+    stream = io.TextIOWrapper(file, encoding="utf-8-sig", newline="", errors="replace")
+    return stream, stream.detach  # Leave the caller's binary stream open.
+
+
+def iter_csv_transactions(file, chunk_rows: int = DEFAULT_CHUNK_ROWS, date_order: str = DATE_ORDER_AUTO):
+    """
+    Yields lists of up to chunk_rows Transactions from a CSV statement. Spending is
+    negative: either a signed amount column, or debit/credit columns.
+    """
+    stream, cleanup = _open_text(file)
+    try:
+        yield from _resolve_months(_csv_records(stream), _MonthParser(date_order), chunk_rows)
+    finally:
+        cleanup()
+
+
+def _csv_records(stream):
+    """(raw date, description, amount, category) for each usable CSV row."""
+    reader = csv.reader(stream)
+    header = [column.strip().lower() for column in next(reader, [])]
+    date_col = _find_column(header, _DATE_COLUMNS)
+    description_col = _find_column(header, _DESCRIPTION_COLUMNS)
+    debit_col = _find_column(header, _DEBIT_COLUMNS)
+    credit_col = _find_column(header, _CREDIT_COLUMNS)
+    amount_col = _find_column(header, _AMOUNT_COLUMNS, exclude=(debit_col, credit_col))
+    category_col = _find_column(header, _CATEGORY_COLUMNS)
+    if date_col is None or (amount_col is None and debit_col is None):
+        raise StatementFormatError("The CSV needs a date column and either an amount or a debit column.")
+
+    for row in reader:
+        if len(row) <= date_col:
+            continue
+        try:
+            if amount_col is not None:
+                amount = parse_amount(row[amount_col])
+            else:
+                debit = parse_amount(row[debit_col]) if debit_col < len(row) else None
+                credit = parse_amount(row[credit_col]) if credit_col is not None and credit_col < len(row) else None
+                amount = -abs(debit) if debit else credit
+        except (ValueError, IndexError):
+            continue
+        if amount is None:
+            continue
+        description = row[description_col].strip() if description_col is not None and description_col < len(row) else ""
+        category = row[category_col].strip() or None if category_col is not None and category_col < len(row) else None
+        yield row[date_col], description, amount, category
+
+
+_OFX_BLOCK_RE = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.IGNORECASE | re.DOTALL)
+_OFX_FIELD_RE = re.compile(r"<(DTPOSTED|TRNAMT|NAME|MEMO|PAYEE)>([^<\r\n]*)", re.IGNORECASE)
+
+
+def iter_ofx_transactions(file, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+    """Yields lists of Transactions from an OFX/QFX statement, reading it in fixed-size blocks (dates are YYYYMMDD)."""
+    handle = open(file, "rb") if isinstance(file, (str, os.PathLike)) else file
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    to_month = _MonthParser()
+    buffer = ""
+    chunk = []
+    try:
+        while True:
+            block = handle.read(OFX_READ_BYTES)
+            buffer += decoder.decode(block or b"", final=not block)
+            consumed = 0
+            for match in _OFX_BLOCK_RE.finditer(buffer):
+                consumed = match.end()
+                fields = {name.upper(): value.strip() for name, value in _OFX_FIELD_RE.findall(match.group(1))}
+                try:
+                    amount = parse_amount(fields.get("TRNAMT"))
+                except ValueError:
+                    continue
+                if amount is None or "DTPOSTED" not in fields:
+                    continue
+                description = fields.get("NAME") or fields.get("PAYEE") or fields.get("MEMO", "")
+                chunk.append(Transaction(to_month(fields["DTPOSTED"][:8]), description, amount, None))
+                if len(chunk) >= chunk_rows:
+                    yield chunk
+                    chunk = []
+            # Keep only the unfinished tail so the buffer never grows beyond one transaction.
+            buffer = buffer[consumed:] if consumed else buffer[-OFX_READ_BYTES:]
+            if not block:
+                break
+        if chunk:
+            yield chunk
+    finally:
+        if handle is not file:
+            handle.close()
+
+
+class StatementSummary:
+    """Running totals over imported transactions."""
+
+    def __init__(self):
+        self.rows = 0
+        self.undated = 0
+        self.spending = Counter()
+        self.income = 0.0
+        self.months = set()
+
+    def add(self, transactions: list, categories: list):
+        for transaction, category in zip(transactions, categories):
+            self.rows += 1
+            if transaction.month:
+                self.months.add(transaction.month)
+            else:
+                self.undated += 1
+            if transaction.amount < 0:
+                self.spending[category or UNCATEGORIZED] += -transaction.amount
+            else:
+                self.income += transaction.amount
+
+    @property
+    def month_count(self) -> int:
+        return max(len(self.months), 1)
+
+    def monthly_expenses(self) -> dict:
+        """Average monthly spending per category, largest first."""
+        return {category: round(total / self.month_count, 2) for category, total in self.spending.most_common()}
+
+    def monthly_income(self) -> float:
+        return round(self.income / self.month_count, 2)
+
+
+def summarize_statement(file, filename: str, categorize_batch=None, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                        date_order: str = DATE_ORDER_AUTO) -> StatementSummary:
+    """
+    Streams a CSV or OFX/QFX statement into a StatementSummary. categorize_batch,
+    if given, maps a list of descriptions to a list of categories for spending
+    rows that have no category of their own. date_order decides CSV dates such as
+    03/04/2024 when no day above 12 in the file settles it.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in (".ofx", ".qfx"):
+        chunks = iter_ofx_transactions(file, chunk_rows)
+    elif extension in (".csv", ".txt"):
+        chunks = iter_csv_transactions(file, chunk_rows, date_order)
+    else:
+        raise StatementFormatError(f"Unsupported statement type '{extension}'. Use CSV or OFX.")
+
+    summary = StatementSummary()
+    for chunk in chunks:
+        if not summary.months and not any(transaction.month for transaction in chunk):
+            # The date format is settled by the first chunk, so later rows wouldn't parse either,
+            # and without months the totals can't be turned into monthly amounts.
+            raise StatementFormatError("None of the statement's dates could be read. "
+                                       "Dates such as 2024-01-31, 31/01/2024, 01/31/24 or 31 Jan 2024 are supported.")
+        categories = [transaction.category for transaction in chunk]
+        if categorize_batch:
+            missing = [index for index, transaction in enumerate(chunk) if not transaction.category and transaction.amount < 0]
+            if missing:
+                for index, category in zip(missing, categorize_batch([chunk[index].description for index in missing])):
+                    categories[index] = category
+        summary.add(chunk, categories)
+    return summary
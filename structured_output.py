@@ -0,0 +1,283 @@
+"""
+Shared structured-output handling for every JSON-producing prompt builder.
+
+Model text is scanned once for the outermost balanced JSON value (fenced or
+not), small defects are repaired locally (comments, trailing commas, smart
+quotes, Python literals, truncated endings) and the result is validated and
+coerced against the builder's schema, so a slightly malformed answer doesn't
+cost a whole regeneration. Parse outcomes are counted per prompt builder in
+metrics.STRUCTURED_PARSES.
+"""
+import json
+import re
+
+from metrics import STRUCTURED_PARSES, increment
+
+# Generation config asking Gemini for a bare JSON document.
+JSON_MODE = {"response_mime_type": "application/json"}
+
+
+class StructuredOutputError(ValueError):
+    """Raised when model output can't be turned into data matching its schema."""
+
+    def __init__(self, message: str, text: str = ""):
+        super().__init__(message)
+        self.text = text
+
+
+# --- Schemas ---
+# A schema maps each key to (type, required). Types are str, float, int, a
+# one-element list for "list of", or a nested schema dict. The special key
+# `str` describes free-form mappings such as extracted expense categories.
+
+SCHEMAS = {
+    "build_advanced_currency_prompt": {
+        "real_time_explanation": (str, False),
+        "historical_explanation": (str, False),
+    },
+    "build_budget_summary_prompt": {
+        "summary_text": (str, True),
+        "top_categories": ([str], False),
+    },
+    "build_nlu_prompt": {
+        "sentiment": (str, False),
+        "sentiment_score": (float, False),
+        "emotion": (str, False),
+        "intent": (str, False),
+        "summary": (str, False),
+        "keywords": ([str], False),
+        "entities": ([str], False),
+    },
+    "build_expense_extraction_prompt": {
+        str: (float, False),
+    },
+    "build_transaction_categorization_prompt": {
+        str: (str, False),
+    },
+    "build_spending_insight_prompt": {
+        "executive_summary": (str, True),
+        "spending_breakdown": (str, False),
+        "needs_vs_wants": (str, False),
+        "red_flags": (str, False),
+        "goal_feasibility": (str, False),
+        "recommendations": (str, False),
+    },
+    "build_investment_prompt": {
+        "summary": (str, True),
+        "action_plan": (str, False),
+    },
+}
+
+# --- Extraction & repair ---
+
+_OPENERS = {"{": "}", "[": "]"}
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_LITERALS = {"True": "true", "False": "false", "None": "null", "NaN": "null"}
+_WORD_RE = re.compile(r"[A-Za-z_]+")
+_KEY_COLON_RE = re.compile(r"\s*:")
+# A whole string that is one number, optionally after a currency symbol or code:
+# "1,200.50", "1,20,000", "$ 40", "INR 5000", "-3e2". Unit suffixes ("1.5k", "500 per week")
+# would change the value, so they fail validation instead of being stripped.
+_NUMBER_RE = re.compile(r"(?:[₹$€£]|[A-Za-z]{3})?\s?([-+]?(?:(?:\d{1,3}(?:,\d{2,3})+|\d+)(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?)")
+
+
+def extract_json_text(text: str) -> str:
+    """
+    Returns the outermost balanced JSON object (or array) in `text`, scanning once
+    and ignoring braces inside strings. An unterminated value is returned as-is
+    from its opening brace so repair_json can close it.
+    """
+    start = text.find("{")
+    if start == -1:
+        start = text.find("[")
+    if start == -1:
+        raise StructuredOutputError("No JSON object found in the AI response.", text)
+
+    depth = 0
+    in_string = escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    return text[start:]
+
+
+def repair_json(text: str) -> str:
+    """
+    Fixes common small defects in one pass: // and /* */ comments, trailing commas,
+    smart quotes, single-quoted strings, Python literals, raw newlines inside
+    strings and missing closing quotes/brackets at a truncated end.
+    """
+    text = text.translate(_SMART_QUOTES)
+    out = []
+    stack = []
+    quote = None
+    escaped = False
+    index = 0
+    length = len(text)
+    while index < length:
+        char = text[index]
+        if quote:
+            if escaped:
+                escaped = False
+                out.append(char)
+            elif char == "\\":
+                escaped = True
+                out.append(char)
+            elif char == quote:
+                quote = None
+                out.append('"')
+            elif char == '"':
+                out.append('\\"')  # A double quote inside a single-quoted string.
+            elif char == "\n":
+                out.append("\\n")
+            else:
+                out.append(char)
+            index += 1
+            continue
+
+        if char in "\"'":
+            quote = char
+            out.append('"')
+        elif text.startswith("//", index):
+            newline = text.find("\n", index)
+            index = length if newline == -1 else newline
+            continue
+        elif text.startswith("/*", index):
+            end = text.find("*/", index + 2)
+            index = length if end == -1 else end + 2
+            continue
+        elif char in _OPENERS:
+            stack.append(_OPENERS[char])
+            out.append(char)
+        elif char in "}]":
+            _drop_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(char)
+        elif char.isalpha():
+            word = _WORD_RE.match(text, index).group(0)
+            index += len(word)
+            if _KEY_COLON_RE.match(text, index):
+                out.append(f'"{word}"')  # Unquoted object key.
+            else:
+                out.append(_LITERALS.get(word, word))
+            continue
+        else:
+            out.append(char)
+        index += 1
+
+    if quote:
+        out.append('"')
+    _drop_trailing_comma(out)
+    if out and "".join(out).rstrip().endswith(":"):
+        out.append("null")
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+def _drop_trailing_comma(out: list):
+    position = len(out) - 1
+    while position >= 0 and out[position].isspace():
+        position -= 1
+    if position >= 0 and out[position] == ",":
+        del out[position]
+
+
+# --- Validation ---
+
+def _coerce(value, expected, path: str, problems: list):
+    if isinstance(expected, dict):
+        if not isinstance(value, dict):
+            problems.append(f"{path} should be an object")
+            return None
+        return validate(value, expected, path, problems)
+    if isinstance(expected, list):
+        item_type = expected[0]
+        if isinstance(value, str) and item_type is str:
+            value = [part.strip() for part in value.split(",") if part.strip()]
+        if not isinstance(value, list):
+            problems.append(f"{path} should be a list")
+            return None
+        items = []
+        for position, item in enumerate(value):
+            item_problems = []
+            coerced = _coerce(item, item_type, f"{path}[{position}]", item_problems)
+            if not item_problems:
+                items.append(coerced)  # Malformed items are dropped rather than failing the list.
+        return items
+    if expected is str:
+        if isinstance(value, list):
+            return "\n".join(f"- {item}" if not str(item).lstrip().startswith(("-", "*")) else str(item) for item in value)
+        return "" if value is None else str(value)
+    if expected in (float, int):
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, str):
+            number = _NUMBER_RE.fullmatch(value.strip())
+            if not number:
+                problems.append(f"{path} should be a number")
+                return None
+            value = float(number.group(1).replace(",", ""))
+        if not isinstance(value, (int, float)):
+            problems.append(f"{path} should be a number")
+            return None
+        return expected(value)
+    return value
+
+
+def validate(data: dict, schema: dict, path: str = "$", problems: list = None) -> dict:
+    """Coerces `data` to `schema`; raises StructuredOutputError listing any problems at the top level."""
+    top_level = problems is None
+    problems = [] if top_level else problems
+    if not isinstance(data, dict):
+        raise StructuredOutputError(f"{path} should be a JSON object")
+    result = dict(data)
+    if str in schema:
+        value_type = schema[str][0]
+        result = {}
+        for key, value in data.items():
+            coerced = _coerce(value, value_type, f"{path}.{key}", problems)
+            if coerced is not None:
+                result[key] = coerced
+    else:
+        for key, (expected, required) in schema.items():
+            if key not in data or data[key] is None:
+                if required:
+                    problems.append(f"{path}.{key} is missing")
+                continue
+            result[key] = _coerce(data[key], expected, f"{path}.{key}", problems)
+    if top_level and problems:
+        raise StructuredOutputError("AI response did not match the expected format: " + "; ".join(problems))
+    return result
+
+
+def parse_structured(text: str, builder: str) -> dict:
+    """Extracts, repairs if needed, and validates the JSON answer to a prompt builder's prompt."""
+    try:
+        candidate = extract_json_text(text)
+        try:
+            data = json.loads(candidate)
+            outcome = "parsed"
+        except json.JSONDecodeError:
+            data = json.loads(repair_json(candidate))
+            outcome = "repaired"
+        data = validate(data, SCHEMAS[builder])
+    except (StructuredOutputError, json.JSONDecodeError) as e:
+        increment(STRUCTURED_PARSES, builder=builder, outcome="failed")
+        raise StructuredOutputError(str(e), text) from e
+    increment(STRUCTURED_PARSES, builder=builder, outcome=outcome)
+    return data